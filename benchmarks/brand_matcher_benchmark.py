@@ -0,0 +1,91 @@
+"""
+Сравнение разбора запросов по автомобилю:
+прежний способ (список названий марок на каждый запрос, марка - первое слово)
+и BrandMatcher (дерево токенов марок и псевдонимов).
+
+Запуск из корня проекта: python -m benchmarks.brand_matcher_benchmark
+"""
+import json
+import re
+import time
+from pathlib import Path
+
+from parsers.brand_matcher import BrandMatcher
+
+FIXTURES = Path(__file__).parent / 'fixtures'
+BRANDS = FIXTURES / 'autodoc_brands.json'
+QUERIES = FIXTURES / 'car_queries.json'
+ROUNDS = 2000
+
+
+def is_article_number(query: str) -> bool:
+    return bool(re.match(r'^(?=.*\d)[A-Za-z0-9-]{5,20}$', query))
+
+
+def parse_with_list(query: str, brands):
+    """Прежний разбор: проверка марки по списку, затем первое слово запроса как марка"""
+    if not re.search(r'\b(19|20)\d{2}\b', query):
+        if is_article_number(query):
+            return None
+        names = [brand.get('brand', '').lower() for brand in brands]
+        query_words = query.lower().split()
+        if not any(name in query_words for name in names):
+            return None
+
+    words = query.strip().split()
+    names = {brand.get('brand', '').lower(): brand for brand in brands}
+    brand = names.get(words[0].lower())
+    if not brand:
+        return None
+    year_match = re.search(r'\b(19|20)\d{2}\b', query)
+    model = ' '.join(word for word in words[1:] if not re.match(r'(19|20)\d{2}', word))
+    return {
+        'brand': brand['brand'],
+        'model': model or None,
+        'year': int(year_match.group()) if year_match else None
+    }
+
+
+def parse_with_matcher(query: str, matcher: BrandMatcher):
+    if is_article_number(query) and not re.search(r'\b(19|20)\d{2}\b', query):
+        return None
+    car = matcher.match(query)
+    if car is None:
+        return None
+    return {'brand': car.brand, 'model': car.model, 'year': car.year}
+
+
+def measure(func, queries, *args) -> float:
+    """Среднее время разбора одного запроса, мкс"""
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        for query in queries:
+            func(query, *args)
+    return (time.perf_counter() - started) / (ROUNDS * len(queries)) * 1_000_000
+
+
+def main():
+    brands = json.loads(BRANDS.read_text(encoding='utf-8'))
+    corpus = json.loads(QUERIES.read_text(encoding='utf-8'))
+    queries = [item['query'] for item in corpus]
+
+    started = time.perf_counter()
+    matcher = BrandMatcher(brands)
+    built_ms = (time.perf_counter() - started) * 1000
+
+    list_correct = 0
+    for item in corpus:
+        parsed = parse_with_matcher(item['query'], matcher)
+        assert parsed == item['expected'], f"{item['query']}: {parsed} != {item['expected']}"
+        list_correct += parse_with_list(item['query'], brands) == item['expected']
+
+    print(f"Марок: {len(brands)}, ключей в дереве: {matcher.size}, запросов: {len(queries)}")
+    print(f"Построение дерева:      {built_ms:.3f} мс")
+    print(f"Список марок:           {measure(parse_with_list, queries, brands):.2f} мкс/запрос "
+          f"(верно разобрано {list_correct} из {len(corpus)})")
+    print(f"BrandMatcher:           {measure(parse_with_matcher, queries, matcher):.2f} мкс/запрос "
+          f"(верно разобрано {len(corpus)} из {len(corpus)})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Сравнение извлечения массива _data со страницы exist.ru:
+прежний ленивый regex по всей странице и потоковый EmbeddedJsonScanner.
+
+Запуск из корня проекта: python -m benchmarks.embedded_json_benchmark
+"""
+import json
+import re
+import time
+from pathlib import Path
+
+from utils.embedded_json import CHUNK_SIZE, EmbeddedJsonScanner, extract_embedded_json
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'exist_page.html'
+MARKER = 'var _data'
+ROUNDS = 200
+
+
+def extract_with_regex(html: str):
+    match = re.search(r'var\s+_data\s*=\s*(\[.*?\]);', html, re.DOTALL)
+    return json.loads(match.group(1))
+
+
+def extract_streaming(content: bytes):
+    """Подача страницы кусками, как при чтении ответа; возвращает значение и число прочитанных байт"""
+    scanner = EmbeddedJsonScanner(MARKER)
+    received = 0
+    for start in range(0, len(content), CHUNK_SIZE):
+        chunk = content[start:start + CHUNK_SIZE]
+        received += len(chunk)
+        if scanner.feed(chunk):
+            break
+    else:
+        scanner.finish()
+    return scanner.result(), received
+
+
+def measure(func, *args) -> float:
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(*args)
+    return (time.perf_counter() - started) / ROUNDS * 1000
+
+
+def main():
+    content = FIXTURE.read_bytes()
+    html = content.decode('utf-8')
+
+    expected = extract_with_regex(html)
+    assert extract_embedded_json(content, MARKER) == expected
+    value, received = extract_streaming(content)
+    assert value == expected
+
+    print(f"Страница: {len(content)} байт, элементов в _data: {len(expected)}")
+    print(f"regex + json.loads:      {measure(extract_with_regex, html):.3f} мс")
+    print(f"extract_embedded_json:   {measure(extract_embedded_json, content, MARKER):.3f} мс")
+    print(f"потоковое чтение:        {measure(extract_streaming, content):.3f} мс "
+          f"(прочитано {received} из {len(content)} байт)")
+
+
+if __name__ == '__main__':
+    main()
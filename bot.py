@@ -1,6 +1,8 @@
 import sys
 import locale
 import json
+import asyncio
+import time
 
 # Устанавливаем кодировку для консоли
 if sys.platform == 'win32':
@@ -18,18 +20,22 @@ from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 from datetime import datetime, timedelta
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-from typing import Dict
+from typing import Any, Dict, List, Optional, Union
 
 from config import config
 from models import Base, User, Subscription
 from handlers import admin, subscription, referral
 from utils.logger import logger
 from utils.metrics import metrics
+from utils.http_client import http_client
 from database import engine, async_session_maker, DatabaseMiddleware
 from keyboards.main import get_main_keyboard, get_search_keyboard
 from parsers.autodoc_factory import AutodocParserFactory
-from parsers.search_aggregator import SearchAggregator
+from parsers.search_aggregator import SearchAggregator, STATUS_ERROR, STATUS_TIMEOUT, STATUS_UNAVAILABLE
 from parsers.autodoc_car_parser import AutodocCarParser
+from parsers.wizard_prefetcher import wizard_prefetcher
+from parsers.wizard_resolver import WizardResolver
+from utils.object_store import EXPIRED, object_store
 from utils.response_logger import response_logger
 
 class SearchStates(StatesGroup):
@@ -57,8 +63,9 @@ class TelegramBot:
         self.bot = Bot(token=config.BOT_TOKEN)
         self.storage = MemoryStorage()
         self.dp = Dispatcher(storage=self.storage)
+        self.http_client = http_client
         self.parser_factory = AutodocParserFactory()
-        self.search_aggregator = SearchAggregator()
+        self.search_aggregator = SearchAggregator(self.http_client)
         
     async def register_handlers(self):
         """Регистрация всех обработчиков"""
@@ -228,11 +235,20 @@ class TelegramBot:
             brand = parts[0].upper()  # AUDI
             model = parts[1]          # 100
             year = parts[-1]          # 1996
-            
-            parser = AutodocCarParser()
-            initial_query = f"{brand} {model} {year}"
-            
-            search_result = await parser.step_by_step_search(initial_query)
+
+            # Марка может состоять из нескольких слов (LAND ROVER) - разбираем запрос по каталогу марок
+            car_info = await self.parser_factory.extract_car_info(message.text)
+            if car_info:
+                brand = car_info[0].upper()
+                model = car_info[1]
+            
+            parser = AutodocCarParser(self.http_client)
+            brand_code = await parser.get_brand_code(brand)
+            
+            # Модель и год подбираются за один вызов: неоднозначные шаги мастера
+            # запрашиваются параллельно, уже известные берутся из кэша
+            resolver = WizardResolver(parser)
+            search_result = await resolver.resolve(brand_code, model, year) if brand_code else {}
             if not search_result:
                 await message.answer("Не удалось найти информацию по указанному автомобилю. Проверьте правильность ввода.")
                 return
@@ -246,62 +262,14 @@ class TelegramBot:
             standardized_values = response_logger.standardize_parameters(known_values)
             logger.info(f"[ПОИСК] Стандартизированные значения: {standardized_values}")
 
-            # Пробуем автозаполнить поля на первом шаге
-            current_ssd = None
+            current_ssd = search_result['ssd']
             fields = list(search_result.get('available_fields', {}).items())
-            auto_filled = False
-
-            # Проверяем каждое по��е на возможность автозаполнения
-            for field_name, field_data in fields:
-                standard_key = response_logger.get_parameter_key(field_name)
-                if standard_key in standardized_values:
-                    target_value = standardized_values[standard_key]
-                    logger.info(f"[ПОИСК] Проверяем поле {field_name} ({standard_key}) со значением {target_value}")
-                    
-                    # Для года пробуем оба варианта
-                    if field_name.lower() in ['год', 'год выпуска', 'год производсва']:
-                        # Проверям точное совпадение для обоих вариантов года
-                        for option in field_data['options']:
-                            if target_value == option['value']:
-                                current_ssd = option['key']
-                                logger.info(f"[ПОИСК] Найдено точное совпадение года: {option['value']}, ssd={current_ssd}")
-                                auto_filled = True
-                                
-                                # Пол��чаем обновл��нные данные
-                                search_result = await parser.step_by_step_search({
-                                    'brand_code': search_result.get('brand_code'),
-                                    'ssd': current_ssd
-                                })
-                                
-                                # Если есть еще поля для заполнения, продолжаем
-                                if not search_result.get('available_fields'):
-                                    break
-                                
-                                # Иначе продолжаем проверку других полей
-                                continue
-                    
-                    # Для стальны�� полей используем частичное совпадение
-                    else:
-                        for option in field_data['options']:
-                            if target_value.upper() in option['value'].upper():
-                                current_ssd = option['key']
-                                logger.info(f"[ПОИСК] Найдено совпадение: {option['value']}, ssd={current_ssd}")
-                                auto_filled = True
-                                
-                                search_result = await parser.step_by_step_search({
-                                    'brand_code': search_result.get('brand_code'),
-                                    'ssd': current_ssd
-                                })
-                                break
-                    
-                    if auto_filled:
-                        break
 
             # Если удалось что-то автозаполнить, обновляем состояние
-            if auto_filled:
-                logger.info("[ПОИСК] Выполнено автозаполнение")
+            if search_result['matched']:
+                logger.info(f"[ПОИСК] Выполнено автозаполнение: {search_result['matched']}")
                 await state.update_data(
-                    search_result=search_result,
+                    search_result=object_store.put(search_result),
                     current_ssd=current_ssd,
                     known_values=standardized_values
                 )
@@ -324,18 +292,107 @@ class TelegramBot:
                 callback_data="show_modifications"
             )])
             
+            self.prefetch_next_steps(search_result, current_ssd)
             search_message = await message.answer(
                 "Выберите поле для уточнения:",
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
             )
             
             await state.update_data(
-                search_result=search_result,
+                search_result=object_store.put(search_result),
                 current_ssd=None,
                 known_values=standardized_values,
                 message_id=search_message.message_id
             )
             await state.set_state(CarSearchStates.selecting_field)
+        else:
+            # Поиск по артикулу или VIN
+            await self.stream_search_results(message, message.text.strip())
+
+    def format_search_results(self, query: str, results: Dict[str, List[Dict]],
+                              statuses: Dict[str, str], finished: bool) -> str:
+        """Текст сообщения с результатами поиска по всем источникам"""
+        items = self.search_aggregator.sort_results_by_price(results)
+        status = "" if finished else " (поиск продолжается...)"
+        lines = [f"🔍 Результаты по запросу {query}{status}"]
+        
+        counts = ", ".join(f"{source}: {len(found)}" for source, found in results.items() if found)
+        if counts:
+            lines.append(f"Найдено: {counts}")
+        for source, source_status in statuses.items():
+            if source_status == STATUS_TIMEOUT:
+                lines.append(f"⏱ {source}: не ответил вовремя, показаны полученные результаты")
+            elif source_status == STATUS_ERROR:
+                lines.append(f"⚠️ {source}: ошибка источника")
+            elif source_status == STATUS_UNAVAILABLE:
+                lines.append(f"🚫 {source}: площадка временно недоступна")
+        lines.append("")
+        
+        if not items:
+            lines.append("По вашему запросу ничего не найдено." if finished else "Ожидаем ответ источников...")
+        for item in items[:config.MAX_SEARCH_RESULTS]:
+            name = item.get('name') or item.get('part_name') or ''
+            number = item.get('number') or item.get('part_number') or ''
+            line = f"• {item.get('brand') or ''} {number} {name}".strip()
+            if item.get('price'):
+                line += f" — {item['price']} ₽"
+            lines.append(line)
+        
+        return "\n".join(lines)[:4096]
+
+    async def stream_search_results(self, message: types.Message, query: str):
+        """
+        Поиск по всем источникам с показом результатов по мере поступления.
+        Результаты выводятся в одном сообщении, которое обновляется
+        не чаще раза в SEARCH_PROGRESS_INTERVAL секунд
+        """
+        search_type = await self.parser_factory.get_search_type(query)
+        if search_type == "car":
+            await message.answer("Для поиска по автомобилю введите запрос в формате: МАРКА МОДЕЛЬ ГОД")
+            return
+        
+        search_message = await message.answer(f"🔍 Ищем {query}...")
+        results = {'exist': [], 'autodoc': [], 'avtoto': []}
+        statuses = {}
+        shown_text = search_message.text
+        changed = asyncio.Event()
+        started_at = time.monotonic()
+        
+        async def render(finished: bool = False):
+            nonlocal shown_text
+            text = self.format_search_results(query, results, statuses, finished)
+            if text == shown_text:
+                return
+            try:
+                await search_message.edit_text(text)
+                shown_text = text
+            except Exception as e:
+                logger.warning(f"Failed to update search message: {e}")
+        
+        async def render_loop():
+            # Первое обновление выводится сразу, следующие - с заданным интервалом
+            while True:
+                await changed.wait()
+                changed.clear()
+                await render()
+                await asyncio.sleep(config.SEARCH_PROGRESS_INTERVAL)
+        
+        renderer = asyncio.create_task(render_loop())
+        try:
+            async for batch in self.search_aggregator.iter_search_all(query):
+                results[batch.source].extend(batch.items)
+                if batch.status:
+                    statuses[batch.source] = batch.status
+                metrics.search_results.labels(source=batch.source).inc(len(batch.items))
+                changed.set()
+        except Exception as e:
+            logger.error(f"Error streaming search results: {e}", exc_info=True)
+        finally:
+            renderer.cancel()
+            await asyncio.gather(renderer, return_exceptions=True)
+        
+        metrics.search_duration.observe(time.monotonic() - started_at)
+        await render(finished=True)
 
     @staticmethod
     async def handle_region_selection(callback_query: types.CallbackQuery, state: FSMContext):
@@ -368,7 +425,7 @@ class TelegramBot:
         # Сохраняем данны�� в состояни��
         await state.update_data(
             region=region,
-            modifications=modifications,
+            modifications=object_store.put(modifications),
             current_page=1
         )
         
@@ -386,7 +443,10 @@ class TelegramBot:
         page = int(callback_query.data.replace("page_", ""))
         data = await state.get_data()
         
-        modifications = data.get("modifications", [])
+        modifications = await TelegramBot.load_stored(callback_query, state, data, 'modifications', [])
+        if modifications is None:
+            await callback_query.answer()
+            return
         keyboard = create_modifications_keyboard(modifications, page)
         
         await callback_query.message.edit_reply_markup(reply_markup=keyboard)
@@ -397,7 +457,14 @@ class TelegramBot:
         try:
             mod_id = callback_query.data.split('_')[2]
             data = await state.get_data()
-            modifications = data.get('modifications', [])
+            modifications = await self.load_stored(callback_query, state, data, 'modifications', [])
+            if modifications is None:
+                await callback_query.answer()
+                return
+            search_result = await self.load_stored(callback_query, state, data, 'search_result', {})
+            if search_result is None:
+                await callback_query.answer()
+                return
             
             # Находим выбранную модификацию
             selected_mod = next((mod for mod in modifications if str(mod['id']) == mod_id), None)
@@ -407,9 +474,10 @@ class TelegramBot:
                 return
             
             try:
-                parser = AutodocCarParser()
-                brand_code = data['search_result'].get('brand_code')
+                parser = AutodocCarParser(self.http_client)
+                brand_code = search_result.get('brand_code')
                 logger.info(f"Getting parts list for brand_code={brand_code}, car_id={selected_mod['id']}, ssd={selected_mod['car_ssd']}")
+                wizard_prefetcher.record_parts_selection(parser, brand_code, selected_mod['id'], selected_mod['car_ssd'])
                 parts_data = await parser.get_parts_list(
                     brand_code, 
                     selected_mod['id'],
@@ -428,7 +496,9 @@ class TelegramBot:
                 
                 # Сохраняем данные в состоянии
                 await state.update_data(
-                    current_parts_data=root_categories,
+                    current_parts_data=object_store.put(
+                        root_categories, ('parts',) + parser.quickgroups_key(brand_code, selected_mod['id'], selected_mod['car_ssd'])
+                    ),
                     current_path=[],
                     selected_modification=selected_mod
                 )
@@ -481,7 +551,10 @@ class TelegramBot:
         try:
             data = await state.get_data()
             current_path = data.get('current_path', [])
-            parts_data = data.get('current_parts_data', [])
+            parts_data = await self.load_stored(callback, state, data, 'current_parts_data', [])
+            if parts_data is None:
+                await callback.answer()
+                return
             
             # Удаляем все сообщения со списком запчастей, кроме последнего
             message_ids = data.get('spare_parts_messages', [])
@@ -585,14 +658,14 @@ class TelegramBot:
         model = data['model']
         year = message.text
         
-        parser = AutodocCarParser()
+        parser = AutodocCarParser(self.http_client)
         initial_query = f"{brand} {model} {year}"
         
         search_result = await parser.step_by_step_search(initial_query)
         # Отправляем первое сообщени��� и сохраняем его ID
         search_message = await message.answer("Выпо��няется поиск...")
         await state.update_data(
-            search_result=search_result,
+            search_result=object_store.put(search_result),
             current_ssd=None,
             known_values={'Модель': model, 'Год': year},
             message_id=search_message.message_id
@@ -600,10 +673,41 @@ class TelegramBot:
         
         await self.show_available_fields(search_message, state)
 
+    @staticmethod
+    async def load_stored(event: Union[types.Message, types.CallbackQuery], state: FSMContext,
+                          data: Dict, key: str, empty: Any):
+        """
+        Крупные данные состояния из общего хранилища (empty - если сохранен None).
+        Если данные вытеснены, пользователю сообщается об истекшей сессии,
+        состояние сбрасывается и возвращается None
+        """
+        value = object_store.get(data.get(key, EXPIRED))
+        if value is None:
+            return empty
+        if value is not EXPIRED:
+            return value
+        logger.info(f"[FSM] {key} expired from object store, resetting state")
+        await state.clear()
+        # На callback отвечает обработчик, получивший его от Telegram
+        message = event.message if isinstance(event, types.CallbackQuery) else event
+        await message.answer("Сессия поиска истекла, начните поиск заново", reply_markup=get_main_keyboard())
+        return None
+
+    def prefetch_next_steps(self, search_result: Dict, current_ssd: Optional[str]):
+        """Фоновая загрузка вероятных следующих шагов подбора, пока пользователь выбирает поле"""
+        wizard_prefetcher.prefetch_fields(
+            AutodocCarParser(self.http_client),
+            search_result.get('brand_code'),
+            current_ssd,
+            search_result.get('available_fields', {})
+        )
+
     async def show_available_fields(self, message: types.Message, state: FSMContext):
         """Показать доступые поля для выбора"""
         data = await state.get_data()
-        search_result = data['search_result']
+        search_result = await self.load_stored(message, state, data, 'search_result', {})
+        if search_result is None:
+            return
         fields = list(search_result.get('available_fields', {}).items())
         
         if not fields:
@@ -618,7 +722,7 @@ class TelegramBot:
         known_values = data.get('known_values', {})
         current_ssd = data.get('current_ssd')
         auto_filled = False
-        parser = AutodocCarParser()
+        parser = AutodocCarParser(self.http_client)
         
         for field_name, field_data in fields:
             if field_name in known_values:
@@ -632,7 +736,7 @@ class TelegramBot:
                         })
                         auto_filled = True
                         await state.update_data(
-                            search_result=search_result,
+                            search_result=object_store.put(search_result),
                             current_ssd=current_ssd
                         )
                         logger.info(f"Auto filled: {search_result}, current_ssd: {current_ssd}")
@@ -654,6 +758,7 @@ class TelegramBot:
             callback_data="show_modifications"
         )])
         
+        self.prefetch_next_steps(search_result, current_ssd)
         await message.edit_text(
             "Выберите поле для уточнения:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -682,7 +787,11 @@ class TelegramBot:
             
             field_idx = int(parts[1]) - 1
             data = await state.get_data()
-            fields = list(data['search_result'].get('available_fields', {}).items())
+            search_result = await self.load_stored(callback, state, data, 'search_result', {})
+            if search_result is None:
+                await callback.answer()
+                return
+            fields = list(search_result.get('available_fields', {}).items())
             
             if 0 <= field_idx < len(fields):
                 field_name, field_data = fields[field_idx]
@@ -716,20 +825,25 @@ class TelegramBot:
         """Обработ��а выбора значения поля"""
         value_idx, field_idx = map(int, callback.data.split('_')[1:])
         data = await state.get_data()
-        fields = list(data['search_result'].get('available_fields', {}).items())
+        previous_result = await self.load_stored(callback, state, data, 'search_result', {})
+        if previous_result is None:
+            await callback.answer()
+            return
+        fields = list(previous_result.get('available_fields', {}).items())
         field_name, field_data = fields[field_idx]
         
         selected_option = field_data['options'][value_idx - 1]
         current_ssd = selected_option['key']
+        wizard_prefetcher.record_choice(previous_result.get('brand_code'), field_name, selected_option['value'])
         
-        parser = AutodocCarParser()
+        parser = AutodocCarParser(self.http_client)
         search_result = await parser.step_by_step_search({
-            'brand_code': data['search_result'].get('brand_code'),
+            'brand_code': previous_result.get('brand_code'),
             'ssd': current_ssd
         })
         
         await state.update_data(
-            search_result=search_result,
+            search_result=object_store.put(search_result),
             current_ssd=current_ssd
         )
         
@@ -754,7 +868,7 @@ class TelegramBot:
                             })
                             auto_filled = True
                             await state.update_data(
-                                search_result=search_result,
+                                search_result=object_store.put(search_result),
                                 current_ssd=current_ssd
                             )
                             break
@@ -787,6 +901,7 @@ class TelegramBot:
             callback_data="show_modifications"
         )])
         
+        self.prefetch_next_steps(search_result, current_ssd)
         await callback.message.edit_text(
             "Выберите пол�� для уточнения:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -797,7 +912,7 @@ class TelegramBot:
     async def search_modifications(self, brand_code: str, current_ssd: str) -> str:
         """Поиск модификаций и полчение списка запчастей"""
         logger.info(f"Searching modifications with brand_code={brand_code}, current_ssd={current_ssd}")
-        parser = AutodocCarParser()
+        parser = AutodocCarParser(self.http_client)
         
         if current_ssd:
             logger.info("Getting modifications...")
@@ -828,8 +943,11 @@ class TelegramBot:
                 )
                 return
             
-            parser = AutodocCarParser()
-            brand_code = data['search_result'].get('brand_code')
+            search_result = await self.load_stored(message, state, data, 'search_result', {})
+            if search_result is None:
+                return
+            parser = AutodocCarParser(self.http_client)
+            brand_code = search_result.get('brand_code')
             current_ssd = data.get('current_ssd')
             
             logger.info(f"[МОДИ����КАЦИИ] Запрос модификаций: brand_code={brand_code}, ssd={current_ssd}")
@@ -913,8 +1031,11 @@ class TelegramBot:
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
             )
             
+            # Пока пользователь выбирает модификацию, загружаем деревья запчастей первых из списка
+            wizard_prefetcher.prefetch_parts_lists(parser, brand_code, formatted_mods)
+            
             # Сохраняем модификации в состоянии
-            await state.update_data(modifications=formatted_mods)
+            await state.update_data(modifications=object_store.put(formatted_mods, ('modifications', brand_code, current_ssd)))
             await state.set_state(CarSearchStates.viewing_modifications)
             
         except Exception as e:
@@ -940,7 +1061,9 @@ class TelegramBot:
     async def handle_back_to_fields(self, callback: types.CallbackQuery, state: FSMContext):
         """Обработка возврата к выбору полей"""
         data = await state.get_data()
-        search_result = data.get('search_result', {})
+        search_result = await self.load_stored(callback, state, data, 'search_result', {})
+        if search_result is None:
+            return
         fields = list(search_result.get('available_fields', {}).items())
         
         keyboard = []
@@ -955,6 +1078,7 @@ class TelegramBot:
             callback_data="show_modifications"
         )])
         
+        self.prefetch_next_steps(search_result, data.get('current_ssd'))
         await callback.message.edit_text(
             "Выберите пол для уточнения:",
             reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -986,6 +1110,10 @@ class TelegramBot:
     async def start(self):
         """Запуск бота"""
         try:
+            # Открываем общий пул HTTP соединений для парсеров
+            await self.http_client.start()
+            await self.search_aggregator.start()
+            
             # Реисрируем обраотчики
             await self.register_handlers()
             
@@ -997,6 +1125,9 @@ class TelegramBot:
             logger.error("bot_startup_error", error=str(e))
             metrics.error_count.labels(type="startup").inc()
             raise
+        finally:
+            await self.search_aggregator.close()
+            await self.http_client.close()
 
     async def handle_subscription(self, message: types.Message):
         """Обработчик кнопки подписки"""
@@ -1096,7 +1227,10 @@ class TelegramBot:
         try:
             data = await state.get_data()
             selected_mod = data.get('selected_modification', {})
-            brand_code = data['search_result'].get('brand_code')
+            search_result = await self.load_stored(callback, state, data, 'search_result', {})
+            if search_result is None:
+                return
+            brand_code = search_result.get('brand_code')
             
             parts_data = await self.get_group_parts(
                 brand_code,
@@ -1223,7 +1357,7 @@ class TelegramBot:
             
             # Сохраняем ID сообщений в состоянии
             await state.update_data(
-                current_spare_parts=items,
+                current_spare_parts=object_store.put(items),
                 spare_parts_messages=message_ids
             )
             
@@ -1251,7 +1385,9 @@ class TelegramBot:
         """Показать текущий уровень дерева запчастей"""
         try:
             data = await state.get_data()
-            parts_data = data.get('current_parts_data', [])
+            parts_data = await self.load_stored(message, state, data, 'current_parts_data', [])
+            if parts_data is None:
+                return
             current_path = data.get('current_path', [])
             selected_mod = data.get('selected_modification', {})
             
@@ -1341,7 +1477,10 @@ class TelegramBot:
         try:
             part_idx = int(callback.data.split('_')[2])
             data = await state.get_data()
-            spare_parts = data.get('current_spare_parts', [])
+            spare_parts = await self.load_stored(callback, state, data, 'current_spare_parts', [])
+            if spare_parts is None:
+                await callback.answer()
+                return
             
             if 0 <= part_idx < len(spare_parts):
                 selected_part = spare_parts[part_idx]
@@ -1400,7 +1539,7 @@ class TelegramBot:
     async def get_group_parts(self, brand_code: str, car_id: str, quick_group_id: str, car_ssd: str) -> Dict:
         """Получение списка запчастей для выбранной группы"""
         try:
-            parser = AutodocCarParser()
+            parser = AutodocCarParser(self.http_client)
             parts_data = await parser.get_group_parts(
                 brand_code=brand_code,
                 car_id=car_id,
@@ -1,5 +1,5 @@
 import os
-from typing import List
+from typing import Dict, List, Tuple
 from dataclasses import dataclass, field
 import logging
 from dotenv import load_dotenv
@@ -29,6 +29,111 @@ class Config:
     # Настройки поиска
     SEARCH_TIMEOUT: int = 30
     MAX_SEARCH_RESULTS: int = 10
+    # Минимальный интервал между обновлениями сообщения с результатами, сек
+    SEARCH_PROGRESS_INTERVAL: float = 1.5
+    # Доля SEARCH_TIMEOUT, отводимая каждому источнику
+    SEARCH_SOURCE_BUDGETS: Dict[str, float] = field(default_factory=lambda: {
+        'autodoc': 0.9,
+        'avtoto': 0.6,
+        'exist': 0.6,
+    })
+    
+    # Кэш результатов поиска по артикулу: свежесть, сколько еще отдавать устаревшие записи
+    # (обновляя их в фоне), число записей на источник
+    SEARCH_CACHE_TTL: int = 600
+    SEARCH_CACHE_STALE_TTL: int = 3600
+    SEARCH_CACHE_SIZE: int = 2000
+    # Кэш отрицательных ответов (артикул без производителей, неизвестный VIN): время жизни, сек, записей
+    NEGATIVE_CACHE_TTL: int = 300
+    NEGATIVE_CACHE_SIZE: int = 10000
+    
+    # Настройки HTTP клиента
+    HTTP_TIMEOUT: int = 30
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 10
+    HTTP_HOST_LIMITS: Dict[str, int] = field(default_factory=lambda: {
+        'webapi.autodoc.ru': 20,
+        'catalogoriginal.autodoc.ru': 10,
+        'avtoto.ru': 4,
+        'exist.ru': 4,
+    })
+    HTTP_KEEPALIVE_TIMEOUT: int = 30
+    HTTP_DNS_CACHE_TTL: int = 300
+    # Дублирование медленных GET запросов через другой прокси (по p90 группы эндпоинтов)
+    HTTP_HEDGE_ENABLED: bool = False
+    HTTP_HEDGE_MAX_RATIO: float = 0.05
+    HTTP_HEDGE_MIN_DELAY: float = 0.1
+    HTTP_HEDGE_MIN_SAMPLES: int = 20
+    
+    # Настройки пула прокси
+    PROXY_FILE: str = "config/proxy_list.txt"
+    PROXY_FAILURE_THRESHOLD: int = 3
+    PROXY_ERROR_RATE_THRESHOLD: float = 0.5
+    PROXY_EJECT_SECONDS: int = 30
+    PROXY_MAX_EJECT_SECONDS: int = 600
+    
+    # Автоматы по группам эндпоинтов (ошибок подряд до размыкания, пауза, пробных запросов)
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RECOVERY_TIMEOUT: int = 30
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
+    
+    # Ограничение частоты запросов по хостам (запросов в секунду, всплеск)
+    RATE_LIMIT_DEFAULT_RATE: float = 5.0
+    RATE_LIMIT_DEFAULT_BURST: int = 10
+    RATE_LIMIT_HOSTS: Dict[str, Tuple[float, int]] = field(default_factory=lambda: {
+        'webapi.autodoc.ru': (10.0, 20),
+        'catalogoriginal.autodoc.ru': (5.0, 10),
+        'avtoto.ru': (2.0, 4),
+        'exist.ru': (2.0, 4),
+    })
+    
+    # Настройки параллельного получения деталей Autodoc
+    AUTODOC_DETAILS_CONCURRENCY: int = 8
+    AUTODOC_SEARCH_DEADLINE: int = 20
+    AUTODOC_VIN_GROUPS_CONCURRENCY: int = 6
+    
+    # Каталог марок Autodoc: снимок на диске и период обновления, сек
+    BRAND_CATALOG_FILE: str = "cache/brands.json"
+    BRAND_CATALOG_TTL: int = 86400
+    
+    # Кэш шагов подбора авто по (код марки, ssd): свежесть и отдача устаревших записей, сек,
+    # число записей, снимок на диске (пусто - без сохранения)
+    WIZARD_CACHE_TTL: int = 604800
+    WIZARD_CACHE_STALE_TTL: int = 86400
+    WIZARD_CACHE_SIZE: int = 5000
+    WIZARD_CACHE_FILE: str = "cache/wizard.json"
+    
+    # Кэш дерева запчастей (quickgroups) и состава групп (units): свежесть в памяти и на диске, сек,
+    # число записей в памяти, каталог на диске (пусто - только память)
+    CATALOG_CACHE_TTL: int = 86400
+    CATALOG_CACHE_DISK_TTL: int = 2592000
+    CATALOG_CACHE_SIZE: int = 500
+    CATALOG_CACHE_DIR: str = "cache/catalog"
+    
+    # Постоянный кэш расшифровки VIN (файл SQLite, общий для процессов на хосте; пусто - без кэша)
+    VIN_CACHE_FILE: str = "cache/vin.sqlite3"
+    
+    # Фоновая предзагрузка вероятных следующих шагов: включена ли, одновременных загрузок,
+    # загрузок в очереди, доля токенов rate limiter, которая всегда остается запросам пользователей
+    PREFETCH_ENABLED: bool = True
+    PREFETCH_CONCURRENCY: int = 2
+    PREFETCH_MAX_PENDING: int = 20
+    PREFETCH_RATE_RESERVE: float = 0.5
+    
+    # Предзагрузка шагов подбора авто: все варианты поля, если их не больше WIZARD_PREFETCH_ALL_OPTIONS,
+    # иначе WIZARD_PREFETCH_TOP_OPTIONS самых выбираемых; кэш списков модификаций (свежесть, сек, и записей)
+    WIZARD_PREFETCH_ALL_OPTIONS: int = 6
+    WIZARD_PREFETCH_TOP_OPTIONS: int = 3
+    WIZARD_MODIFICATIONS_CACHE_TTL: int = 300
+    WIZARD_MODIFICATIONS_CACHE_SIZE: int = 1000
+    # Сколько первых модификаций списка получают предзагрузку дерева запчастей (quickgroups)
+    QUICKGROUPS_PREFETCH_TOP: int = 5
+    # Сколько крупных объектов (результаты подбора, модификации, деревья запчастей) хранится для состояний FSM
+    FSM_OBJECT_STORE_SIZE: int = 5000
+    
+    # Пул прогретых сессий Avtoto
+    AVTOTO_POOL_SIZE: int = 4
+    AVTOTO_COOKIE_TTL: int = 1800
     
     # Настройки подписки
     TRIAL_PERIOD_DAYS: int = 1
@@ -57,6 +162,89 @@ class Config:
         
         self.SEARCH_TIMEOUT = int(os.getenv("SEARCH_TIMEOUT", str(self.SEARCH_TIMEOUT)))
         self.MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", str(self.MAX_SEARCH_RESULTS)))
+        self.SEARCH_PROGRESS_INTERVAL = float(os.getenv("SEARCH_PROGRESS_INTERVAL", str(self.SEARCH_PROGRESS_INTERVAL)))
+        search_source_budgets = os.getenv("SEARCH_SOURCE_BUDGETS")
+        if search_source_budgets:
+            self.SEARCH_SOURCE_BUDGETS = {
+                source.strip(): float(share)
+                for source, share in (item.split(":") for item in search_source_budgets.split(",") if item)
+            }
+        
+        self.SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", str(self.SEARCH_CACHE_TTL)))
+        self.SEARCH_CACHE_STALE_TTL = int(os.getenv("SEARCH_CACHE_STALE_TTL", str(self.SEARCH_CACHE_STALE_TTL)))
+        self.SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", str(self.SEARCH_CACHE_SIZE)))
+        self.NEGATIVE_CACHE_TTL = int(os.getenv("NEGATIVE_CACHE_TTL", str(self.NEGATIVE_CACHE_TTL)))
+        self.NEGATIVE_CACHE_SIZE = int(os.getenv("NEGATIVE_CACHE_SIZE", str(self.NEGATIVE_CACHE_SIZE)))
+        
+        self.HTTP_TIMEOUT = int(os.getenv("HTTP_TIMEOUT", str(self.HTTP_TIMEOUT)))
+        self.HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", str(self.HTTP_POOL_LIMIT)))
+        self.HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", str(self.HTTP_POOL_LIMIT_PER_HOST)))
+        # Формат: host:limit,host:limit
+        host_limits = os.getenv("HTTP_HOST_LIMITS", "")
+        if host_limits:
+            self.HTTP_HOST_LIMITS = {
+                host.strip(): int(limit)
+                for host, limit in (item.split(":") for item in host_limits.split(",") if item)
+            }
+        self.HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", str(self.HTTP_KEEPALIVE_TIMEOUT)))
+        self.HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", str(self.HTTP_DNS_CACHE_TTL)))
+        self.HTTP_HEDGE_ENABLED = os.getenv("HTTP_HEDGE_ENABLED", "0").lower() in ('true', '1', 't', 'y', 'yes')
+        self.HTTP_HEDGE_MAX_RATIO = float(os.getenv("HTTP_HEDGE_MAX_RATIO", str(self.HTTP_HEDGE_MAX_RATIO)))
+        self.HTTP_HEDGE_MIN_DELAY = float(os.getenv("HTTP_HEDGE_MIN_DELAY", str(self.HTTP_HEDGE_MIN_DELAY)))
+        self.HTTP_HEDGE_MIN_SAMPLES = int(os.getenv("HTTP_HEDGE_MIN_SAMPLES", str(self.HTTP_HEDGE_MIN_SAMPLES)))
+        
+        self.PROXY_FILE = os.getenv("PROXY_FILE", self.PROXY_FILE)
+        self.PROXY_FAILURE_THRESHOLD = int(os.getenv("PROXY_FAILURE_THRESHOLD", str(self.PROXY_FAILURE_THRESHOLD)))
+        self.PROXY_ERROR_RATE_THRESHOLD = float(os.getenv("PROXY_ERROR_RATE_THRESHOLD", str(self.PROXY_ERROR_RATE_THRESHOLD)))
+        self.PROXY_EJECT_SECONDS = int(os.getenv("PROXY_EJECT_SECONDS", str(self.PROXY_EJECT_SECONDS)))
+        self.PROXY_MAX_EJECT_SECONDS = int(os.getenv("PROXY_MAX_EJECT_SECONDS", str(self.PROXY_MAX_EJECT_SECONDS)))
+        
+        self.CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", str(self.CIRCUIT_FAILURE_THRESHOLD)))
+        self.CIRCUIT_RECOVERY_TIMEOUT = int(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", str(self.CIRCUIT_RECOVERY_TIMEOUT)))
+        self.CIRCUIT_HALF_OPEN_MAX_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_MAX_CALLS", str(self.CIRCUIT_HALF_OPEN_MAX_CALLS)))
+        
+        self.RATE_LIMIT_DEFAULT_RATE = float(os.getenv("RATE_LIMIT_DEFAULT_RATE", str(self.RATE_LIMIT_DEFAULT_RATE)))
+        self.RATE_LIMIT_DEFAULT_BURST = int(os.getenv("RATE_LIMIT_DEFAULT_BURST", str(self.RATE_LIMIT_DEFAULT_BURST)))
+        # Формат: host:rate:burst,host:rate:burst
+        rate_limit_hosts = os.getenv("RATE_LIMIT_HOSTS", "")
+        if rate_limit_hosts:
+            self.RATE_LIMIT_HOSTS = {
+                host.strip(): (float(rate), int(burst))
+                for host, rate, burst in (item.split(":") for item in rate_limit_hosts.split(",") if item)
+            }
+        
+        self.AUTODOC_DETAILS_CONCURRENCY = int(os.getenv("AUTODOC_DETAILS_CONCURRENCY", str(self.AUTODOC_DETAILS_CONCURRENCY)))
+        self.AUTODOC_SEARCH_DEADLINE = int(os.getenv("AUTODOC_SEARCH_DEADLINE", str(self.AUTODOC_SEARCH_DEADLINE)))
+        self.AUTODOC_VIN_GROUPS_CONCURRENCY = int(os.getenv("AUTODOC_VIN_GROUPS_CONCURRENCY", str(self.AUTODOC_VIN_GROUPS_CONCURRENCY)))
+        
+        self.BRAND_CATALOG_FILE = os.getenv("BRAND_CATALOG_FILE", self.BRAND_CATALOG_FILE)
+        self.BRAND_CATALOG_TTL = int(os.getenv("BRAND_CATALOG_TTL", str(self.BRAND_CATALOG_TTL)))
+        
+        self.WIZARD_CACHE_TTL = int(os.getenv("WIZARD_CACHE_TTL", str(self.WIZARD_CACHE_TTL)))
+        self.WIZARD_CACHE_STALE_TTL = int(os.getenv("WIZARD_CACHE_STALE_TTL", str(self.WIZARD_CACHE_STALE_TTL)))
+        self.WIZARD_CACHE_SIZE = int(os.getenv("WIZARD_CACHE_SIZE", str(self.WIZARD_CACHE_SIZE)))
+        self.WIZARD_CACHE_FILE = os.getenv("WIZARD_CACHE_FILE", self.WIZARD_CACHE_FILE)
+        
+        self.CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", str(self.CATALOG_CACHE_TTL)))
+        self.CATALOG_CACHE_DISK_TTL = int(os.getenv("CATALOG_CACHE_DISK_TTL", str(self.CATALOG_CACHE_DISK_TTL)))
+        self.CATALOG_CACHE_SIZE = int(os.getenv("CATALOG_CACHE_SIZE", str(self.CATALOG_CACHE_SIZE)))
+        self.CATALOG_CACHE_DIR = os.getenv("CATALOG_CACHE_DIR", self.CATALOG_CACHE_DIR)
+        
+        self.VIN_CACHE_FILE = os.getenv("VIN_CACHE_FILE", self.VIN_CACHE_FILE)
+        
+        self.PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1").lower() in ('true', '1', 't', 'y', 'yes')
+        self.PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", str(self.PREFETCH_CONCURRENCY)))
+        self.PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", str(self.PREFETCH_MAX_PENDING)))
+        self.PREFETCH_RATE_RESERVE = float(os.getenv("PREFETCH_RATE_RESERVE", str(self.PREFETCH_RATE_RESERVE)))
+        self.WIZARD_PREFETCH_ALL_OPTIONS = int(os.getenv("WIZARD_PREFETCH_ALL_OPTIONS", str(self.WIZARD_PREFETCH_ALL_OPTIONS)))
+        self.WIZARD_PREFETCH_TOP_OPTIONS = int(os.getenv("WIZARD_PREFETCH_TOP_OPTIONS", str(self.WIZARD_PREFETCH_TOP_OPTIONS)))
+        self.WIZARD_MODIFICATIONS_CACHE_TTL = int(os.getenv("WIZARD_MODIFICATIONS_CACHE_TTL", str(self.WIZARD_MODIFICATIONS_CACHE_TTL)))
+        self.WIZARD_MODIFICATIONS_CACHE_SIZE = int(os.getenv("WIZARD_MODIFICATIONS_CACHE_SIZE", str(self.WIZARD_MODIFICATIONS_CACHE_SIZE)))
+        self.QUICKGROUPS_PREFETCH_TOP = int(os.getenv("QUICKGROUPS_PREFETCH_TOP", str(self.QUICKGROUPS_PREFETCH_TOP)))
+        self.FSM_OBJECT_STORE_SIZE = int(os.getenv("FSM_OBJECT_STORE_SIZE", str(self.FSM_OBJECT_STORE_SIZE)))
+        
+        self.AVTOTO_POOL_SIZE = int(os.getenv("AVTOTO_POOL_SIZE", str(self.AVTOTO_POOL_SIZE)))
+        self.AVTOTO_COOKIE_TTL = int(os.getenv("AVTOTO_COOKIE_TTL", str(self.AVTOTO_COOKIE_TTL)))
         
         self.TRIAL_PERIOD_DAYS = int(os.getenv("TRIAL_PERIOD_DAYS", str(self.TRIAL_PERIOD_DAYS)))
         self.SUBSCRIPTION_PRICE = float(os.getenv("SUBSCRIPTION_PRICE", str(self.SUBSCRIPTION_PRICE)))
@@ -97,6 +285,15 @@ class Config:
         if self.SUBSCRIPTION_PRICE <= 0:
             raise ValueError("SUBSCRIPTION_PRICE должен быть больше 0")
             
+        if self.RATE_LIMIT_DEFAULT_RATE <= 0 or any(rate <= 0 for rate, _ in self.RATE_LIMIT_HOSTS.values()):
+            raise ValueError("Лимиты RATE_LIMIT_* должны быть больше 0")
+            
+        if any(not 0 < share <= 1 for share in self.SEARCH_SOURCE_BUDGETS.values()):
+            raise ValueError("Доли SEARCH_SOURCE_BUDGETS должны быть в диапазоне (0, 1]")
+            
+        if not 0 <= self.HTTP_HEDGE_MAX_RATIO <= 1:
+            raise ValueError("HTTP_HEDGE_MAX_RATIO должен быть в диапазоне [0, 1]")
+            
         # Проверка настроек Robokassa в боевом режиме
         if not self.ROBOKASSA_TEST_MODE:
             missing_robokassa = []
@@ -1,12 +1,18 @@
 import os
 import json
 import logging
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from datetime import datetime
 import aiohttp
 import random
 import asyncio
-import time
+from config import config
+from utils.cache import PartialResult, TTLCache, article_key, create_search_cache, negative_cache
+from utils.circuit_breaker import CircuitOpenError
+from utils.deadline import allows_wait, current_deadline, remaining_budget, request_timeout
+from utils.http_client import HttpClient, JsonResponse
+from utils.metrics import metrics
+from utils.concurrency import BatchStats, iter_bounded
 from .base_parser import BaseParser
 
 # Настройка логирования
@@ -37,15 +43,21 @@ def setup_logger():
 
 logger = setup_logger()
 
+# Общий для всех экземпляров кэш результатов поиска по артикулу
+search_cache = create_search_cache('autodoc_article')
+
 class AutodocArticleParser(BaseParser):
     """Парсер для сайта Autodoc.ru"""
     
-    def __init__(self, session: aiohttp.ClientSession = None):
-        super().__init__()
-        self.session = session or aiohttp.ClientSession()
-        self.last_request_time = 0
-        self.min_delay = 2  # минимальная задержка между запросами в секундах
-        self.max_delay = 5  # максимальная задержка
+    # Группа эндпоинтов, с которой начинается поиск (для автомата)
+    CIRCUIT_FAMILY = 'autodoc_manufacturers'
+    
+    def __init__(self, http_client: Optional[HttpClient] = None, result_cache: Optional[TTLCache] = None):
+        super().__init__(http_client)
+        self.result_cache = result_cache or search_cache
+        # Параллельное получение деталей по производителям
+        self.details_concurrency = config.AUTODOC_DETAILS_CONCURRENCY
+        self.search_deadline = config.AUTODOC_SEARCH_DEADLINE
         
         # Список User-Agent для ротации
         self.user_agents = [
@@ -70,61 +82,75 @@ class AutodocArticleParser(BaseParser):
         """Получение случайного User-Agent"""
         return random.choice(self.user_agents)
         
-    async def _get_session(self) -> aiohttp.ClientSession:
-        """Получение сессии с случайным User-Agent"""
-        if not self.session or self.session.closed:
-            headers = self.base_headers.copy()
-            headers['User-Agent'] = self._get_random_user_agent()
-            
-            self.session = aiohttp.ClientSession(
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-        return self.session
+    async def _get_session(self, url: str) -> aiohttp.ClientSession:
+        """Получение общей сессии для хоста"""
+        return await self.http_client.get_session(url)
         
     async def _make_request(self, url: str, method: str = 'GET', **kwargs) -> Optional[Dict]:
-        """Выполнение запроса с защитой от блокировки"""
+        """Выполнение запроса с защитой от блокировки (тело ответа 200, иначе None)"""
+        response = await self._fetch(url, method, **kwargs)
+        if response is None:
+            return None
+        if response.status != 200:
+            logger.error(f"[REQUEST ERROR] Status: {response.status}, URL: {url}")
+            return None
+        return response.data
+
+    async def _fetch(self, url: str, method: str = 'GET', **kwargs) -> Optional[JsonResponse]:
+        """
+        Запрос с повторами, отступлением после 429 и дублированием медленных GET.
+        Возвращает ответ с любым статусом, кроме 429; None - запрос не выполнен
+        (ошибка сети, разомкнутый автомат или исчерпан бюджет поиска)
+        """
         try:
-            # Задержка между запросами
-            current_time = time.time()
-            if self.last_request_time:
-                elapsed = current_time - self.last_request_time
-                if elapsed < self.min_delay:
-                    delay = random.uniform(self.min_delay, self.max_delay)
-                    await asyncio.sleep(delay)
-            
-            session = await self._get_session()
-            
+            # Частоту запросов к хосту ограничивает общий rate limiter HTTP клиента
             # Обновляем User-Agent для каждого запроса
-            session.headers['User-Agent'] = self._get_random_user_agent()
+            headers = self.base_headers.copy()
+            headers['User-Agent'] = self._get_random_user_agent()
+            headers.update(kwargs.get('headers') or {})
+            kwargs['headers'] = headers
             
             max_retries = 3
             retry_count = 0
             
             while retry_count < max_retries:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired:
+                    logger.warning(f"[DEADLINE] Search budget exhausted, skipping {url}")
+                    return None
+                # Каждая попытка укладывается в оставшийся бюджет поиска
+                kwargs['timeout'] = request_timeout()
+                
                 try:
-                    async with session.request(method, url, **kwargs) as response:
-                        self.last_request_time = time.time()
-                        
-                        if response.status == 429:  # Too Many Requests
-                            retry_count += 1
-                            wait_time = 30 * retry_count
-                            logger.warning(f"[RATE LIMIT] Rate limit hit, waiting {wait_time} seconds...")
-                            await asyncio.sleep(wait_time)
-                            continue
-                            
-                        if response.status != 200:
-                            logger.error(f"[REQUEST ERROR] Status: {response.status}, URL: {url}")
+                    # Медленный GET дублируется через прокси (если включено)
+                    response = await self.http_client.fetch_json(method, url, hedge=True, **kwargs)
+                    if response.status == 429:  # Too Many Requests
+                        retry_count += 1
+                        wait_time = 30 * retry_count
+                        logger.warning(f"[RATE LIMIT] Rate limit hit, backing off {wait_time} seconds...")
+                        # Приостанавливаем запросы к хосту для всех парсеров
+                        self.http_client.backoff(url, wait_time)
+                        if not allows_wait(wait_time):
+                            logger.warning(f"[DEADLINE] Backoff does not fit into search budget: {url}")
                             return None
-                            
-                        return await response.json()
+                        continue
                         
+                    return response
+                    
+                except CircuitOpenError as e:
+                    # Площадка недоступна - повторы только продлят ожидание
+                    logger.warning(f"[CIRCUIT] {e}, skipping {url}")
+                    return None
                 except aiohttp.ClientError as e:
                     retry_count += 1
                     logger.error(f"[REQUEST ERROR] Attempt {retry_count}/{max_retries}: {str(e)}")
                     if retry_count == max_retries:
                         raise
+                    if not allows_wait(5):
+                        logger.warning(f"[DEADLINE] No budget left for retry: {url}")
+                        return None
                     await asyncio.sleep(5)
+            return None
                     
         except Exception as e:
             logger.error(f"[REQUEST ERROR] {str(e)}", exc_info=True)
@@ -139,13 +165,13 @@ class AutodocArticleParser(BaseParser):
         await self.close()
 
     async def close(self):
-        """Закрытие сессии"""
-        if self.session and not self.session.closed:
-            await self.session.close()
-            self.session = None
+        """Сессии принадлежат общему HTTP клиенту и закрываются при остановке бота"""
+        pass
 
     async def get_manufacturers(self, article: str) -> List[Dict]:
         """Получает список производителей для артикула"""
+        if negative_cache.contains('manufacturers', article_key(article)):
+            return []
         try:
             url = f'https://webapi.autodoc.ru/api/manufacturers/{article}?showAll=true'
             
@@ -158,28 +184,36 @@ class AutodocArticleParser(BaseParser):
                 'Referer': 'https://autodoc.ru'
             }
             
-            async with self.session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    logger.error(f"[ERROR] Failed to get manufacturers: {response.status}")
-                    return []
-                    
-                data = await response.json()
+            response = await self._fetch(url, headers=headers)
+            if response is None:
+                return []
+            if response.status == 404:
+                # Артикул неизвестен Autodoc
+                negative_cache.add('manufacturers', article_key(article))
+                return []
+            if response.status != 200:
+                logger.error(f"[ERROR] Failed to get manufacturers: {response.status}")
+                return []
                 
-                # Сохраняем ответ в файл для логирования
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                log_file = f"logs/responses/manufacturers_{article}_{timestamp}.json"
-                os.makedirs(os.path.dirname(log_file), exist_ok=True)
-                with open(log_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                return data if isinstance(data, list) else []
+            data = response.data
+            if not data:
+                negative_cache.add('manufacturers', article_key(article))
+            
+            # Сохраняем ответ в файл для логирования
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            log_file = f"logs/responses/manufacturers_{article}_{timestamp}.json"
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            with open(log_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            
+            return data if isinstance(data, list) else []
                 
         except Exception as e:
             logger.error(f"[ERROR] Failed to get manufacturers: {str(e)}", exc_info=True)
             return []
 
-    async def get_part_details(self, manufacturer_id: int, part_number: str) -> Dict:
-        """Получает детальную информацию о запчасти"""
+    async def get_part_details(self, manufacturer_id: int, part_number: str) -> Optional[Dict]:
+        """Получает детальную информацию о запчасти (None - запрос не выполнен или завершился ошибкой)"""
         try:
             url = f"https://webapi.autodoc.ru/api/manufacturer/{manufacturer_id}/sparepart/{part_number}"
             
@@ -192,75 +226,132 @@ class AutodocArticleParser(BaseParser):
                 'Referer': 'https://autodoc.ru'
             }
             
-            async with self.session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    logger.error(f"[ERROR] Failed to get part details: {response.status}")
-                    return {}
-                    
-                data = await response.json()
-                
-                # Сохраняем ответ в файл для логирования
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                log_file = f"logs/responses/details_{manufacturer_id}_{part_number}_{timestamp}.json"
-                os.makedirs(os.path.dirname(log_file), exist_ok=True)
-                with open(log_file, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, ensure_ascii=False, indent=2)
-                
-                quantity = data.get('priceQuantity', 0)
-                
-                # Парсим результат
-                result = {
-                    'source': 'Autodoc.ru',
-                    'name': data.get('partName', ''),
-                    'number': data.get('partNumber', ''),
-                    'brand': data.get('manufacturerName', ''),
-                    'price': data.get('minimalPrice', 0),
-                    'quantity': quantity,  # Добавляем количество в наличии
-                    'in_stock': quantity > 0,  # Флаг наличия
-                    'delivery_days': 1 if quantity > 0 else None,
-                    'description': data.get('description', ''),
-                    'url': f"https://autodoc.ru/man/{manufacturer_id}/part/{part_number}",
-                    'image': data.get('galleryModel', {}).get('imgUrls', [])[0] if data.get('galleryModel', {}).get('imgUrls') else None,
-                    'rating': data.get('mark', {}).get('avg', 0),
-                    'reviews': data.get('mark', {}).get('cnt', 0)
-                }
+            response = await self._fetch(url, headers=headers)
+            if response is None:
+                return None
+            if response.status != 200:
+                logger.error(f"[ERROR] Failed to get part details: {response.status}")
+                return None
                 
-                return result
+            data = response.data
+            
+            # Сохраняем ответ в файл для логирования
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            log_file = f"logs/responses/details_{manufacturer_id}_{part_number}_{timestamp}.json"
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            with open(log_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            
+            quantity = data.get('priceQuantity', 0)
+            
+            # Парсим результат
+            result = {
+                'source': 'Autodoc.ru',
+                'name': data.get('partName', ''),
+                'number': data.get('partNumber', ''),
+                'brand': data.get('manufacturerName', ''),
+                'price': data.get('minimalPrice', 0),
+                'quantity': quantity,  # Добавляем количество в наличии
+                'in_stock': quantity > 0,  # Флаг наличия
+                'delivery_days': 1 if quantity > 0 else None,
+                'description': data.get('description', ''),
+                'url': f"https://autodoc.ru/man/{manufacturer_id}/part/{part_number}",
+                'image': data.get('galleryModel', {}).get('imgUrls', [])[0] if data.get('galleryModel', {}).get('imgUrls') else None,
+                'rating': data.get('mark', {}).get('avg', 0),
+                'reviews': data.get('mark', {}).get('cnt', 0)
+            }
+            
+            return result
                 
         except Exception as e:
             logger.error(f"[ERROR] Failed to get part details: {str(e)}", exc_info=True)
-            return {}
+            return None
+
+    async def iter_part_details(self, article: str, manufacturers: List[Dict],
+                                timeout: Optional[float] = None,
+                                stats: Optional[BatchStats] = None) -> AsyncIterator[Dict]:
+        """
+        Параллельно получает детали по производителям и отдает их по мере готовности.
+        Незавершенные запросы отменяются по истечении timeout секунд.
+        Отмененные и неудавшиеся запросы учитываются в stats
+        """
+        stats = stats if stats is not None else BatchStats()
+        fetched = 0
+        
+        async def fetch(manufacturer: Dict) -> Optional[Dict]:
+            manufacturer_id = manufacturer.get('id')
+            logger.info(f"[SEARCH] Processing {manufacturer.get('name')} (ID: {manufacturer_id})")
+            return await self.get_part_details(manufacturer_id, article)
+        
+        batch = iter_bounded(fetch, manufacturers, self.details_concurrency, timeout, stats)
+        try:
+            async for _, details in batch:
+                if details is None:
+                    stats.failed += 1
+                elif details:
+                    fetched += 1
+                    yield details
+        finally:
+            # Отменяем незавершенные запросы, если вызывающий прекратил чтение
+            await batch.aclose()
+            metrics.parser_details.labels(parser='autodoc_article', status='fetched').inc(fetched)
+            metrics.parser_details.labels(parser='autodoc_article', status='skipped').inc(len(manufacturers) - fetched)
 
-    async def search_by_article(self, article: str) -> List[Dict]:
+    async def search_by_article(self, article: str, timeout: Optional[float] = None) -> List[Dict]:
         """Поиск запчастей по артикулу"""
         try:
             # Получаем список производителей для артикула
             manufacturers = await self.get_manufacturers(article)
             logger.info(f"[SEARCH] Found {len(manufacturers)} manufacturers")
             
-            results = []
-            for manufacturer in manufacturers:
-                manufacturer_id = manufacturer.get('id')
-                logger.info(f"[SEARCH] Processing {manufacturer.get('name')} (ID: {manufacturer_id})")
-                
-                # Получаем детали по производителю
-                details = await self.get_part_details(manufacturer_id, article)
-                
-                if details:
-                    results.append(details)
+            # Получаем детали по производителям параллельно
+            stats = BatchStats()
+            results = [
+                details async for details in
+                self.iter_part_details(article, manufacturers, remaining_budget(timeout or self.search_deadline), stats)
+            ]
             
             logger.info(f"[SEARCH] Total parts found: {len(results)}")
+            if not stats.complete:
+                # Часть запросов отменена по дедлайну или завершилась ошибкой
+                return PartialResult(results)
             return results
             
         except Exception as e:
             logger.error(f"[ERROR] Search failed: {str(e)}", exc_info=True)
             return []
 
+    async def iter_search(self, query: str, timeout: Optional[float] = None) -> AsyncIterator[List[Dict]]:
+        """
+        Поиск по артикулу с отдачей деталей каждого производителя по мере готовности.
+        Результат из кэша отдается одной порцией; в кэш сохраняется только результат,
+        в котором ни один запрос не отменен и не завершился ошибкой
+        """
+        key = article_key(query)
+        cached = self.result_cache.get(key, lambda: self.search_by_article(query))
+        if cached is not None:
+            logger.info(f"[CACHE] Search results for {query} served from cache")
+            yield list(cached)
+            return
+        
+        logger.info(f"Начинаем поиск по запросу: {query}")
+        manufacturers = await self.get_manufacturers(query)
+        logger.info(f"[SEARCH] Found {len(manufacturers)} manufacturers")
+        results = []
+        stats = BatchStats()
+        async for details in self.iter_part_details(query, manufacturers, remaining_budget(timeout or self.search_deadline), stats):
+            results.append(details)
+            yield [details]
+        # Сюда доходим, только если вызывающий дочитал поиск до конца
+        if stats.complete:
+            self.result_cache.set(key, results)
+
     async def search(self, query: str) -> List[Dict]:
-        """Универсальный метод поиска"""
+        """Универсальный метод поиска (повторные поиски того же артикула отдаются из кэша)"""
         try:
             logger.info(f"Начинаем поиск по запросу: {query}")
-            return await self.search_by_article(query)
+            results = await self.result_cache.get_or_load(article_key(query), lambda: self.search_by_article(query))
+            return list(results)
         except Exception as e:
             logger.error(f"Ошибка при поиске: {e}", exc_info=True)
             return []
@@ -1,59 +1,87 @@
 import asyncio
 import json
+import os
 from pathlib import Path
 import re
-from typing import Dict, List, Optional, Union, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Union, Tuple
 import logging
+from config import config
+from utils.cache import PersistentTTLCache, TTLCache, TwoLevelCache
+from utils.deadline import current_deadline, request_timeout
+from utils.http_client import HttpClient
 from .base_parser import BaseParser
-
-import aiohttp
+from .brand_catalog import BrandCatalog, brand_catalog
+from .model_index import ModelIndexRegistry, model_indexes
 
 logger = logging.getLogger(__name__)
 
+# Общий кэш шагов подбора авто: ответы wizzard по (код марки, ssd)
+wizard_cache = PersistentTTLCache(
+    'autodoc_wizard',
+    config.WIZARD_CACHE_TTL,
+    config.WIZARD_CACHE_STALE_TTL,
+    config.WIZARD_CACHE_SIZE,
+    snapshot_file=config.WIZARD_CACHE_FILE or None
+)
+
+# Короткоживущий кэш списков модификаций шага подбора (заполняется в том числе предзагрузкой)
+modifications_cache = TTLCache(
+    'autodoc_wizard_modifications',
+    config.WIZARD_MODIFICATIONS_CACHE_TTL,
+    0,
+    config.WIZARD_MODIFICATIONS_CACHE_SIZE
+)
+
+# Общие кэши дерева запчастей модификации (quickgroups) и состава групп (units)
+quickgroups_cache = TwoLevelCache(
+    'autodoc_quickgroups',
+    config.CATALOG_CACHE_TTL,
+    config.CATALOG_CACHE_SIZE,
+    directory=os.path.join(config.CATALOG_CACHE_DIR, 'quickgroups') if config.CATALOG_CACHE_DIR else None,
+    disk_ttl=config.CATALOG_CACHE_DISK_TTL
+)
+units_cache = TwoLevelCache(
+    'autodoc_units',
+    config.CATALOG_CACHE_TTL,
+    config.CATALOG_CACHE_SIZE,
+    directory=os.path.join(config.CATALOG_CACHE_DIR, 'units') if config.CATALOG_CACHE_DIR else None,
+    disk_ttl=config.CATALOG_CACHE_DISK_TTL
+)
+
 class AutodocCarParser(BaseParser):
     """Парсер для поиска модификаций автомобилей и запчастей"""
     
-    def __init__(self):
-        super().__init__()
+    # Группа эндпоинтов, с которой начинается поиск (для автомата)
+    CIRCUIT_FAMILY = 'autodoc_catalogs'
+    
+    def __init__(self, http_client: Optional[HttpClient] = None, catalog: Optional[BrandCatalog] = None,
+                 wizard_states: Optional[PersistentTTLCache] = None,
+                 option_indexes: Optional[ModelIndexRegistry] = None):
+        super().__init__(http_client)
+        self.brand_catalog = catalog or brand_catalog
+        self.wizard_cache = wizard_states or wizard_cache
+        self.option_indexes = option_indexes or model_indexes
         self.base_url = "https://catalogoriginal.autodoc.ru/api/catalogs/original"
         self.wizard_url = f"{self.base_url}/brands/BMW202301/wizzard"
         
 
     async def get_brand_code(self, brand: str) -> Optional[str]:
         """Get manufacturer code by brand name"""
-        url = f"{self.base_url}/brands"
-        
-        try:
-            response = await self._make_request(url)
-            if not response:
-                logger.info("No response from API")
-                return None
-                
-            brand_lower = brand.lower()
-            items = response if isinstance(response, list) else response.get("items", [])
-            
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-                    
-                current_brand = item.get("brand", "")
-                if current_brand.lower() == brand_lower:
-                    return item.get("code")
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error processing API response: {e}")
-            return None
+        return await self.brand_catalog.get_code(brand)
 
+    def find_option(self, brand_code: str, ssd: Optional[str], field_name: str,
+                    options: List[Dict], value: str) -> Optional[Dict]:
+        """Вариант поля подбора, наиболее похожий на value (None - похожих нет)"""
+        index = self.option_indexes.get((brand_code, ssd or '', field_name), options)
+        option = index.best(value)
+        if option:
+            logger.info(f"Matched {field_name} '{value}' to '{option.get('value')}'")
+        return option
 
     async def get_models(self, brand_code: str, year: str) -> List[Dict]:
         """Get models by brand, year"""
-        url = f"{self.base_url}/brands/{brand_code}/wizzard"
-        logger.info(f"[REQUEST] GET {url}")
-        
         try:
-            response = await self._make_request(url)
+            response = await self.get_wizard_state(brand_code)
             if not response or "items" not in response:
                 return []
             
@@ -74,11 +102,8 @@ class AutodocCarParser(BaseParser):
 
     async def get_year_options(self, brand_code: str, model_key: str) -> List[Dict]:
         """Get available years after selecting model"""
-        url = f"{self.base_url}/brands/{brand_code}/wizzard?ssd={model_key}"
-        logger.info(f"[REQUEST] GET {url}")
-        
         try:
-            response = await self._make_request(url)
+            response = await self.get_wizard_state(brand_code, model_key)
             if not response or "items" not in response:
                 return []
                 
@@ -106,15 +131,9 @@ class AutodocCarParser(BaseParser):
                 logger.info(f"No models found for {brand}")
                 return []
 
-            # 5. Filter and find matching model
-            model_key = None
-            model_lower = model.lower()
-            
-            for m in models:
-                m_value = m.get("value", "").lower()
-                if model_lower in m_value or m_value in model_lower:
-                    model_key = m.get("key")
-                    break
+            # 5. Find matching model (exact name first, then the closest one)
+            matched_model = self.find_option(brand_code, None, 'model', models, model)
+            model_key = matched_model.get("key") if matched_model else None
 
             if not model_key:
                 logger.info(f"Model key not found for {model}")
@@ -275,26 +294,32 @@ class AutodocCarParser(BaseParser):
             return None
 
     async def get_wizard_state(self, brand_code: str, ssd: str = None) -> Dict:
-        """Get current wizard state with options"""
+        """Get current wizard state with options (shared cache by brand_code and ssd)"""
         url = f"{self.base_url}/brands/{brand_code}/wizzard"
         if ssd:
             url = f"{url}?ssd={ssd}"
         
-        logger.info(f"[REQUEST] GET {url}")
+        async def fetch() -> Optional[Dict]:
+            logger.info(f"[REQUEST] GET {url}")
+            return await self._make_request(url)
+        
         try:
-            response = await self._make_request(url)
+            response = await self.wizard_cache.get_or_load((brand_code, ssd or ''), fetch)
             return response if response else {}
         except Exception as e:
             logger.error(f"Error getting wizard state: {e}")
             return {}
 
     async def get_wizard_modifications(self, brand_code: str, ssd: str) -> Dict:
-        """Get modifications for final wizard state"""
+        """Get modifications for final wizard state (short-lived shared cache by brand_code and ssd)"""
         url = f"{self.base_url}/brands/{brand_code}/wizzard/0/modifications?ssd={ssd}"
-        logger.info(f"[REQUEST] GET {url}")
+        
+        async def fetch() -> Optional[Dict]:
+            logger.info(f"[REQUEST] GET {url}")
+            return await self._make_request(url)
         
         try:
-            response = await self._make_request(url)
+            response = await modifications_cache.get_or_load((brand_code, ssd), fetch)
             return response if response else {}
         except Exception as e:
             logger.error(f"Error getting wizard modifications: {e}")
@@ -329,11 +354,10 @@ class AutodocCarParser(BaseParser):
             if model and state and "items" in state:
                 for item in state["items"]:
                     if item["name"].lower() in ["серия", "модель"] and "options" in item:
-                        for option in item["options"]:
-                            if model.lower() in option["value"].lower():
-                                state = await self.get_wizard_state(brand_code, option["key"])
-                                current_ssd = option["key"]
-                                break
+                        option = self.find_option(brand_code, current_ssd, item["name"], item["options"], model)
+                        if option:
+                            state = await self.get_wizard_state(brand_code, option["key"])
+                            current_ssd = option["key"]
                         break
 
             # If we have a year and previous steps were successful, try to match it
@@ -415,6 +439,19 @@ class AutodocCarParser(BaseParser):
             "state": state
         }
 
+    @staticmethod
+    def get_available_fields(state: Dict) -> Dict:
+        """Поля шага подбора, которые еще нужно выбрать: название -> варианты"""
+        fields = {}
+        if state and "items" in state:
+            for item in state["items"]:
+                if not item.get("determined", False):
+                    fields[item["name"]] = {
+                        "options": item.get("options", []),
+                        "required": item.get("required", False)
+                    }
+        return fields
+
     async def step_by_step_search(self, query_or_params: Union[str, Dict] = None) -> Dict:
         """
         Пошаговый поиск с выводом доступных полей для выбора
@@ -426,25 +463,16 @@ class AutodocCarParser(BaseParser):
         try:
             # Определяем тип входных данных
             if isinstance(query_or_params, str):
-                # Обработка начального строкового запроса
-                initial_params = {}
-                parts = query_or_params.strip().split()
-                if len(parts) >= 1:
-                    initial_params["Марка"] = parts[0]
-                if len(parts) >= 2:
-                    initial_params["Модель"] = ' '.join(parts[1:-1]) if len(parts) > 2 else parts[1]
-                if len(parts) >= 3 and parts[-1].isdigit():
-                    initial_params["Год"] = parts[-1]
-
-                # Получаем код бренда
-                brand = initial_params.get("Марка")
-                if not brand:
-                    logger.error("Необходимо указать марку автомобиля")
+                # Обработка начального строкового запроса: марка может состоять
+                # из нескольких слов (LAND ROVER), поэтому ищем ее по каталогу марок
+                car = await self.brand_catalog.match_query(query_or_params)
+                if not car:
+                    logger.error(f"Марка не найдена в запросе {query_or_params}")
                     return {}
 
-                brand_code = await self.get_brand_code(brand)
+                brand_code = car.code
                 if not brand_code:
-                    logger.error(f"Код марки не найден для {brand}")
+                    logger.error(f"Код марки не найден для {car.brand}")
                     return {}
 
                 # Получаем начальное состояние
@@ -464,18 +492,8 @@ class AutodocCarParser(BaseParser):
                 logger.error("Неверный тип входных данных")
                 return {}
 
-            # Получаем доступные поля из текущего состояния
-            fields = {}
-            if state and "items" in state:
-                for item in state["items"]:
-                    if not item.get("determined", False):
-                        fields[item["name"]] = {
-                            "options": item.get("options", []),
-                            "required": item.get("required", False)
-                        }
-
             return {
-                "available_fields": fields,
+                "available_fields": self.get_available_fields(state),
                 "state": state,
                 "brand_code": query_or_params.get('brand_code') if isinstance(query_or_params, dict) else brand_code
             }
@@ -484,16 +502,31 @@ class AutodocCarParser(BaseParser):
             logger.error(f"Ошибка в пошаговом поиске: {e}")
             return {}
 
-    async def get_parts_list(self, brand_code: str, car_id: int, ssd: str) -> List[Dict]:
-        """Получить список запчастей для выбранной модификации"""
+    def get_quickgroups_url(self, brand_code: str, car_id: int, ssd: str) -> str:
         url = f"{self.base_url}/brands/{brand_code}/cars/{car_id}/quickgroups"
         if ssd:
             url += f"?ssd={ssd}"
-        
+        return url
+
+    @staticmethod
+    def quickgroups_key(brand_code: str, car_id: int, ssd: str) -> Tuple[str, str, str]:
+        """Ключ дерева групп модификации в общем кэше"""
+        return brand_code, str(car_id), ssd or ''
+
+    async def get_quickgroups(self, brand_code: str, car_id: int, ssd: str) -> Optional[List[Dict]]:
+        """Дерево групп запчастей модификации из общего кэша (ответ без обработки)"""
+        url = self.get_quickgroups_url(brand_code, car_id, ssd)
+        return await quickgroups_cache.get_or_load(
+            self.quickgroups_key(brand_code, car_id, ssd), lambda: self._make_request(url)
+        )
+
+    async def get_parts_list(self, brand_code: str, car_id: int, ssd: str) -> List[Dict]:
+        """Получить список запчастей для выбранной модификации"""
+        url = self.get_quickgroups_url(brand_code, car_id, ssd)
         logger.error(f"[ЗАПРОС] URL дерева запчастей: {url}")
         
         try:
-            response = await self._make_request(url)
+            response = await self.get_quickgroups(brand_code, car_id, ssd)
             if response:
                 logger.info("[ОТВЕТ] Успешно получено дерево запчастей:")
                 logger.info(f"[ОТВЕТ] - Всего корневых категорий: {len(response)}")
@@ -559,17 +592,26 @@ class AutodocCarParser(BaseParser):
             "Ssd": car_ssd
         }
         
+        async def fetch() -> Dict:
+            deadline = current_deadline()
+            if deadline is not None and deadline.expired:
+                logger.warning(f"[DEADLINE] Search budget exhausted, skipping {url}")
+                return {}
+            session = await self._get_session(url)
+            # Запрос укладывается в оставшийся бюджет поиска
+            async with session.post(url, json=payload, timeout=request_timeout()) as response:
+                if response.status != 200:
+                    logger.error(f"[ОТВЕТ] Ошибка API: {response.status}")
+                    return {}
+                return await response.json()
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=payload) as response:
-                    if response.status != 200:
-                        logger.error(f"[ОТВЕТ] Ошибка API: {response.status}")
-                        return {}
-                        
-                    response_data = await response.json()
-                    if not response_data:
-                        logger.error("[ОТВЕТ] Пустой ответ от API запчастей")
-                        return {}
+            response_data = await units_cache.get_or_load(
+                (brand_code, str(car_id), str(quick_group_id), car_ssd or ''), fetch
+            )
+            if not response_data:
+                logger.error("[ОТВЕТ] Пустой ответ от API запчастей")
+                return {}
                 
             items = response_data.get('items', [])
             if not items:
@@ -597,18 +639,22 @@ class AutodocCarParser(BaseParser):
         # Вместо вывода в консоль возвращаем структурированные данные
         return parts_data.get('data', [])
 
+    async def iter_search(self, query: str) -> AsyncIterator[List[Dict]]:
+        """Поиск по автомобилю: результат отдается целиком по завершении"""
+        results = await self.search(query)
+        if results:
+            yield results
+
     async def search(self, query: str) -> List[Dict]:
-        parser = AutodocCarParser()
-        parts = query.strip().split()
-        if len(parts) < 2:
+        parser = AutodocCarParser(self.http_client)
+        car = await self.brand_catalog.match_query(query)
+        if not car or not car.model:
             logger.error(f"Invalid car search query format: {query}")
             return []
             
-        brand = parts[0]
-        # Join all middle parts as model name
-        model = ' '.join(parts[1:-1]) if len(parts) > 2 else parts[1]
-        # Last part is year if it's a number
-        year = parts[-1] if parts[-1].isdigit() else None
+        brand = car.brand
+        model = car.model
+        year = str(car.year) if car.year else None
        
         print("Начинаем поиск машины...")
         # brand = "HONDA"
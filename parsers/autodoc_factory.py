@@ -1,48 +1,21 @@
 import re
-import aiohttp
 import logging
-from typing import Optional, Tuple, List, Dict
+from typing import Optional, Tuple, List
+from utils.http_client import HttpClient
 from .autodoc_article_parser import AutodocArticleParser
 from .autodoc_car_parser import AutodocCarParser
 from .autodoc_vin_parser import AutodocVinParser
+from .brand_catalog import brand_catalog
 
 logger = logging.getLogger(__name__)
 
 class AutodocParserFactory:
     """Фабрика для создания парсеров Autodoc"""
     
-    _brands_cache: List[Dict] = []
-    
-    @classmethod
-    async def _fetch_brands(cls) -> List[Dict]:
-        """Получает список брендов с API Autodoc"""
-        if cls._brands_cache:
-            return cls._brands_cache
-            
-        url = "https://catalogoriginal.autodoc.ru/api/catalogs/original/brands"
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-            'Accept': 'application/json'
-        }
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        brands = await response.json()
-                        cls._brands_cache = brands
-                        return brands
-                    else:
-                        logger.error(f"Failed to fetch brands: {response.status}")
-                        return []
-        except Exception as e:
-            logger.error(f"Error fetching brands: {e}")
-            return []
-    
     @classmethod
     async def get_brand_names(cls) -> List[str]:
         """Возвращает список названий брендов"""
-        brands = await cls._fetch_brands()
+        brands = await brand_catalog.get_brands()
         return [brand.get('brand', '') for brand in brands if isinstance(brand, dict)]
     
     @staticmethod
@@ -76,17 +49,8 @@ class AutodocParserFactory:
         if cls.is_article_number(query):
             return False
             
-        # Получаем список брендов
-        brands = await cls.get_brand_names()
-        query_words = query.lower().split()
-        normalized_brands = [brand.lower() for brand in brands]
-        
-        # Проверяем, есть ли название бренда в запросе
-        for brand in normalized_brands:
-            if brand in query_words:
-                return True
-                
-        return False
+        # Проверяем, есть ли название марки (в том числе из нескольких слов) в запросе
+        return await brand_catalog.match_query(query) is not None
 
     @classmethod
     async def extract_car_info(cls, query: str) -> Optional[Tuple[str, str, Optional[int]]]:
@@ -96,58 +60,38 @@ class AutodocParserFactory:
         """
         logger.info(f"Processing query: {query}")
         
-        # Ищем год в запросе
-        year_match = re.search(r'\b(19|20)\d{2}\b', query)
-        year = int(year_match.group()) if year_match else None
-        logger.info(f"Extracted year: {year}")
-        
-        # Разбиваем запрос на слова
-        words = query.strip().split()
-        if len(words) < 2:  # Нужно минимум бренд и модель
+        # Нужно минимум марка и модель
+        if len(query.split()) < 2:
             return None
             
-        # Первое слово считаем брендом
-        brand = words[0]
-        logger.info(f"Checking brand: {brand}")
-        
-        # Проверяем существование бренда через API
-        car_parser = AutodocCarParser()
-        brand_code = await car_parser.get_brand_code(brand)
-        
-        if brand_code:
-            logger.info(f"Found valid brand: {brand}")
-            # Все слова между брендом и годом (если есть) считаем моделью
-            model_words = []
-            for word in words[1:]:
-                if not re.match(r'(19|20)\d{2}', word):
-                    model_words.append(word)
-            
-            if model_words:
-                model = ' '.join(model_words)
-                logger.info(f"Extracted model: {model}")
-                return brand, model, year
+        # Марку ищем по каталогу в любом месте запроса, остальные слова кроме года - модель
+        car = await brand_catalog.match_query(query)
+        if car and car.model:
+            logger.info(f"Extracted brand: {car.brand}, model: {car.model}, year: {car.year}")
+            return car.brand, car.model, car.year
         
         logger.warning(f"No valid brand-model combination found in query: {query}")
         return None
 
     @classmethod
-    async def create_parser(cls, query: str):
+    async def create_parser(cls, query: str, http_client: Optional[HttpClient] = None):
         """
         Создает соответствующий парсер на основе запроса
         :param query: запрос
+        :param http_client: общий HTTP клиент для парсера
         :return: парсер
         """
         if cls.is_vin(query):
-            return AutodocVinParser()
+            return AutodocVinParser(http_client)
         elif await cls.is_car_search(query):
-            return AutodocCarParser()
+            return AutodocCarParser(http_client)
         elif cls.is_article_number(query):
-            return AutodocArticleParser()
+            return AutodocArticleParser(http_client)
         else:
             # Если запрос состоит из одного слова и это похоже на название бренда
             if len(query.split()) == 1 and not query.isdigit():
-                return AutodocCarParser()
-            return AutodocArticleParser()
+                return AutodocCarParser(http_client)
+            return AutodocArticleParser(http_client)
 
     @classmethod
     async def get_search_type(cls, query: str) -> str:
@@ -6,8 +6,13 @@ from typing import Dict, List, Optional
 from datetime import datetime
 import random
 import asyncio
-from aiohttp_proxy import ProxyConnector
-import time
+from config import config
+from utils.cache import PartialResult, TTLCache, article_key, create_search_cache, negative_cache
+from utils.circuit_breaker import CircuitOpenError
+from utils.deadline import allows_wait, current_deadline, remaining_budget, request_timeout
+from utils.http_client import HttpClient, http_client as default_http_client
+from utils.metrics import metrics
+from utils.concurrency import BatchStats, iter_bounded
 
 # Настройка логирования
 def setup_logger():
@@ -37,14 +42,19 @@ def setup_logger():
 
 logger = setup_logger()
 
+# Общий для всех экземпляров кэш результатов поиска по артикулу
+search_cache = create_search_cache('autodoc')
+
 class AutodocParser:
     """Парсер для сайта Autodoc.ru"""
     
-    def __init__(self):
-        self.session = None
-        self.last_request_time = 0
-        self.min_delay = 2  # минимальная задержка между запросами в секундах
-        self.max_delay = 5  # максимальная задержка
+    def __init__(self, http_client: Optional[HttpClient] = None, result_cache: Optional[TTLCache] = None):
+        self.http_client = http_client or default_http_client
+        self.result_cache = result_cache or search_cache
+        self.proxy = None
+        # Параллельное получение деталей по производителям
+        self.details_concurrency = config.AUTODOC_DETAILS_CONCURRENCY
+        self.search_deadline = config.AUTODOC_SEARCH_DEADLINE
         
         # Список User-Agent для ротации
         self.user_agents = [
@@ -55,9 +65,6 @@ class AutodocParser:
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36'
         ]
         
-        # Загрузка списка прокси из файла
-        self.proxies = self._load_proxies()
-        
         self.base_headers = {
             'Accept': 'application/json',
             'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
@@ -68,94 +75,84 @@ class AutodocParser:
         
         logger.info("Инициализация парсера Autodoc")
         
-    def _load_proxies(self) -> List[str]:
-        """Загрузка списка прокси из файла"""
-        proxies = []
-        try:
-            proxy_file = 'config/proxy_list.txt'
-            if os.path.exists(proxy_file):
-                with open(proxy_file, 'r') as f:
-                    for line in f:
-                        line = line.strip()
-                        if line and not line.startswith('#'):
-                            proxies.append(line)
-            logger.info(f"Загружено {len(proxies)} прокси серверов")
-        except Exception as e:
-            logger.error(f"Ошибка при загрузке прокси: {e}")
-        return proxies
-        
     def _get_random_user_agent(self) -> str:
         """Получение случайного User-Agent"""
         return random.choice(self.user_agents)
         
-    def _get_random_proxy(self) -> Optional[str]:
-        """Получение случайного прокси"""
-        return random.choice(self.proxies) if self.proxies else None
+    def _get_proxy(self) -> Optional[str]:
+        """Текущий прокси парсера (выбирается при первом запросе)"""
+        if self.proxy is None:
+            self.proxy = self.http_client.choose_proxy()
+        return self.proxy
         
-    async def _get_session(self) -> aiohttp.ClientSession:
-        """Получение сессии с прокси и случайным User-Agent"""
-        if not self.session or self.session.closed:
-            proxy = self._get_random_proxy()
-            connector = ProxyConnector.from_url(proxy) if proxy else None
-            
-            headers = self.base_headers.copy()
-            headers['User-Agent'] = self._get_random_user_agent()
-            
-            self.session = aiohttp.ClientSession(
-                connector=connector,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=30)
-            )
-        return self.session
+    def _get_request_headers(self, headers: Optional[Dict] = None) -> Dict:
+        """Заголовки запроса со случайным User-Agent"""
+        request_headers = self.base_headers.copy()
+        request_headers['User-Agent'] = self._get_random_user_agent()
+        if headers:
+            request_headers.update(headers)
+        return request_headers
         
     async def _make_request(self, url: str, method: str = 'GET', **kwargs) -> Optional[Dict]:
         """Выполнение запроса с защитой от блокировки"""
         try:
-            # Задержка между запросами
-            current_time = time.time()
-            if self.last_request_time:
-                elapsed = current_time - self.last_request_time
-                if elapsed < self.min_delay:
-                    delay = random.uniform(self.min_delay, self.max_delay)
-                    await asyncio.sleep(delay)
-            
-            session = await self._get_session()
-            
+            # Частоту запросов к хосту ограничивает общий rate limiter HTTP клиента
             # Обновляем User-Agent для каждого запроса
-            session.headers['User-Agent'] = self._get_random_user_agent()
+            kwargs['headers'] = self._get_request_headers(kwargs.get('headers'))
             
             max_retries = 3
             retry_count = 0
             
             while retry_count < max_retries:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired:
+                    logger.warning(f"[DEADLINE] Search budget exhausted, skipping {url}")
+                    return None
+                # Каждая попытка укладывается в оставшийся бюджет поиска
+                kwargs['timeout'] = request_timeout()
+                
                 try:
-                    async with session.request(method, url, **kwargs) as response:
-                        self.last_request_time = time.time()
-                        
-                        if response.status == 429:  # Too Many Requests
-                            retry_count += 1
-                            wait_time = 30 * retry_count  # Увеличиваем время ожидания с каждой попыткой
-                            logger.warning(f"[RATE LIMIT] Rate limit hit, waiting {wait_time} seconds...")
-                            await asyncio.sleep(wait_time)
-                            continue
-                            
-                        if response.status == 403:  # Forbidden - возможно, IP заблокирован
-                            logger.warning("[BLOCKED] IP might be blocked, switching proxy...")
-                            await self.close()  # Закрываем текущую сессию
-                            self.session = None  # Сбрасываем сессию для создания новой с другим прокси
-                            continue
-                            
-                        if response.status != 200:
-                            logger.error(f"[REQUEST ERROR] Status: {response.status}, URL: {url}")
+                    # Медленный GET дублируется через другой прокси (если включено)
+                    response = await self.http_client.fetch_json(method, url, proxy=self._get_proxy(),
+                                                                 hedge=True, **kwargs)
+                    if response.status == 429:  # Too Many Requests
+                        retry_count += 1
+                        wait_time = 30 * retry_count  # Увеличиваем время ожидания с каждой попыткой
+                        logger.warning(f"[RATE LIMIT] Rate limit hit, backing off {wait_time} seconds...")
+                        # Приостанавливаем запросы к хосту для всех парсеров
+                        self.http_client.backoff(url, wait_time)
+                        if not allows_wait(wait_time):
+                            logger.warning(f"[DEADLINE] Backoff does not fit into search budget: {url}")
                             return None
-                            
-                        return await response.json()
+                        continue
                         
+                    if response.status == 403:  # Forbidden - возможно, IP заблокирован
+                        retry_count += 1
+                        logger.warning("[BLOCKED] IP might be blocked, switching proxy...")
+                        # Следующая попытка пойдет через другой прокси
+                        self.proxy = self.http_client.choose_proxy(exclude=[response.proxy])
+                        continue
+                        
+                    if response.status != 200:
+                        logger.error(f"[REQUEST ERROR] Status: {response.status}, URL: {url}")
+                        return None
+                    
+                    # Остаемся на прокси, который ответил первым
+                    self.proxy = response.proxy
+                    return response.data
+                    
+                except CircuitOpenError as e:
+                    # Площадка недоступна - повторы только продлят ожидание
+                    logger.warning(f"[CIRCUIT] {e}, skipping {url}")
+                    return None
                 except aiohttp.ClientError as e:
                     retry_count += 1
                     logger.error(f"[REQUEST ERROR] Attempt {retry_count}/{max_retries}: {str(e)}")
                     if retry_count == max_retries:
                         raise
+                    if not allows_wait(5):
+                        logger.warning(f"[DEADLINE] No budget left for retry: {url}")
+                        return None
                     await asyncio.sleep(5)
                     
         except Exception as e:
@@ -163,9 +160,8 @@ class AutodocParser:
             return None
             
     async def close(self):
-        """Закрытие сессии"""
-        if self.session and not self.session.closed:
-            await self.session.close()
+        """Сессии принадлежат общему HTTP клиенту и закрываются при остановке бота"""
+        pass
 
     
     async def get_part_details(self, session: aiohttp.ClientSession, category_id: str, 
@@ -218,8 +214,11 @@ class AutodocParser:
             logger.error(f"Ошибка при получении деталей запчасти: {e}", exc_info=True)
             return None
 
-    async def get_part_details_manufacturer(self, manufacturer_id: int, part_number: str) -> Dict:
-        """Получение детальной информации о запчасти конкретного производителя"""
+    async def get_part_details_manufacturer(self, manufacturer_id: int, part_number: str) -> Optional[Dict]:
+        """
+        Получение детальной информации о запчасти конкретного производителя
+        ({} - деталей нет, None - запрос не выполнен или завершился ошибкой)
+        """
         try:
             # URL для API получения деталей
             api_url = f'https://webapi.autodoc.ru/api/manufacturer/{manufacturer_id}/sparepart/{part_number}'
@@ -237,6 +236,8 @@ class AutodocParser:
             logger.info(f"[REQUEST] Headers: {json.dumps(headers, indent=2, ensure_ascii=False)}")
             
             response = await self._make_request(api_url, headers=headers)
+            if response is None:
+                return None
             if not response:
                 return {}
             
@@ -271,15 +272,90 @@ class AutodocParser:
                         
         except Exception as e:
             logger.error(f"[ERROR] Failed to get part details: {str(e)}", exc_info=True)
-            return {}
+            return None
+
+    async def _process_manufacturer(self, manufacturer: Dict, part_number: str,
+                                    stats: Optional[BatchStats] = None) -> Optional[Dict]:
+        """
+        Получение результата поиска для одного производителя (None - результата нет).
+        Неудавшийся запрос деталей учитывается в stats
+        """
+        try:
+            # Логируем данные производителя
+            logger.info(f"[DEBUG] Raw manufacturer data: {json.dumps(manufacturer, indent=2, ensure_ascii=False)}")
+            
+            manufacturer_id = manufacturer.get('id')
+            manufacturer_name = manufacturer.get('manufacturerName', 'Unknown')
+            part_name = manufacturer.get('partName', '')
+            
+            if not manufacturer_id:
+                logger.error(f"[ERROR] No manufacturer ID found in: {manufacturer}")
+                return None
+            
+            logger.info(f"[SEARCH] Processing {manufacturer_name} (ID: {manufacturer_id})")
+            
+            # Получаем детальную информацию о запчасти
+            details = await self.get_part_details_manufacturer(manufacturer_id, part_number)
+            if details is None and stats is not None:
+                stats.failed += 1
+            
+            if not details:
+                logger.warning(f"[SEARCH] No details found for {manufacturer_name} (ID: {manufacturer_id})")
+                return None
+            
+            result = {
+                'source': 'Autodoc.ru',
+                'part_name': part_name,
+                'part_number': part_number,
+                'brand': manufacturer_name,
+                'price': details.get('price', 0),
+                'url': details.get('url', ''),
+                'in_stock': details.get('in_stock', 0),  # Теперь возвращаем количество вместо булева значения
+                'delivery_days': details.get('delivery_days'),
+                'manufacturer_name': manufacturer_name,
+                'minimal_price': details.get('price', 0),
+                'description': details.get('description', ''),
+                'properties': details.get('properties', [])
+            }
+            
+            # Логируем результат для отладки
+            logger.info(f"[RESULT] Part details: {json.dumps(result, ensure_ascii=False, indent=2)}")
+            
+            # Проверяем наличие обязательных полей
+            if result['price'] == 0:
+                logger.warning(f"[WARNING] Price is 0 for {manufacturer_name}")
+            if result['in_stock'] == 0:
+                logger.warning(f"[WARNING] Part not in stock for {manufacturer_name}")
+            
+            return result
+            
+        except Exception as e:
+            logger.error(f"[ERROR] Failed to process manufacturer: {str(e)}", exc_info=True)
+            if stats is not None:
+                stats.failed += 1
+            return None
 
-    async def search_part(self, part_number: str) -> List[Dict]:
-        """Поиск запчасти по номеру через API"""
+    async def search_part(self, part_number: str, timeout: Optional[float] = None) -> List[Dict]:
+        """Поиск запчасти по номеру; повторные поиски того же артикула отдаются из кэша"""
+        results = await self.result_cache.get_or_load(
+            article_key(part_number), lambda: self._search_part(part_number, timeout)
+        )
+        return list(results)
+
+    async def _search_part(self, part_number: str, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Поиск запчасти по номеру через API
+        Детали по производителям запрашиваются параллельно (не более details_concurrency
+        одновременно). Если за timeout секунд (по умолчанию search_deadline) ответили
+        не все производители, возвращаются уже полученные результаты (PartialResult, не кэшируется).
+        """
         try:
             logger.info(f"[SEARCH] Starting search for part: {part_number}")
             
             # Нормализуем номер детали
             part_number = part_number.strip().upper()
+            if negative_cache.contains('manufacturers', part_number):
+                return []
             
             # URL для API поиска производителей
             api_url = f'https://webapi.autodoc.ru/api/manufacturers/{part_number}?showAll=true'
@@ -297,6 +373,9 @@ class AutodocParser:
             
             response = await self._make_request(api_url, headers=headers)
             if not response:
+                if response is not None:
+                    # Autodoc ответил пустым списком производителей
+                    negative_cache.add('manufacturers', part_number)
                 return []
             
             manufacturers_data = response
@@ -317,62 +396,29 @@ class AutodocParser:
             manufacturer_count = len(manufacturers_data)
             logger.info(f"[SEARCH] Found {manufacturer_count} manufacturers")
             
-            results = []
-            
-            # Обрабатываем каждого производителя
-            for idx, manufacturer in enumerate(manufacturers_data, 1):
-                try:
-                    # Логируем данные производителя
-                    logger.info(f"[DEBUG] Raw manufacturer data: {json.dumps(manufacturer, indent=2, ensure_ascii=False)}")
-                    
-                    manufacturer_id = manufacturer.get('id')
-                    manufacturer_name = manufacturer.get('manufacturerName', 'Unknown')
-                    part_name = manufacturer.get('partName', '')
-                    
-                    if not manufacturer_id:
-                        logger.error(f"[ERROR] No manufacturer ID found in: {manufacturer}")
-                        continue
-                    
-                    logger.info(f"[SEARCH] Processing {manufacturer_name} (ID: {manufacturer_id})")
-                    
-                    # Получаем детальную информацию о запчасти
-                    details = await self.get_part_details_manufacturer(manufacturer_id, part_number)
-                    
-                    if not details:
-                        logger.warning(f"[SEARCH] No details found for {manufacturer_name} (ID: {manufacturer_id})")
-                        continue
-                    
-                    result = {
-                        'source': 'Autodoc.ru',
-                        'part_name': part_name,
-                        'part_number': part_number,
-                        'brand': manufacturer_name,
-                        'price': details.get('price', 0),
-                        'url': details.get('url', ''),
-                        'in_stock': details.get('in_stock', 0),  # Теперь возвращаем количество вместо булева значения
-                        'delivery_days': details.get('delivery_days'),
-                        'manufacturer_name': manufacturer_name,
-                        'minimal_price': details.get('price', 0),
-                        'description': details.get('description', ''),
-                        'properties': details.get('properties', [])
-                    }
-                    
-                    # Логируем результат для отладки
-                    logger.info(f"[RESULT] Part details: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                    
-                    # Проверяем наличие обязательных полей
-                    if result['price'] == 0:
-                        logger.warning(f"[WARNING] Price is 0 for {manufacturer_name}")
-                    if result['in_stock'] == 0:
-                        logger.warning(f"[WARNING] Part not in stock for {manufacturer_name}")
-                    
-                    results.append(result)
-                    
-                except Exception as e:
-                    logger.error(f"[ERROR] Failed to process manufacturer: {str(e)}", exc_info=True)
-                    continue
+            # Обрабатываем производителей параллельно с ограничением
+            completed = {}
+            stats = BatchStats()
+            async for idx, result in iter_bounded(
+                lambda manufacturer: self._process_manufacturer(manufacturer, part_number, stats),
+                manufacturers_data,
+                self.details_concurrency,
+                remaining_budget(timeout or self.search_deadline),
+                stats
+            ):
+                if result:
+                    completed[idx] = result
+            
+            # Собираем результаты в исходном порядке производителей
+            results = [completed[idx] for idx in sorted(completed)]
+            
+            metrics.parser_details.labels(parser='autodoc', status='fetched').inc(len(results))
+            metrics.parser_details.labels(parser='autodoc', status='skipped').inc(manufacturer_count - len(results))
             
             logger.info(f"[SEARCH] Total parts found: {len(results)}")
+            if not stats.complete:
+                # Часть запросов отменена по дедлайну или завершилась ошибкой
+                return PartialResult(results)
             return results
             
         except Exception as e:
@@ -1,16 +1,47 @@
 import os
 import json
 import logging
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
+from config import config
+from utils.cache import negative_cache
+from utils.deadline import remaining_budget
+from utils.http_client import HttpClient
+from utils.metrics import metrics
+from utils.concurrency import iter_bounded
 from .base_parser import BaseParser
+from .vin_cache import VinCache, vin_cache as default_vin_cache
 
 logger = logging.getLogger(__name__)
 
 class AutodocVinParser(BaseParser):
     """Парсер для поиска запчастей по VIN номеру"""
+    
+    # Группа эндпоинтов, с которой начинается поиск (для автомата)
+    CIRCUIT_FAMILY = 'autodoc_vehicles'
+    
+    API_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+        'Accept': 'application/json',
+        'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+        'Accept-Encoding': 'gzip, deflate, br',
+        'Origin': 'https://autodoc.ru',
+        'Referer': 'https://autodoc.ru/'
+    }
+    
+    def __init__(self, http_client: Optional[HttpClient] = None, vin_cache: Optional[VinCache] = None):
+        super().__init__(http_client)
+        # Расшифровка VIN не меняется и берется из постоянного кэша до обращения к сети
+        self.vin_cache = vin_cache or default_vin_cache
+        self.groups_concurrency = config.AUTODOC_VIN_GROUPS_CONCURRENCY
+        self.search_deadline = config.AUTODOC_SEARCH_DEADLINE
+    
     async def get_car_data(self, vin: str) -> Optional[Dict]:
         """Получает данные об автомобиле по VIN номеру"""
+        return await self.vin_cache.get_or_load(vin, VinCache.CAR_DATA, lambda: self._get_car_data(vin))
+
+    async def _get_car_data(self, vin: str) -> Optional[Dict]:
+        """Загрузка данных об автомобиле по VIN номеру"""
         try:
             logger.info(f"Получаем данные автомобиля по VIN: {vin}")
             url = f'https://catalogoriginal.autodoc.ru/api/catalogs/original/cars/{vin}/modifications'
@@ -44,78 +75,115 @@ class AutodocVinParser(BaseParser):
             return None
 
     
-    async def search_by_vin(self, vin: str) -> List[Dict]:
-        """Поиск запчастей по VIN номеру"""
-        try:
-            api_url = f'https://webapi.autodoc.ru/api/vehicles/vin/{vin}'
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
-                'Accept': 'application/json',
-                'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Origin': 'https://autodoc.ru',
-                'Referer': 'https://autodoc.ru/'
+    async def get_vin_modification(self, vin: str) -> Optional[Dict]:
+        """Получает модификацию автомобиля по VIN номеру"""
+        return await self.vin_cache.get_or_load(vin, VinCache.MODIFICATION, lambda: self._get_vin_modification(vin))
+
+    async def _get_vin_modification(self, vin: str) -> Optional[Dict]:
+        """Загрузка модификации автомобиля по VIN номеру"""
+        if negative_cache.contains('vin', VinCache.normalize(vin)):
+            return None
+        api_url = f'https://webapi.autodoc.ru/api/vehicles/vin/{vin}'
+        
+        response = await self._make_request(api_url, headers=self.API_HEADERS)
+        if not response:
+            return None
+        
+        data = response
+        
+        # Сохраняем ответ для отладки
+        os.makedirs('logs/responses', exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        response_file = f'logs/responses/vin_search_{vin}_{timestamp}.json'
+        with open(response_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        
+        modification = data.get('modification', {})
+        if not modification:
+            logger.warning(f"[WARNING] No modification found for VIN: {vin}")
+            negative_cache.add('vin', VinCache.normalize(vin))
+            return None
+        return modification
+
+    async def get_group_parts(self, modification: Dict, group: Dict) -> List[Dict]:
+        """Получает запчасти одной группы модификации"""
+        parts_url = f'https://webapi.autodoc.ru/api/vehicles/{modification["id"]}/groups/{group["id"]}/parts'
+        
+        response = await self._make_request(parts_url, headers=self.API_HEADERS)
+        if not response:
+            return []
+        
+        results = []
+        for part in response:
+            result = {
+                'part_number': part.get('number'),
+                'part_name': part.get('name'),
+                'brand': part.get('brand', {}).get('name'),
+                'group_name': group.get('name'),
+                'source': 'Autodoc',
+                'url': f'https://autodoc.ru/catalogs/vehicle/{modification["id"]}/group/{group["id"]}'
             }
+            results.append(result)
+        return results
 
-            logger.info(f"[VIN SEARCH] Starting search for VIN: {vin}")
-            
-            response = await self._make_request(api_url, headers=headers)
-            if not response:
-                return []
-            
-            data = response
-            
-            # Сохраняем ответ для отладки
-            os.makedirs('logs/responses', exist_ok=True)
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            response_file = f'logs/responses/vin_search_{vin}_{timestamp}.json'
-            with open(response_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-            
-            # Получаем информацию о модификации автомобиля
-            modification = data.get('modification', {})
-            if not modification:
-                logger.warning(f"[WARNING] No modification found for VIN: {vin}")
-                return []
-            
-            # Получаем список групп запчастей
-            groups_url = f'https://webapi.autodoc.ru/api/vehicles/{modification["id"]}/groups'
-            
-            response = await self._make_request(groups_url, headers=headers)
-            if not response:
-                return []
-            
-            groups_data = response
+    async def iter_search_by_vin(self, vin: str, timeout: Optional[float] = None) -> AsyncIterator[Tuple[int, List[Dict]]]:
+        """
+        Поиск запчастей по VIN номеру с отдачей результатов по группам.
+        Группы запрашиваются параллельно (не более groups_concurrency одновременно),
+        каждая готовая группа сразу отдается как (индекс группы, запчасти)
+        """
+        logger.info(f"[VIN SEARCH] Starting search for VIN: {vin}")
+        
+        # Получаем информацию о модификации автомобиля
+        modification = await self.get_vin_modification(vin)
+        if not modification:
+            return
+        
+        # Получаем список групп запчастей
+        groups_url = f'https://webapi.autodoc.ru/api/vehicles/{modification["id"]}/groups'
+        groups_data = await self._make_request(groups_url, headers=self.API_HEADERS)
+        if not groups_data:
+            return
+        
+        fetched = 0
+        batch = iter_bounded(
+            lambda group: self.get_group_parts(modification, group),
+            groups_data,
+            self.groups_concurrency,
+            timeout
+        )
+        try:
+            async for idx, parts in batch:
+                fetched += 1
+                if parts:
+                    yield idx, parts
+        finally:
+            await batch.aclose()
+            metrics.parser_details.labels(parser='autodoc_vin', status='fetched').inc(fetched)
+            metrics.parser_details.labels(parser='autodoc_vin', status='skipped').inc(len(groups_data) - fetched)
+
+    async def search_by_vin(self, vin: str, timeout: Optional[float] = None) -> List[Dict]:
+        """Поиск запчастей по VIN номеру"""
+        try:
+            groups = {}
+            async for idx, parts in self.iter_search_by_vin(vin, remaining_budget(timeout or self.search_deadline)):
+                groups[idx] = parts
             
+            # Сохраняем исходный порядок групп
             results = []
-            for group in groups_data:
-                # Получаем список запчастей для каждой группы
-                parts_url = f'https://webapi.autodoc.ru/api/vehicles/{modification["id"]}/groups/{group["id"]}/parts'
-                
-                response = await self._make_request(parts_url, headers=headers)
-                if not response:
-                    continue
-                
-                parts_data = response
-                
-                for part in parts_data:
-                    result = {
-                        'part_number': part.get('number'),
-                        'part_name': part.get('name'),
-                        'brand': part.get('brand', {}).get('name'),
-                        'group_name': group.get('name'),
-                        'source': 'Autodoc',
-                        'url': f'https://autodoc.ru/catalogs/vehicle/{modification["id"]}/group/{group["id"]}'
-                    }
-                    results.append(result)
-            
+            for idx in sorted(groups):
+                results.extend(groups[idx])
             return results
             
         except Exception as e:
             logger.error(f"[ERROR] Failed to search by VIN: {str(e)}", exc_info=True)
             return []
 
+    async def iter_search(self, query: str, timeout: Optional[float] = None) -> AsyncIterator[List[Dict]]:
+        """Поиск по VIN с отдачей запчастей каждой группы по мере готовности"""
+        async for _, parts in self.iter_search_by_vin(query, remaining_budget(timeout or self.search_deadline)):
+            yield parts
+
     async def search(self, query: str) -> List[Dict]:
         """Основной метод поиска по VIN"""
         try:
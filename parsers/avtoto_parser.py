@@ -1,14 +1,29 @@
 import aiohttp
 import logging
-import json
-import re
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from bs4 import BeautifulSoup
+from utils.cache import TTLCache, article_key, create_search_cache, negative_cache
+from utils.circuit_breaker import CircuitOpenError
+from utils.deadline import request_timeout
+from utils.embedded_json import extract_embedded_json, read_embedded_json
+from utils.http_client import HttpClient, http_client as default_http_client
+from .avtoto_session_pool import AvtotoSessionPool
+
+logger = logging.getLogger(__name__)
+
+# Общий для всех экземпляров кэш результатов поиска по артикулу
+search_cache = create_search_cache('avtoto')
 
 class AvtotoParser:
     BASE_URL = "https://avtoto.ru"
+    # Переменная скрипта страницы с данными о товарах
+    DATA_MARKER = 'window.initialState'
+    # Группа эндпоинтов для автомата
+    CIRCUIT_FAMILY = 'avtoto_search'
     
-    def __init__(self):
+    def __init__(self, http_client: Optional[HttpClient] = None, result_cache: Optional[TTLCache] = None):
+        self.http_client = http_client or default_http_client
+        self.result_cache = result_cache or search_cache
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
@@ -21,19 +36,32 @@ class AvtotoParser:
             'Sec-Fetch-Site': 'none',
             'Sec-Fetch-User': '?1',
         }
+        # Пул сессий с прогретыми cookies, переиспользуемых между поисками
+        self.session_pool = AvtotoSessionPool(self.http_client, self.BASE_URL, self.headers)
+
+    async def start(self):
+        """Заранее прогреть пул сессий"""
+        await self.session_pool.start()
+
+    async def close(self):
+        """Остановка пула сессий и фоновых обновлений кэша"""
+        await self.result_cache.close()
+        await self.session_pool.close()
 
     def extract_data_from_script(self, html: str) -> List[Dict]:
         """Извлекает данные о товарах из JavaScript на странице"""
         try:
-            # Ищем JSON с данными о товарах
-            data_pattern = r'window\.initialState\s*=\s*({.*?});'
-            match = re.search(data_pattern, html, re.DOTALL)
-            if not match:
+            return self.parse_data(extract_embedded_json(html, self.DATA_MARKER))
+        except Exception as e:
+            logging.error(f"Ошибка при извлечении данных из JavaScript: {e}")
+            return []
+
+    def parse_data(self, data: Any) -> List[Dict]:
+        """Преобразует состояние страницы в список товаров"""
+        try:
+            if data is None:
                 logging.error("Не найдены данные о товарах в JavaScript")
                 return []
-
-            # Парсим JSON
-            data = json.loads(match.group(1))
             
             # Извлекаем товары из структуры данных
             products = data.get('searchResult', {}).get('items', [])
@@ -64,39 +92,47 @@ class AvtotoParser:
             return []
 
     async def search_part(self, part_number: str) -> List[Dict]:
+        """Поиск запчасти по номеру; повторные поиски того же артикула отдаются из кэша"""
+        results = await self.result_cache.get_or_load(article_key(part_number), lambda: self._search_part(part_number))
+        return list(results)
+
+    async def _search_part(self, part_number: str) -> List[Dict]:
         """Поиск запчасти по номеру"""
+        if negative_cache.contains('avtoto', article_key(part_number)):
+            return []
         try:
             logger.info(f"Начинаем поиск детали {part_number}")
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                # Первый запрос для получения cookies
-                async with session.get(
-                    self.BASE_URL,
-                    headers=self.headers,
-                    allow_redirects=True
-                ) as response:
-                    if response.status != 200:
-                        logger.error(f"Ошибка при начальном запросе: {response.status}")
-                        return []
-                
-                # Основной запрос поиска
-                search_url = f"{self.BASE_URL}/search/search?article={part_number}"
-                logger.info(f"Запрос поиска: {search_url}")
-                
-                async with session.get(
-                    search_url,
-                    headers=self.headers,
-                    allow_redirects=True
-                ) as response:
-                    if response.status != 200:
-                        logger.error(f"Ошибка при поиске: {response.status}")
-                        logger.error(f"Ответ: {await response.text()}")
-                        return []
-                    
-                    html = await response.text()
-                    return self.extract_data_from_script(html)
+            # Основной запрос поиска
+            search_url = f"{self.BASE_URL}/search/search?article={part_number}"
+            logger.info(f"Запрос поиска: {search_url}")
+            
+            # Вторая попытка выполняется, если cookies сессии оказались устаревшими
+            for attempt in range(2):
+                async with self.session_pool.session() as warm:
+                    async with warm.session.get(
+                        search_url,
+                        headers=self.headers,
+                        allow_redirects=True,
+                        timeout=request_timeout()
+                    ) as response:
+                        if response.status == 200 and not self.session_pool.is_landing_redirect(response):
+                            # Страница дочитывается только до конца данных о товарах
+                            data = await read_embedded_json(response, self.DATA_MARKER)
+                            if isinstance(data, dict) and not data.get('searchResult', {}).get('items'):
+                                # Страница загружена, но товаров по артикулу нет
+                                negative_cache.add('avtoto', article_key(part_number))
+                            return self.parse_data(data)
+                        
+                        logger.error(f"Ошибка при поиске: {response.status}, {response.url}")
+                        # Сессия будет прогрета заново перед возвратом в пул
+                        warm.invalidate()
+            
+            return []
 
+        except CircuitOpenError as e:
+            logger.warning(f"[AVTOTO] {e}")
+            return []
         except aiohttp.ClientError as e:
             logger.error(f"Ошибка сети при запросе к Avtoto.ru: {e}", exc_info=True)
             return []
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+
+from config import config
+from utils.deadline import request_timeout
+from utils.http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+
+class WarmSession:
+    """Сессия Avtoto с прогретыми cookies"""
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+        self.warmed_at = 0.0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.warmed_at
+
+    def invalidate(self):
+        """Пометить cookies как недействительные (сессия будет прогрета заново)"""
+        self.warmed_at = 0.0
+
+
+class AvtotoSessionPool:
+    """
+    Пул прогретых сессий Avtoto.
+    Каждая сессия один раз получает cookies запросом главной страницы и затем
+    переиспользуется для поисков. Cookies обновляются в фоне до истечения ttl,
+    а сессия, получившая ошибку или редирект на главную, прогревается заново.
+    """
+
+    def __init__(self, http_client: HttpClient, base_url: str, headers: Dict[str, str],
+                 size: int = None, ttl: int = None):
+        self.http_client = http_client
+        self.base_url = base_url
+        self.headers = headers
+        self.size = size or config.AVTOTO_POOL_SIZE
+        self.ttl = ttl or config.AVTOTO_COOKIE_TTL
+
+        self._sessions: List[WarmSession] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background: set = set()
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        """Создание сессий и запуск фонового прогрева и обновления cookies"""
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            idle = asyncio.Queue()
+            for _ in range(self.size):
+                warm = WarmSession(await self.http_client.create_isolated_session(self.base_url))
+                self._sessions.append(warm)
+                idle.put_nowait(warm)
+            self._idle = idle
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+            logger.info(f"[AVTOTO] Session pool started with {self.size} sessions")
+
+    async def _warm(self, warm: WarmSession) -> bool:
+        """Получение cookies запросом главной страницы"""
+        try:
+            async with warm.session.get(self.base_url, headers=self.headers, allow_redirects=True,
+                                        timeout=request_timeout()) as response:
+                if response.status != 200:
+                    logger.error(f"[AVTOTO] Ошибка при прогреве сессии: {response.status}")
+                    warm.invalidate()
+                    return False
+                await response.read()
+            warm.warmed_at = time.monotonic()
+            return True
+        except Exception as e:
+            logger.error(f"[AVTOTO] Ошибка при прогреве сессии: {e}")
+            warm.invalidate()
+            return False
+
+    async def _rewarm_and_release(self, warm: WarmSession):
+        await self._warm(warm)
+        self._idle.put_nowait(warm)
+
+    def is_landing_redirect(self, response: aiohttp.ClientResponse) -> bool:
+        """Был ли запрос перенаправлен на главную страницу (cookies устарели)"""
+        return bool(response.history) and response.url.path in ('', '/')
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[WarmSession]:
+        """Взять прогретую сессию из пула на время запроса"""
+        if self._idle is None:
+            await self.start()
+
+        warm = await self._acquire()
+        try:
+            yield warm
+        finally:
+            self._release(warm)
+
+    async def _acquire(self) -> WarmSession:
+        """
+        Прогретая сессия из пула. Сессия, которую не удалось прогреть, возвращается
+        в пул через фоновый прогрев, и берется следующая (не больше size попыток)
+        """
+        for _ in range(self.size):
+            warm = await self._idle.get()
+            if warm.warmed_at and warm.age < self.ttl:
+                return warm
+            try:
+                warmed = await self._warm(warm)
+            except BaseException:
+                # Отмена во время прогрева (например, по бюджету источника) не должна терять сессию
+                self._release(warm)
+                raise
+            if warmed:
+                return warm
+            self._release(warm)
+        raise aiohttp.ClientError("Не удалось прогреть сессию Avtoto")
+
+    def _release(self, warm: WarmSession):
+        """Возврат сессии в пул; сессию с устаревшими cookies прогреваем в фоне"""
+        if warm.warmed_at:
+            self._idle.put_nowait(warm)
+            return
+        task = asyncio.create_task(self._rewarm_and_release(warm))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _refresh_loop(self):
+        """Фоновое обновление cookies сессий до истечения ttl"""
+        interval = max(1.0, self.ttl / 4)
+        while True:
+            # Первый проход прогревает только что созданные сессии. Сессия прогревается
+            # на месте и остается доступной для поисков: пул не пустеет на время обновления
+            for warm in list(self._sessions):
+                if warm.age >= self.ttl * 0.75:
+                    await self._warm(warm)
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        """Остановка фонового обновления и закрытие сессий"""
+        tasks = list(self._background)
+        if self._refresh_task:
+            tasks.append(self._refresh_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for warm in self._sessions:
+            if not warm.session.closed:
+                await warm.session.close()
+        self._sessions.clear()
+        self._idle = None
+        self._refresh_task = None
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from config import config
+from utils.deadline import request_timeout
+from utils.http_client import HttpClient, http_client as default_http_client
+from .brand_matcher import BrandMatcher, CarQuery
+
+logger = logging.getLogger(__name__)
+
+
+class BrandCatalog:
+    """
+    Каталог марок Autodoc, общий для всех парсеров.
+    Загружается один раз при старте (из снимка на диске, если он не старше ttl),
+    затем обновляется в фоне раз в ttl. Поиск кода по названию марки и марки по коду - O(1),
+    разбор запроса по автомобилю - через дерево токенов марок (BrandMatcher)
+    """
+
+    URL = "https://catalogoriginal.autodoc.ru/api/catalogs/original/brands"
+    HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36',
+        'Accept': 'application/json'
+    }
+    # Пауза перед повторной загрузкой после неудачи, сек
+    RETRY_INTERVAL = 60
+
+    def __init__(self, http_client: Optional[HttpClient] = None,
+                 snapshot_file: str = None, ttl: int = None):
+        self.http_client = http_client or default_http_client
+        self.snapshot_file = snapshot_file or config.BRAND_CATALOG_FILE
+        self.ttl = ttl or config.BRAND_CATALOG_TTL
+
+        self.brands: List[Dict] = []
+        self._by_name: Dict[str, Dict] = {}
+        self._by_code: Dict[str, Dict] = {}
+        self.matcher = BrandMatcher()
+        self.fetched_at = 0.0
+        self._last_attempt = 0.0
+        self._load_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def _index(self, brands: List[Dict], fetched_at: float):
+        """Построение индексов по названию (в нижнем регистре), коду и токенам названий"""
+        by_name: Dict[str, Dict] = {}
+        by_code: Dict[str, Dict] = {}
+        for item in brands:
+            if not isinstance(item, dict):
+                continue
+            # При совпадении названий побеждает первая марка списка
+            by_name.setdefault(item.get('brand', '').lower(), item)
+            if item.get('code'):
+                by_code.setdefault(item['code'], item)
+        self.brands = brands
+        self._by_name = by_name
+        self._by_code = by_code
+        self.matcher = BrandMatcher(brands)
+        self.fetched_at = fetched_at
+
+    def _load_snapshot(self) -> bool:
+        """Загрузка каталога из снимка, если он не старше ttl"""
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            fetched_at = snapshot['fetched_at']
+            if time.time() - fetched_at >= self.ttl:
+                logger.info(f"[BRANDS] Snapshot {self.snapshot_file} is stale")
+                return False
+            self._index(snapshot['brands'], fetched_at)
+            logger.info(f"[BRANDS] Loaded {len(self.brands)} brands from {self.snapshot_file}")
+            return bool(self.brands)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"[BRANDS] Failed to read snapshot {self.snapshot_file}: {e}")
+            return False
+
+    def _save_snapshot(self):
+        """Сохранение снимка каталога (через временный файл, чтобы не оставить его недописанным)"""
+        try:
+            os.makedirs(os.path.dirname(self.snapshot_file) or '.', exist_ok=True)
+            tmp_file = f"{self.snapshot_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({'fetched_at': self.fetched_at, 'brands': self.brands}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.snapshot_file)
+        except Exception as e:
+            logger.error(f"[BRANDS] Failed to save snapshot {self.snapshot_file}: {e}")
+
+    async def refresh(self) -> bool:
+        """Загрузка каталога с Autodoc"""
+        self._last_attempt = time.monotonic()
+        try:
+            response = await self.http_client.fetch_json(
+                'GET', self.URL, proxy=self.http_client.choose_proxy(),
+                headers=self.HEADERS, timeout=request_timeout()
+            )
+            if response.status != 200:
+                logger.error(f"[BRANDS] Failed to fetch brands: {response.status}")
+                return False
+            data = response.data
+            brands = data if isinstance(data, list) else (data or {}).get('items', [])
+            if not brands:
+                logger.error("[BRANDS] Empty brand list received")
+                return False
+        except Exception as e:
+            logger.error(f"[BRANDS] Error fetching brands: {e}")
+            return False
+
+        self._index(brands, time.time())
+        self._save_snapshot()
+        logger.info(f"[BRANDS] Catalog refreshed: {len(self.brands)} brands")
+        return True
+
+    async def ensure_loaded(self) -> bool:
+        """Загрузка каталога при первом обращении (если он не был загружен при старте)"""
+        if self.brands:
+            return True
+        async with self._load_lock:
+            if self.brands:
+                return True
+            if self._load_snapshot():
+                return True
+            if self._last_attempt and time.monotonic() - self._last_attempt < self.RETRY_INTERVAL:
+                # Autodoc недавно не ответил - не повторяем загрузку на каждый запрос
+                return False
+            return await self.refresh()
+
+    async def start(self, http_client: Optional[HttpClient] = None):
+        """Загрузка каталога и запуск фонового обновления (http_client - клиент для загрузки каталога)"""
+        if http_client is not None:
+            self.http_client = http_client
+        await self.ensure_loaded()
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            if self.brands:
+                # Следующее обновление - когда загруженный каталог станет старше ttl
+                delay = max(self.RETRY_INTERVAL, self.ttl - (time.time() - self.fetched_at))
+            else:
+                delay = self.RETRY_INTERVAL
+            await asyncio.sleep(delay)
+            await self.refresh()
+
+    async def close(self):
+        """Остановка фонового обновления"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def get_code(self, brand: str) -> Optional[str]:
+        """Код марки по названию без учета регистра (None - марка неизвестна)"""
+        await self.ensure_loaded()
+        item = self._by_name.get(brand.strip().lower())
+        return item.get('code') if item else None
+
+    async def get_by_code(self, code: str) -> Optional[Dict]:
+        """Марка по коду"""
+        await self.ensure_loaded()
+        return self._by_code.get(code)
+
+    async def get_brands(self) -> List[Dict]:
+        """Все марки каталога"""
+        await self.ensure_loaded()
+        return self.brands
+
+    async def has_brand(self, name: str) -> bool:
+        """Есть ли марка с таким названием (без учета регистра)"""
+        await self.ensure_loaded()
+        return name.strip().lower() in self._by_name
+
+    async def match_query(self, query: str) -> Optional[CarQuery]:
+        """Марка, модель и год из запроса; марка из нескольких слов и псевдонимы учитываются"""
+        await self.ensure_loaded()
+        return self.matcher.match(query)
+
+
+# Общий каталог марок
+brand_catalog = BrandCatalog()
@@ -0,0 +1,144 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Разделители внутри слова: MERCEDES-BENZ и MERCEDES BENZ дают одни и те же токены
+TOKEN_SEPARATORS = re.compile(r'[\s\-_./]+')
+YEAR_PATTERN = re.compile(r'(19|20)\d{2}')
+
+# Распространенные написания марок: псевдоним -> название марки в каталоге.
+# Псевдоним добавляется, только если такая марка есть в каталоге
+BRAND_ALIASES: Dict[str, str] = {
+    'VW': 'VOLKSWAGEN',
+    'MERCEDES': 'MERCEDES-BENZ',
+    'CHEVY': 'CHEVROLET',
+    'LANDROVER': 'LAND ROVER',
+    'ALFA': 'ALFA ROMEO',
+    'ALFAROMEO': 'ALFA ROMEO',
+    'АУДИ': 'AUDI',
+    'БМВ': 'BMW',
+    'ВАЗ': 'LADA',
+    'ЛАДА': 'LADA',
+    'ВОЛЬВО': 'VOLVO',
+    'ИНФИНИТИ': 'INFINITI',
+    'КИА': 'KIA',
+    'ЛЕКСУС': 'LEXUS',
+    'ЛЕНД РОВЕР': 'LAND ROVER',
+    'ЛЭНД РОВЕР': 'LAND ROVER',
+    'АЛЬФА РОМЕО': 'ALFA ROMEO',
+    'МАЗДА': 'MAZDA',
+    'МЕРСЕДЕС': 'MERCEDES-BENZ',
+    'МИЦУБИСИ': 'MITSUBISHI',
+    'МИТСУБИСИ': 'MITSUBISHI',
+    'НИССАН': 'NISSAN',
+    'ОПЕЛЬ': 'OPEL',
+    'ПЕЖО': 'PEUGEOT',
+    'РЕНО': 'RENAULT',
+    'СИТРОЕН': 'CITROEN',
+    'СУБАРУ': 'SUBARU',
+    'СУЗУКИ': 'SUZUKI',
+    'ТОЙОТА': 'TOYOTA',
+    'ФОЛЬКСВАГЕН': 'VOLKSWAGEN',
+    'ФОРД': 'FORD',
+    'ХЕНДАЙ': 'HYUNDAI',
+    'ХУНДАЙ': 'HYUNDAI',
+    'ХОНДА': 'HONDA',
+    'ШЕВРОЛЕ': 'CHEVROLET',
+    'ШКОДА': 'SKODA',
+}
+
+
+@dataclass
+class CarQuery:
+    """Разбор запроса по автомобилю"""
+    brand: str
+    code: Optional[str]
+    model: Optional[str] = None
+    year: Optional[int] = None
+
+
+class BrandMatcher:
+    """
+    Префиксное дерево по токенам названий марок и их псевдонимов.
+    Марка ищется в любом месте запроса, из нескольких совпадений с одной позиции
+    выбирается самое длинное (LAND ROVER, а не ROVER). Разбор запроса - один проход
+    по его словам без обращений к сети
+    """
+
+    # Ключ узла дерева, под которым хранится марка, заканчивающаяся в этом узле
+    _END = ''
+
+    def __init__(self, brands: Iterable[Dict] = (), aliases: Optional[Dict[str, str]] = None):
+        self._root: Dict = {}
+        self.size = 0
+        by_name: Dict[Tuple[str, ...], Dict] = {}
+        for item in brands:
+            if not isinstance(item, dict):
+                continue
+            tokens = self.tokenize(item.get('brand', ''))
+            # При совпадении названий побеждает первая марка списка
+            if tokens and tokens not in by_name:
+                by_name[tokens] = item
+                self._insert(tokens, item)
+        for alias, name in (BRAND_ALIASES if aliases is None else aliases).items():
+            item = by_name.get(self.tokenize(name))
+            tokens = self.tokenize(alias)
+            # Псевдоним не перекрывает настоящее название марки
+            if item is not None and tokens and tokens not in by_name:
+                by_name[tokens] = item
+                self._insert(tokens, item)
+
+    @staticmethod
+    def tokenize(text: str) -> Tuple[str, ...]:
+        return tuple(token for token in TOKEN_SEPARATORS.split(text.upper()) if token)
+
+    def _insert(self, tokens: Tuple[str, ...], item: Dict):
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node[self._END] = item
+        self.size += 1
+
+    def _find_brand(self, tokens: List[Tuple[str, int]]) -> Optional[Tuple[Dict, int, int]]:
+        """Первая марка в запросе: (марка, индекс первого слова, индекс последнего слова)"""
+        for start in range(len(tokens)):
+            node = self._root
+            found = None
+            for position in range(start, len(tokens)):
+                node = node.get(tokens[position][0])
+                if node is None:
+                    break
+                if self._END in node:
+                    found = (node[self._END], tokens[start][1], tokens[position][1])
+            if found:
+                return found
+        return None
+
+    def match(self, query: str) -> Optional[CarQuery]:
+        """Марка, модель и год из запроса (None - марка в запросе не найдена)"""
+        words = query.split()
+        tokens = [
+            (token, index)
+            for index, word in enumerate(words)
+            for token in TOKEN_SEPARATORS.split(word.upper()) if token
+        ]
+        found = self._find_brand(tokens)
+        if found is None:
+            return None
+        item, first, last = found
+
+        year = None
+        model_words = []
+        for index, word in enumerate(words):
+            if first <= index <= last:
+                continue
+            if year is None and YEAR_PATTERN.fullmatch(word):
+                year = int(word)
+                continue
+            model_words.append(word)
+        return CarQuery(
+            brand=item.get('brand', ''),
+            code=item.get('code'),
+            model=' '.join(model_words) or None,
+            year=year
+        )
@@ -1,16 +1,22 @@
 import aiohttp
 import logging
-import json
-from typing import List, Dict
-import re
+from typing import Any, List, Dict, Optional
 from bs4 import BeautifulSoup
 import asyncio
+from utils.deadline import request_timeout
+from utils.embedded_json import extract_embedded_json, read_embedded_json
+from utils.http_client import HttpClient, http_client as default_http_client
 
 logger = logging.getLogger(__name__)
 
 class ExistParser:
-    def __init__(self):
-        self.session = None
+    # Переменная скрипта страницы с результатами поиска
+    DATA_MARKER = 'var _data'
+    # Группа эндпоинтов для автомата
+    CIRCUIT_FAMILY = 'exist_price'
+
+    def __init__(self, http_client: Optional[HttpClient] = None):
+        self.http_client = http_client or default_http_client
         self.BASE_URL = "https://exist.ru"
         self.SEARCH_URL = "https://exist.ru/Price/?pcode={}"
         self.HEADERS = {
@@ -21,30 +27,31 @@ class ExistParser:
             'Connection': 'keep-alive'
         }
 
-    async def create_session(self):
-        if not self.session:
-            self.session = aiohttp.ClientSession(headers=self.HEADERS)
-        return self.session
+    async def create_session(self) -> aiohttp.ClientSession:
+        return await self.http_client.get_session(self.BASE_URL)
 
     async def close_session(self):
-        if self.session:
-            await self.session.close()
-            self.session = None
+        # Сессия принадлежит общему HTTP клиенту и закрывается при остановке бота
+        pass
 
     def extract_data_from_script(self, html_content: str) -> List[Dict]:
         """
         Извлекает данные из JavaScript массива _data
         """
         try:
-            # Ищем массив _data в скрипте
-            data_match = re.search(r'var\s+_data\s*=\s*(\[.*?\]);', html_content, re.DOTALL)
-            if not data_match:
+            return self.parse_data(extract_embedded_json(html_content, self.DATA_MARKER))
+        except Exception as e:
+            logger.error(f"Error extracting data from script: {e}", exc_info=True)
+            return []
+
+    def parse_data(self, data: Any) -> List[Dict]:
+        """
+        Преобразует массив _data в список предложений
+        """
+        try:
+            if data is None:
                 logger.error("_data array not found in script")
                 return []
-
-            # Получаем JSON строку и парсим её
-            json_str = data_match.group(1)
-            data = json.loads(json_str)
             
             logger.info(f"Found {len(data)} items in _data array")
             
@@ -100,15 +107,14 @@ class ExistParser:
             session = await self.create_session()
             
             try:
-                async with session.get(search_url) as response:
+                async with session.get(search_url, headers=self.HEADERS, timeout=request_timeout()) as response:
                     if response.status != 200:
                         logger.error(f"Search page error: {response.status}")
                         return []
                     
-                    html = await response.text()
-                    
-                    # Извлекаем данные из JavaScript
-                    results = self.extract_data_from_script(html)
+                    # Извлекаем данные из JavaScript, не дочитывая страницу после массива
+                    data = await read_embedded_json(response, self.DATA_MARKER)
+                    results = self.parse_data(data)
                     
                     logger.info(f"Total results found: {len(results)}")
                     return results
@@ -120,8 +126,6 @@ class ExistParser:
         except Exception as e:
             logger.error(f"Error in search_part: {e}", exc_info=True)
             return []
-        finally:
-            await self.close_session()
 
 # Создаем экземпляр парсера
 exist_parser = ExistParser()
@@ -0,0 +1,103 @@
+import re
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r'[0-9A-ZА-ЯЁ]+')
+
+
+def _tokens(text: str) -> Tuple[str, ...]:
+    return tuple(TOKEN_PATTERN.findall(str(text).upper()))
+
+
+def _trigrams(compact: str) -> Set[str]:
+    padded = f"  {compact} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ModelIndex:
+    """
+    Индекс вариантов поля подбора (модели марки) для нечеткого поиска.
+    Названия сравниваются по нормализованным токенам (CR-V, CR V и CRV совпадают)
+    и по сходству триграмм, поэтому опечатки тоже находят модель.
+    Кандидаты отбираются по инвертированному индексу триграмм
+    """
+
+    # Минимальная оценка, с которой вариант считается найденным
+    MIN_SCORE = 0.4
+
+    def __init__(self, options: List[Dict]):
+        self.options = options
+        self._compact: List[str] = []
+        self._tokens: List[Set[str]] = []
+        self._trigram_counts: List[int] = []
+        self._by_trigram: Dict[str, List[int]] = {}
+        for position, option in enumerate(options):
+            tokens = _tokens(option.get('value', ''))
+            compact = ''.join(tokens)
+            trigrams = _trigrams(compact) if compact else set()
+            self._compact.append(compact)
+            self._tokens.append(set(tokens))
+            self._trigram_counts.append(len(trigrams))
+            for trigram in trigrams:
+                self._by_trigram.setdefault(trigram, []).append(position)
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[float, Dict]]:
+        """Варианты, похожие на запрос, по убыванию оценки (от 0 до 1)"""
+        tokens = _tokens(query)
+        compact = ''.join(tokens)
+        if not compact:
+            return []
+
+        trigrams = _trigrams(compact)
+        shared: Dict[int, int] = {}
+        for trigram in trigrams:
+            for position in self._by_trigram.get(trigram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        query_tokens = set(tokens)
+        ranked = []
+        for position, count in shared.items():
+            if self._compact[position] == compact:
+                score = 1.0
+            else:
+                # Сходство триграмм (коэффициент Дайса) с поправкой на совпадение целых токенов
+                similarity = 2 * count / (len(trigrams) + self._trigram_counts[position])
+                option_tokens = self._tokens[position]
+                overlap = len(query_tokens & option_tokens) / len(query_tokens | option_tokens)
+                score = min(0.99, 0.8 * similarity + 0.2 * overlap)
+            ranked.append((score, position))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [(score, self.options[position]) for score, position in ranked[:limit]]
+
+    def best(self, query: str) -> Optional[Dict]:
+        """Самый похожий вариант (None - ничего достаточно похожего нет)"""
+        found = self.search(query, limit=1)
+        if found and found[0][0] >= self.MIN_SCORE:
+            return found[0][1]
+        return None
+
+
+class ModelIndexRegistry:
+    """
+    Индексы вариантов полей подбора по шагам (код марки, ssd, поле).
+    Индекс перестраивается, только если список вариантов сменился
+    (например, шаг подбора был заново загружен в кэш)
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self._indexes: 'OrderedDict[Hashable, ModelIndex]' = OrderedDict()
+
+    def get(self, key: Hashable, options: List[Dict]) -> ModelIndex:
+        index = self._indexes.get(key)
+        if index is None or index.options is not options:
+            index = ModelIndex(options)
+            self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > self.max_size:
+            self._indexes.popitem(last=False)
+        return index
+
+
+# Общие индексы вариантов полей подбора
+model_indexes = ModelIndexRegistry()
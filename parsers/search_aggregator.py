@@ -1,64 +1,187 @@
 import asyncio
 import logging
 from utils.logger import logger
-from typing import List, Dict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
+from config import config
+from utils.concurrency import iter_merged
+from utils.deadline import Deadline, set_deadline
+from utils.http_client import HttpClient, http_client as default_http_client
+from utils.prefetch import prefetcher
+from utils.singleflight import SingleFlight
 from .exist_parser import ExistParser
+from .autodoc_article_parser import search_cache as article_search_cache
+from .autodoc_car_parser import modifications_cache, quickgroups_cache, units_cache, wizard_cache
 from .autodoc_factory import AutodocParserFactory
 from .avtoto_parser import AvtotoParser
+from .brand_catalog import brand_catalog
+from .vin_cache import vin_cache
+
+# Статусы источника по завершении поиска
+STATUS_OK = 'ok'
+STATUS_TIMEOUT = 'timeout'
+STATUS_ERROR = 'error'
+# Источник пропущен: автомат площадки разомкнут
+STATUS_UNAVAILABLE = 'unavailable'
+
+
+@dataclass
+class SearchBatch:
+    """Порция результатов источника. status задан только у последней порции источника"""
+    source: str
+    items: List[Dict] = field(default_factory=list)
+    status: Optional[str] = None
+
 
 class SearchAggregator:
-    def __init__(self):
-        self.exist_parser = ExistParser()
+    def __init__(self, http_client: Optional[HttpClient] = None):
+        self.http_client = http_client or default_http_client
+        self.exist_parser = ExistParser(self.http_client)
         self.autodoc_factory = AutodocParserFactory()
-        self.avtoto_parser = AvtotoParser()
+        self.avtoto_parser = AvtotoParser(self.http_client)
+        # Одинаковые одновременные поиски выполняются один раз
+        self.searches = SingleFlight('search_all')
+    
+    async def start(self):
+        """Подготовка парсеров (каталог марок, кэши каталога запчастей, прогрев сессий Avtoto)"""
+        await brand_catalog.start(self.http_client)
+        await wizard_cache.start()
+        await quickgroups_cache.start()
+        await units_cache.start()
+        await self.avtoto_parser.start()
+    
+    async def close(self):
+        """Остановка фоновых задач парсеров (кэш шагов подбора сохраняется на диск)"""
+        await prefetcher.close()
+        await brand_catalog.close()
+        await wizard_cache.close()
+        await modifications_cache.close()
+        await quickgroups_cache.close()
+        await units_cache.close()
+        await vin_cache.close()
+        await article_search_cache.close()
+        await self.avtoto_parser.close()
         
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Нормализация запроса для объединения одинаковых поисков"""
+        return ' '.join(query.split()).upper()
+
     async def search_all(self, query: str) -> Dict[str, List[Dict]]:
         """
-        Выполняет параллельный поиск по всем парсерам
+        Выполняет параллельный поиск по всем парсерам.
+        Одновременные запросы с тем же типом поиска и нормализованным запросом
+        получают результат одного общего поиска
         Args:
             query: Строка поиска (артикул, VIN или название бренда)
         Returns:
             Dict с ключами 'exist', 'autodoc', 'avtoto' и соответствующими результатами
         """
+        results, _ = await self.search_all_with_status(query)
+        return results
+
+    async def search_all_with_status(self, query: str) -> Tuple[Dict[str, List[Dict]], Dict[str, str]]:
+        """
+        Поиск по всем парсерам в пределах SEARCH_TIMEOUT.
+        Returns:
+            Результаты по источникам и статус каждого источника (ok/timeout/error/unavailable)
+        """
+        aggregated_results = {
+            'exist': [],
+            'autodoc': [],
+            'avtoto': []
+        }
+        statuses = {}
         try:
-            # Создаем парсер через фабрику
-            autodoc_parser = await self.autodoc_factory.create_parser(query)
-            
-            tasks = [
-                # asyncio.create_task(self.exist_parser.search_part(query)),
-                asyncio.create_task(autodoc_parser.search(query)),
-                asyncio.create_task(self.avtoto_parser.search_part(query))
-            ]
-            
-            # Ждем выполнения всех задач
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Обрабатываем результаты
-            aggregated_results = {
-                'exist': [],
-                'autodoc': [],
-                'avtoto': []
-            }
-            
-            for i, result in enumerate(results):
-                if isinstance(result, Exception):
-                    logger.error(f"Error in parser {i}: {result}")
-                    continue
-                    
-                if i == 0:
-                    aggregated_results['autodoc'] = result if result else []
-                elif i == 1:
-                    aggregated_results['avtoto'] = result if result else []
-            
-            return aggregated_results
-            
+            async for batch in self.iter_search_all(query):
+                aggregated_results[batch.source].extend(batch.items)
+                if batch.status:
+                    statuses[batch.source] = batch.status
         except Exception as e:
             logger.error(f"Error in search aggregator: {e}", exc_info=True)
-            return {
-                'exist': [],
-                'autodoc': [],
-                'avtoto': []
-            }
+        return aggregated_results, statuses
+
+    async def iter_search_all(self, query: str) -> AsyncIterator[SearchBatch]:
+        """
+        Параллельный поиск по всем парсерам с отдачей результатов по мере поступления.
+        Avtoto отдается целиком, Autodoc - по производителям (или группам VIN);
+        последняя порция каждого источника содержит его статус.
+        Одновременные одинаковые запросы читают один общий поиск
+        """
+        search_type = await self.autodoc_factory.get_search_type(query)
+        key = (search_type, self.normalize_query(query))
+        async for batch in self.searches.stream(key, lambda: self._iter_search_all(query), label=search_type):
+            yield batch
+
+    async def _iter_search_all(self, query: str) -> AsyncIterator[SearchBatch]:
+        """Поиск по всем парсерам без объединения запросов"""
+        # Общий бюджет поиска делится между источниками, работающими параллельно
+        deadline = Deadline(config.SEARCH_TIMEOUT)
+        
+        # Создаем парсер через фабрику
+        autodoc_parser = await self.autodoc_factory.create_parser(query, self.http_client)
+        
+        # Источник: (группа эндпоинтов для автомата, запуск поиска)
+        sources = {
+            # 'exist': (self.exist_parser.CIRCUIT_FAMILY, lambda: self._iter_results(self.exist_parser.search_part, query)),
+            'autodoc': (autodoc_parser.CIRCUIT_FAMILY, lambda: autodoc_parser.iter_search(query)),
+            'avtoto': (self.avtoto_parser.CIRCUIT_FAMILY, lambda: self._iter_results(self.avtoto_parser.search_part, query))
+        }
+        budgets = {
+            source: min(deadline.remaining(), config.SEARCH_TIMEOUT * config.SEARCH_SOURCE_BUDGETS.get(source, 1.0))
+            for source in sources
+        }
+        merged = iter_merged({
+            source: self._iter_source(source, circuit_family, factory, budgets[source])
+            for source, (circuit_family, factory) in sources.items()
+        })
+        async for _, batch in merged:
+            yield batch
+
+    async def _iter_source(self, source: str, circuit_family: str,
+                           factory: Callable[[], AsyncIterator[List[Dict]]],
+                           budget: float) -> AsyncIterator[SearchBatch]:
+        """Чтение источника в пределах его бюджета; последняя порция содержит статус"""
+        circuit_breakers = self.http_client.circuit_breakers
+        if circuit_breakers.is_open(circuit_family):
+            # Площадка недоступна - не тратим на нее время поиска
+            logger.info(f"Source {source} skipped: circuit {circuit_family} is open")
+            yield SearchBatch(source, status=STATUS_UNAVAILABLE)
+            return
+        
+        deadline = Deadline(budget)
+        # Дедлайн виден запросам источника, в том числе во вложенных задачах
+        set_deadline(deadline)
+        results = factory()
+        status = STATUS_OK
+        try:
+            while True:
+                items = await asyncio.wait_for(results.__anext__(), deadline.remaining())
+                if items:
+                    yield SearchBatch(source, items)
+        except StopAsyncIteration:
+            # Источник мог сам остановиться по дедлайну, отдав часть результатов
+            if deadline.expired:
+                status = STATUS_TIMEOUT
+        except asyncio.TimeoutError:
+            status = STATUS_TIMEOUT
+        except Exception as e:
+            logger.error(f"Error in parser {source}: {e}", exc_info=True)
+            status = STATUS_ERROR
+        finally:
+            await results.aclose()
+        
+        if status == STATUS_OK and circuit_breakers.is_open(circuit_family):
+            # Автомат разомкнулся во время поиска: результаты источника неполные
+            status = STATUS_UNAVAILABLE
+        if status == STATUS_TIMEOUT:
+            logger.warning(f"Source {source} did not finish within {budget:.1f}s budget")
+        yield SearchBatch(source, status=status)
+
+    @staticmethod
+    async def _iter_results(search: Callable[[str], Awaitable[List[Dict]]], query: str) -> AsyncIterator[List[Dict]]:
+        """Результат обычного поиска как генератор из одного элемента"""
+        yield await search(query)
             
     def sort_results_by_price(self, results: Dict[str, List[Dict]]) -> List[Dict]:
         """
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Optional
+
+from config import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class VinCache:
+    """
+    Постоянный кэш расшифровки VIN: модификация и данные автомобиля не меняются,
+    поэтому записи не истекают. Хранится в SQLite - одна запись со сжатым JSON на VIN
+    и вид данных. Режим WAL позволяет нескольким процессам бота на одном хосте
+    работать с одним файлом. Запросы к базе выполняются в отдельном потоке
+    """
+
+    MODIFICATION = 'modification'
+    CAR_DATA = 'car_data'
+
+    def __init__(self, path: str = None):
+        self.path = path if path is not None else config.VIN_CACHE_FILE
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @staticmethod
+    def normalize(vin: str) -> str:
+        return vin.strip().upper()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS vin_cache ('
+                'vin TEXT NOT NULL, kind TEXT NOT NULL, data BLOB NOT NULL, stored_at INTEGER NOT NULL, '
+                'PRIMARY KEY (vin, kind)) WITHOUT ROWID'
+            )
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def _read(self, vin: str, kind: str) -> Any:
+        row = self._connect().execute(
+            'SELECT data FROM vin_cache WHERE vin = ? AND kind = ?', (vin, kind)
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0]).decode('utf-8')) if row else None
+
+    def _write(self, vin: str, kind: str, value: Any):
+        data = zlib.compress(json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        connection = self._connect()
+        connection.execute(
+            'INSERT OR REPLACE INTO vin_cache (vin, kind, data, stored_at) VALUES (?, ?, ?, ?)',
+            (vin, kind, data, int(time.time()))
+        )
+        connection.commit()
+
+    async def _run(self, func: Callable, *args) -> Any:
+        # Соединение SQLite используется только из одного потока
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vin-cache')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get(self, vin: str, kind: str) -> Any:
+        """Сохраненные данные VIN (None - нет в кэше или кэш отключен)"""
+        if not self.path:
+            return None
+        try:
+            value = await self._run(self._read, self.normalize(vin), kind)
+        except Exception as e:
+            logger.error(f"[VIN CACHE] Failed to read {vin}: {e}")
+            value = None
+        metrics.cache_requests.labels(cache=f'vin_{kind}', result='hit' if value is not None else 'miss').inc()
+        return value
+
+    async def set(self, vin: str, kind: str, value: Any):
+        if not self.path or not value:
+            return
+        try:
+            await self._run(self._write, self.normalize(vin), kind, value)
+        except Exception as e:
+            logger.error(f"[VIN CACHE] Failed to store {vin}: {e}")
+
+    async def get_or_load(self, vin: str, kind: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Данные VIN из кэша, а при промахе - результат loader (непустой результат сохраняется)"""
+        value = await self.get(vin, kind)
+        if value is None:
+            value = await loader()
+            await self.set(vin, kind, value)
+        return value
+
+    async def close(self):
+        """Закрытие соединения с базой"""
+        if self._executor is None:
+            return
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+
+# Общий кэш расшифровки VIN
+vin_cache = VinCache()
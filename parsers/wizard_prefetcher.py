@@ -0,0 +1,116 @@
+import logging
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import config
+from utils.prefetch import Prefetcher, prefetcher as default_prefetcher
+from .autodoc_car_parser import AutodocCarParser, modifications_cache, quickgroups_cache
+
+logger = logging.getLogger(__name__)
+
+
+class WizardPrefetcher:
+    """
+    Предзагрузка вероятных следующих шагов подбора, пока пользователь читает меню полей.
+    Для поля с небольшим числом вариантов загружаются шаги всех вариантов, иначе - самых
+    выбираемых по истории выборов марки. Когда остается одно поле, загружаются и списки
+    модификаций, а для показанных модификаций - деревья запчастей. Загрузки идут через
+    общую очередь предзагрузки с ее ограничениями
+    """
+
+    def __init__(self, queue: Optional[Prefetcher] = None, all_options: int = None,
+                 top_options: int = None, top_modifications: int = None, history_size: int = 2000):
+        self.queue = queue or default_prefetcher
+        self.all_options = all_options if all_options is not None else config.WIZARD_PREFETCH_ALL_OPTIONS
+        self.top_options = top_options if top_options is not None else config.WIZARD_PREFETCH_TOP_OPTIONS
+        self.top_modifications = top_modifications if top_modifications is not None else config.QUICKGROUPS_PREFETCH_TOP
+        self.history_size = history_size
+        # (код марки, поле) -> сколько раз выбирался каждый вариант
+        self._history: 'OrderedDict[Tuple[str, str], Counter]' = OrderedDict()
+
+    def record_choice(self, brand_code: str, field_name: str, value: str):
+        """Учет выбора пользователя для ранжирования вариантов"""
+        key = (brand_code, field_name)
+        counts = self._history.get(key)
+        if counts is None:
+            counts = Counter()
+            self._history[key] = counts
+        counts[value] += 1
+        self._history.move_to_end(key)
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+
+    def _likely_options(self, brand_code: str, field_name: str, options: List[Dict]) -> List[Dict]:
+        """Варианты поля, шаги которых стоит загрузить заранее"""
+        if len(options) <= self.all_options:
+            return options
+        counts = self._history.get((brand_code, field_name))
+        if not counts:
+            return []
+        ranked = sorted((option for option in options if counts[option.get('value')]),
+                        key=lambda option: -counts[option.get('value')])
+        return ranked[:self.top_options]
+
+    def _prefetch_state(self, parser: AutodocCarParser, brand_code: str, ssd: str):
+        if parser.wizard_cache.lookup((brand_code, ssd))[0] is not None:
+            return
+        self.queue.submit(
+            'wizard_state', (brand_code, ssd),
+            lambda: parser.get_wizard_state(brand_code, ssd),
+            url=f"{parser.base_url}/brands/{brand_code}/wizzard"
+        )
+
+    def _prefetch_modifications(self, parser: AutodocCarParser, brand_code: str, ssd: str):
+        if modifications_cache.lookup((brand_code, ssd))[0] is not None:
+            return
+        self.queue.submit(
+            'wizard_modifications', (brand_code, ssd),
+            lambda: parser.get_wizard_modifications(brand_code, ssd),
+            url=f"{parser.base_url}/brands/{brand_code}/wizzard/0/modifications"
+        )
+
+    def prefetch_fields(self, parser: AutodocCarParser, brand_code: str,
+                        ssd: Optional[str], available_fields: Dict):
+        """Запуск предзагрузки для показанного меню полей"""
+        if not brand_code or not self.queue.enabled:
+            return
+        fields = list(available_fields.items())
+        last_field = len(fields) == 1
+        if last_field and ssd:
+            # Кнопка "Показать текущие модификации"
+            self._prefetch_modifications(parser, brand_code, ssd)
+        for field_name, field_data in fields:
+            for option in self._likely_options(brand_code, field_name, field_data.get('options', [])):
+                key = option.get('key')
+                if not key:
+                    continue
+                self._prefetch_state(parser, brand_code, key)
+                if last_field:
+                    # После выбора последнего поля сразу показываются модификации
+                    self._prefetch_modifications(parser, brand_code, key)
+
+    def prefetch_parts_lists(self, parser: AutodocCarParser, brand_code: str, modifications: List[Dict]):
+        """Предзагрузка деревьев запчастей для первых модификаций показанного списка"""
+        if not brand_code or not self.queue.enabled:
+            return
+        for mod in modifications[:self.top_modifications]:
+            car_id, ssd = mod.get('id'), mod.get('car_ssd')
+            if car_id is None:
+                continue
+            key = parser.quickgroups_key(brand_code, car_id, ssd)
+            if quickgroups_cache.lookup(key)[0] is not None:
+                continue
+            self.queue.submit(
+                'quickgroups', key,
+                lambda car_id=car_id, ssd=ssd: parser.get_quickgroups(brand_code, car_id, ssd),
+                url=parser.get_quickgroups_url(brand_code, car_id, ssd)
+            )
+
+    def record_parts_selection(self, parser: AutodocCarParser, brand_code: str, car_id, ssd: str):
+        """Учет выбора модификации для доли попаданий предзагрузки деревьев запчастей"""
+        key = parser.quickgroups_key(brand_code, car_id, ssd)
+        self.queue.record_use('quickgroups', key, quickgroups_cache.lookup(key)[0] is not None)
+
+
+# Общая предзагрузка шагов подбора
+wizard_prefetcher = WizardPrefetcher()
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from utils.response_logger import response_logger
+from .autodoc_car_parser import AutodocCarParser
+
+logger = logging.getLogger(__name__)
+
+# Поля подбора, в которые подставляется модель из запроса
+MODEL_FIELDS = ('Модель', 'Серия', 'Семейство', 'Vehicle Family')
+
+
+class WizardResolver:
+    """
+    Подбор автомобиля по запросу "МАРКА МОДЕЛЬ ГОД" за один вызов.
+    Поля мастера выбираются по очереди, пока для них есть значения из запроса
+    (модель, год, подсказки вроде двигателя или кузова). Если вариант поля
+    неоднозначен, следующие шаги для нескольких лучших вариантов запрашиваются
+    параллельно, и выбирается тот, где находятся остальные значения запроса.
+    Шаги берутся из общего кэша мастера, поэтому повторный подбор не ходит в сеть
+    """
+
+    # Сколько лучших вариантов неоднозначного поля проверяется параллельно
+    MAX_CANDIDATES = 3
+    # Варианты с оценкой не ниже лучшей минус AMBIGUITY_MARGIN считаются неоднозначными
+    AMBIGUITY_MARGIN = 0.15
+    # Ограничение числа шагов на случай зацикленного ответа мастера
+    MAX_STEPS = 10
+
+    def __init__(self, parser: AutodocCarParser):
+        self.parser = parser
+
+    @staticmethod
+    def _targets(model: Optional[str], year: Optional[str], hints: Optional[Dict[str, str]]) -> Dict[str, str]:
+        """Значения из запроса по видам полей: 'model', 'year' или стандартный ключ поля"""
+        targets = {}
+        if model:
+            targets['model'] = str(model)
+        if year:
+            targets['year'] = str(year)
+        for name, value in (hints or {}).items():
+            if value:
+                targets[response_logger.get_parameter_key(name)] = str(value)
+        return targets
+
+    @staticmethod
+    def _target_kind(field_name: str, targets: Dict[str, str]) -> Optional[str]:
+        """Вид значения запроса, которое подставляется в поле (None - такого нет)"""
+        key = response_logger.get_parameter_key(field_name)
+        if 'model' in targets and key in MODEL_FIELDS:
+            return 'model'
+        if 'year' in targets and 'год' in key.lower():
+            return 'year'
+        return key if key in targets else None
+
+    @staticmethod
+    def _match_year(options: List[Dict], year: str) -> Optional[Dict]:
+        """
+        Вариант года - только точное совпадение. Если модель в этом году не выпускалась,
+        поле года остается для выбора пользователем, а не подменяется ближайшим годом
+        """
+        for option in options:
+            if str(option.get('value')).strip() == year:
+                return option
+        return None
+
+    def _candidates(self, brand_code: str, ssd: Optional[str], field_name: str,
+                    options: List[Dict], kind: str, value: str) -> List[Dict]:
+        """Подходящие варианты поля: один, если совпадение однозначно, иначе несколько лучших"""
+        if kind == 'year':
+            option = self._match_year(options, value)
+            return [option] if option else []
+
+        index = self.parser.option_indexes.get((brand_code, ssd or '', field_name), options)
+        ranked = [(score, option) for score, option in index.search(value, self.MAX_CANDIDATES)
+                  if score >= index.MIN_SCORE]
+        if not ranked:
+            return []
+        best_score = ranked[0][0]
+        if best_score == 1.0:
+            return [ranked[0][1]]
+        return [option for score, option in ranked if score >= best_score - self.AMBIGUITY_MARGIN]
+
+    def _next_field(self, brand_code: str, ssd: Optional[str], state: Dict,
+                    targets: Dict[str, str]) -> Optional[Tuple[str, str, List[Dict]]]:
+        """Первое невыбранное поле, для которого в запросе есть значение: (поле, вид, варианты)"""
+        for field_name, field_data in self.parser.get_available_fields(state).items():
+            kind = self._target_kind(field_name, targets)
+            if kind is None:
+                continue
+            candidates = self._candidates(brand_code, ssd, field_name, field_data['options'], kind, targets[kind])
+            if candidates:
+                return field_name, kind, candidates
+        return None
+
+    def _fitness(self, brand_code: str, ssd: str, state: Dict, targets: Dict[str, str]) -> int:
+        """Сколько оставшихся значений запроса находится на шаге"""
+        found = 0
+        for field_name, field_data in self.parser.get_available_fields(state).items():
+            kind = self._target_kind(field_name, targets)
+            if kind and self._candidates(brand_code, ssd, field_name, field_data['options'], kind, targets[kind]):
+                found += 1
+        return found
+
+    async def resolve(self, brand_code: str, model: Optional[str] = None, year: Optional[str] = None,
+                      hints: Optional[Dict[str, str]] = None, ssd: Optional[str] = None) -> Dict:
+        """
+        Самый узкий шаг мастера для значений запроса.
+        Возвращает поля для дальнейшего выбора (как step_by_step_search), ssd шага
+        и выбранные значения полей ('matched'); пустой словарь - шаг не получен
+        """
+        targets = self._targets(model, year, hints)
+        state = await self.parser.get_wizard_state(brand_code, ssd)
+        if not state:
+            return {}
+
+        matched = {}
+        for _ in range(self.MAX_STEPS):
+            found = self._next_field(brand_code, ssd, state, targets)
+            if found is None:
+                break
+            field_name, kind, candidates = found
+            del targets[kind]
+
+            states = await asyncio.gather(*(
+                self.parser.get_wizard_state(brand_code, option['key']) for option in candidates
+            ))
+            # Из параллельно запрошенных шагов берем тот, где нашлось больше остальных значений
+            best = None
+            for option, next_state in zip(candidates, states):
+                if not next_state:
+                    continue
+                fitness = self._fitness(brand_code, option['key'], next_state, targets)
+                if best is None or fitness > best[0]:
+                    best = (fitness, option, next_state)
+            if best is None:
+                logger.info(f"[WIZARD] No state for {field_name} candidates")
+                break
+
+            _, option, state = best
+            ssd = option['key']
+            matched[field_name] = option.get('value')
+            logger.info(f"[WIZARD] {field_name} = {option.get('value')} "
+                        f"({len(candidates)} candidates), ssd={ssd}")
+
+        return {
+            "available_fields": self.parser.get_available_fields(state),
+            "state": state,
+            "brand_code": brand_code,
+            "ssd": ssd,
+            "matched": matched
+        }
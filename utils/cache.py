@@ -0,0 +1,383 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from config import config
+from utils.deadline import current_deadline, set_deadline
+from utils.metrics import metrics
+from utils.singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar('R')
+
+# Состояние записи при чтении
+FRESH = 'hit'
+STALE = 'stale'
+MISS = 'miss'
+
+
+class PartialResult(list):
+    """Неполный результат поиска (часть запросов не выполнилась): отдается вызывающему, но не кэшируется"""
+
+
+class TTLCache(Generic[R]):
+    """
+    LRU-кэш со временем свежести и stale-while-revalidate.
+    Свежая запись (не старше ttl) отдается сразу. Устаревшая запись (не старше ttl + stale_ttl)
+    тоже отдается сразу, а в фоне запускается ее обновление. Более старая запись
+    считается отсутствующей. При превышении max_size вытесняются давно читавшиеся записи.
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float, max_size: int):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        # ключ -> (время записи, значение)
+        self._entries: 'OrderedDict[Hashable, Tuple[float, R]]' = OrderedDict()
+        # Загрузки и фоновые обновления по одному ключу выполняются один раз
+        self._loads = SingleFlight(f"cache_{name}")
+        self._background: set = set()
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[R], str]:
+        """Значение и его состояние (hit/stale/miss) без учета в метриках"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, MISS
+        stored_at, value = entry
+        age = time.monotonic() - stored_at
+        if age >= self.ttl + self.stale_ttl:
+            del self._entries[key]
+            return None, MISS
+        self._entries.move_to_end(key)
+        return value, FRESH if age < self.ttl else STALE
+
+    def get(self, key: Hashable, loader: Optional[Callable[[], Awaitable[R]]] = None) -> Optional[R]:
+        """
+        Значение из кэша (None - нет или истекло).
+        Если запись устарела и передан loader, в фоне запускается ее обновление
+        """
+        value, state = self.lookup(key)
+        metrics.cache_requests.labels(cache=self.name, result=state).inc()
+        if state == STALE and loader is not None:
+            self.refresh(key, loader)
+        return value
+
+    def set(self, key: Hashable, value: R) -> bool:
+        """
+        Сохранение значения. Пустые значения, неполные результаты (PartialResult) и результаты,
+        собранные после истечения дедлайна поиска, не сохраняются. Возвращает, сохранено ли значение
+        """
+        if not value:
+            return False
+        if isinstance(value, PartialResult):
+            logger.debug(f"[CACHE] {self.name} {key}: not stored, partial result")
+            return False
+        deadline = current_deadline()
+        if deadline is not None and deadline.expired:
+            logger.debug(f"[CACHE] {self.name} {key}: not stored, deadline expired")
+            return False
+        self._store(key, time.monotonic(), value)
+        return True
+
+    def _store(self, key: Hashable, stored_at: float, value: R):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        metrics.cache_size.labels(cache=self.name).set(len(self._entries))
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[R]]) -> R:
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[R]]) -> R:
+        """Значение из кэша, а при промахе - результат loader (одновременные промахи загружают один раз)"""
+        value = self.get(key, loader)
+        if value is not None:
+            return value
+        return await self._loads.do(key, lambda: self._load(key, loader), label=self.name)
+
+    def refresh(self, key: Hashable, loader: Callable[[], Awaitable[R]]):
+        """Фоновое обновление записи (не ограничено дедлайном запроса, который его вызвал)"""
+        async def run():
+            set_deadline(None)
+            try:
+                await self._loads.do(key, lambda: self._load(key, loader), label=self.name)
+                metrics.cache_refreshes.labels(cache=self.name, status='ok').inc()
+            except Exception as e:
+                metrics.cache_refreshes.labels(cache=self.name, status='error').inc()
+                logger.error(f"[CACHE] {self.name} {key}: background refresh failed: {e}")
+
+        task = asyncio.create_task(run())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        """Отмена фоновых обновлений"""
+        tasks = list(self._background)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _write_json(path: str, data: Any):
+    """Запись JSON через временный файл, чтобы не оставить файл недописанным"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class PersistentTTLCache(TTLCache[R]):
+    """
+    TTLCache, переживающий перезапуск: записи загружаются из снимка на диске при старте
+    и сохраняются в него раз в save_interval секунд (если изменились) и при остановке.
+    Ключи и значения должны сериализоваться в JSON (кортежи в ключах восстанавливаются).
+    Без snapshot_file работает как обычный TTLCache
+    """
+
+    def __init__(self, name: str, ttl: float, stale_ttl: float, max_size: int,
+                 snapshot_file: Optional[str] = None, save_interval: float = 300):
+        super().__init__(name, ttl, stale_ttl, max_size)
+        self.snapshot_file = snapshot_file
+        self.save_interval = save_interval
+        self._dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+
+    def _store(self, key: Hashable, stored_at: float, value: R):
+        super()._store(key, stored_at, value)
+        self._dirty = True
+
+    def load(self) -> int:
+        """Загрузка неистекших записей из снимка. Возвращает число загруженных записей"""
+        try:
+            with open(self.snapshot_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)['entries']
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            logger.error(f"[CACHE] {self.name}: failed to read snapshot {self.snapshot_file}: {e}")
+            return 0
+
+        now, now_monotonic = time.time(), time.monotonic()
+        loaded = 0
+        # Записи в снимке идут от давно читавшихся к недавним
+        for key, stored_at, value in entries:
+            age = now - stored_at
+            if age >= self.ttl + self.stale_ttl:
+                continue
+            key = tuple(key) if isinstance(key, list) else key
+            super()._store(key, now_monotonic - age, value)
+            loaded += 1
+        logger.info(f"[CACHE] {self.name}: loaded {loaded} entries from {self.snapshot_file}")
+        return loaded
+
+    def _snapshot(self) -> List[Tuple[Any, float, R]]:
+        """Записи с временем записи по системным часам"""
+        offset = time.time() - time.monotonic()
+        return [
+            (list(key) if isinstance(key, tuple) else key, stored_at + offset, value)
+            for key, (stored_at, value) in self._entries.items()
+        ]
+
+    async def save(self):
+        """Сохранение снимка (запись файла выполняется вне цикла событий)"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        entries = self._snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, _write_json, self.snapshot_file, {'entries': entries}
+            )
+        except Exception as e:
+            self._dirty = True
+            logger.error(f"[CACHE] {self.name}: failed to save snapshot {self.snapshot_file}: {e}")
+
+    async def start(self):
+        """Загрузка снимка и запуск периодического сохранения"""
+        if not self.snapshot_file or self._save_task is not None:
+            return
+        self.load()
+        self._dirty = False
+        self._save_task = asyncio.create_task(self._save_loop())
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            await self.save()
+
+    async def close(self):
+        """Отмена фоновых обновлений и сохранение снимка"""
+        await super().close()
+        if self._save_task is not None:
+            self._save_task.cancel()
+            await asyncio.gather(self._save_task, return_exceptions=True)
+            self._save_task = None
+            await self.save()
+
+
+class CompressedDiskStore:
+    """
+    Значения JSON на диске: по одному сжатому zlib файлу на ключ.
+    Файл старше ttl считается отсутствующим и удаляется при чтении или очистке.
+    Все операции с файлами выполняются вне цикла событий
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(json.dumps(key, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json.z")
+
+    def _read(self, path: str) -> Any:
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return json.loads(zlib.decompress(f.read()).decode('utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path: str, value: Any):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8')))
+        os.replace(tmp_path, path)
+
+    def _prune(self) -> int:
+        removed = 0
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) >= self.ttl:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    async def get(self, key: Hashable) -> Any:
+        """Значение по ключу (None - нет или истекло)"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._read, self._path(key))
+
+    async def set(self, key: Hashable, value: Any):
+        await asyncio.get_running_loop().run_in_executor(None, self._write, self._path(key), value)
+
+    async def prune(self) -> int:
+        """Удаление истекших файлов. Возвращает число удаленных файлов"""
+        return await asyncio.get_running_loop().run_in_executor(None, self._prune)
+
+
+class TwoLevelCache(TTLCache[R]):
+    """
+    Кэш из двух уровней: LRU в памяти процесса и сжатое хранилище на диске.
+    Промах в памяти сначала проверяется на диске (найденное значение поднимается в память),
+    и только затем загружается. Без directory работает как обычный TTLCache
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int,
+                 directory: Optional[str] = None, disk_ttl: Optional[float] = None):
+        super().__init__(name, ttl, 0, max_size)
+        self.disk = CompressedDiskStore(directory, disk_ttl or ttl) if directory else None
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[R]]) -> R:
+        if self.disk is not None:
+            try:
+                value = await self.disk.get(key)
+            except Exception as e:
+                logger.error(f"[CACHE] {self.name} {key}: failed to read from disk: {e}")
+                value = None
+            metrics.cache_requests.labels(cache=self.name, result='disk_hit' if value is not None else 'disk_miss').inc()
+            if value is not None:
+                self._store(key, time.monotonic(), value)
+                return value
+
+        value = await loader()
+        if self.set(key, value) and self.disk is not None:
+            try:
+                await self.disk.set(key, value)
+            except Exception as e:
+                logger.error(f"[CACHE] {self.name} {key}: failed to write to disk: {e}")
+        return value
+
+    async def start(self):
+        """Очистка истекших записей на диске"""
+        if self.disk is None:
+            return
+        try:
+            removed = await self.disk.prune()
+            if removed:
+                logger.info(f"[CACHE] {self.name}: removed {removed} expired files from {self.disk.directory}")
+        except Exception as e:
+            logger.error(f"[CACHE] {self.name}: failed to prune {self.disk.directory}: {e}")
+
+
+class NegativeCache:
+    """
+    Короткая память об отрицательных ответах площадок ("у артикула нет производителей",
+    "VIN не найден"). Повторный запрос с тем же ключом в течение ttl получает пустой
+    результат сразу, без обращения к сети. Ошибки и таймауты сюда не попадают
+    """
+
+    def __init__(self, ttl: float = None, max_size: int = None):
+        self.ttl = ttl or config.NEGATIVE_CACHE_TTL
+        self.max_size = max_size or config.NEGATIVE_CACHE_SIZE
+        # (вид, ключ) -> момент истечения
+        self._entries: 'OrderedDict[Tuple[str, Hashable], float]' = OrderedDict()
+
+    def contains(self, kind: str, key: Hashable) -> bool:
+        """Известно ли, что по ключу ничего нет"""
+        expires_at = self._entries.get((kind, key))
+        if expires_at is None:
+            return False
+        if time.monotonic() >= expires_at:
+            del self._entries[(kind, key)]
+            return False
+        metrics.negative_cache_hits.labels(kind=kind).inc()
+        logger.info(f"[NEGATIVE CACHE] {kind} {key}: known empty, skipping request")
+        return True
+
+    def add(self, kind: str, key: Hashable):
+        """Запомнить отрицательный ответ по ключу"""
+        self._entries[(kind, key)] = time.monotonic() + self.ttl
+        self._entries.move_to_end((kind, key))
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        metrics.negative_cache_stores.labels(kind=kind).inc()
+
+    def discard(self, kind: str, key: Hashable):
+        self._entries.pop((kind, key), None)
+
+
+# Общий кэш отрицательных ответов
+negative_cache = NegativeCache()
+
+
+def article_key(article: str) -> str:
+    """Ключ кэша для артикула: регистр и пробелы по краям не влияют на результат поиска"""
+    return article.strip().upper()
+
+
+def create_search_cache(name: str) -> TTLCache:
+    """Кэш результатов поиска по артикулу с настройками SEARCH_CACHE_*"""
+    return TTLCache(name, config.SEARCH_CACHE_TTL, config.SEARCH_CACHE_STALE_TTL, config.SEARCH_CACHE_SIZE)
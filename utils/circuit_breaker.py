@@ -0,0 +1,150 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from yarl import URL
+
+from config import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(aiohttp.ClientError):
+    """Запрос не выполнен: автомат для группы эндпоинтов разомкнут"""
+
+    def __init__(self, family: str):
+        super().__init__(f"Circuit breaker for {family} is open")
+        self.family = family
+
+
+class CircuitBreaker:
+    """
+    Автомат для группы эндпоинтов одного хоста.
+    closed - запросы проходят; после failure_threshold ошибок подряд автомат размыкается.
+    open - запросы сразу отклоняются в течение recovery_timeout секунд.
+    half_open - проходят не более half_open_max_calls пробных запросов:
+    успех замыкает автомат, ошибка снова размыкает его.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    # Значения метрики состояния
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, family: str, failure_threshold: int, recovery_timeout: float, half_open_max_calls: int):
+        self.family = family
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_calls = 0
+        metrics.circuit_state.labels(family=family).set(self.STATE_VALUES[self.CLOSED])
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние (open переходит в half_open по истечении recovery_timeout)"""
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self._set_state(self.HALF_OPEN)
+            self.trial_calls = 0
+        return self._state
+
+    def _set_state(self, state: str):
+        if state != self._state:
+            logger.warning(f"[CIRCUIT] {self.family}: {self._state} -> {state}")
+            self._state = state
+            metrics.circuit_state.labels(family=self.family).set(self.STATE_VALUES[state])
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос (в half_open занимает место пробного запроса)"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and self.trial_calls < self.half_open_max_calls:
+            self.trial_calls += 1
+            return True
+        metrics.circuit_rejected.labels(family=self.family).inc()
+        return False
+
+    def release(self):
+        """Запрос, получивший разрешение, не был выполнен (например, отменен)"""
+        if self._state == self.HALF_OPEN and self.trial_calls:
+            self.trial_calls -= 1
+
+    def record_success(self):
+        self.failures = 0
+        if self._state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.failures = 0
+            self._set_state(self.OPEN)
+
+    @property
+    def is_open(self) -> bool:
+        """Разомкнут ли автомат (без занятия места пробного запроса)"""
+        return self.state == self.OPEN
+
+
+class CircuitBreakerRegistry:
+    """Автоматы по группам эндпоинтов внешних площадок"""
+
+    # (хост, префикс пути, группа); первое совпадение определяет группу, иначе группа - хост
+    FAMILIES: List[Tuple[str, str, str]] = [
+        ('webapi.autodoc.ru', '/api/manufacturers/', 'autodoc_manufacturers'),
+        ('webapi.autodoc.ru', '/api/manufacturer/', 'autodoc_details'),
+        ('webapi.autodoc.ru', '/api/vehicles/', 'autodoc_vehicles'),
+        ('catalogoriginal.autodoc.ru', '/api/spareparts/', 'autodoc_details'),
+        ('catalogoriginal.autodoc.ru', '/api/catalogs/', 'autodoc_catalogs'),
+        ('avtoto.ru', '/search', 'avtoto_search'),
+        ('exist.ru', '/Price', 'exist_price'),
+    ]
+
+    def __init__(self,
+                 failure_threshold: int = None,
+                 recovery_timeout: float = None,
+                 half_open_max_calls: int = None):
+        self.failure_threshold = failure_threshold or config.CIRCUIT_FAILURE_THRESHOLD
+        self.recovery_timeout = recovery_timeout or config.CIRCUIT_RECOVERY_TIMEOUT
+        self.half_open_max_calls = half_open_max_calls or config.CIRCUIT_HALF_OPEN_MAX_CALLS
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get_family(self, url: URL) -> str:
+        """Группа эндпоинтов для URL запроса"""
+        for host, path_prefix, family in self.FAMILIES:
+            if url.host == host and url.path.startswith(path_prefix):
+                return family
+        return url.host or str(url)
+
+    def get(self, family: str) -> CircuitBreaker:
+        """Автомат группы эндпоинтов"""
+        breaker = self._breakers.get(family)
+        if breaker is None:
+            breaker = CircuitBreaker(family, self.failure_threshold, self.recovery_timeout, self.half_open_max_calls)
+            self._breakers[family] = breaker
+        return breaker
+
+    def get_for_url(self, url: URL) -> CircuitBreaker:
+        return self.get(self.get_family(url))
+
+    def is_open(self, family: Optional[str]) -> bool:
+        """Разомкнут ли автомат группы (неизвестная группа считается доступной)"""
+        breaker = self._breakers.get(family) if family else None
+        return breaker is not None and breaker.is_open
+
+    def get_stats(self) -> Dict[str, str]:
+        """Состояние всех автоматов"""
+        return {family: breaker.state for family, breaker in self._breakers.items()}
+
+
+# Общий набор автоматов
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar('K')
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+@dataclass
+class BatchStats:
+    """
+    Итог пакетной обработки: задачи, отмененные по таймауту или при закрытии генератора,
+    и задачи, не выполненные из-за ошибки (исключение или ошибка, о которой сообщил вызывающий)
+    """
+    cancelled: int = 0
+    failed: int = 0
+
+    @property
+    def complete(self) -> bool:
+        """Все задачи выполнены без ошибок"""
+        return not self.cancelled and not self.failed
+
+
+async def iter_bounded(func: Callable[[T], Awaitable[R]],
+                       items: Iterable[T],
+                       concurrency: int,
+                       timeout: Optional[float] = None,
+                       stats: Optional[BatchStats] = None) -> AsyncIterator[Tuple[int, R]]:
+    """
+    Параллельно выполняет func для каждого элемента, не более concurrency одновременно.
+    Отдает пары (индекс элемента, результат) по мере готовности.
+    По истечении timeout секунд (или при закрытии генератора) незавершенные задачи отменяются.
+    Задачи, завершившиеся исключением, логируются и пропускаются.
+    Число отмененных и завершившихся исключением задач учитывается в stats
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(index: int, item: T) -> Tuple[int, R]:
+        async with semaphore:
+            return index, await func(item)
+
+    tasks = [asyncio.create_task(run(index, item)) for index, item in enumerate(items)]
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                break
+
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=remaining,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.cancelled():
+                    if stats is not None:
+                        stats.cancelled += 1
+                    continue
+                error = task.exception()
+                if error is not None:
+                    logger.error(f"Batch task failed: {error}")
+                    if stats is not None:
+                        stats.failed += 1
+                    continue
+                yield task.result()
+
+        if pending:
+            logger.warning(f"Batch deadline reached, cancelling {len(pending)} of {len(tasks)} tasks")
+    finally:
+        if stats is not None:
+            stats.cancelled += len(pending)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_merged(sources: Dict[K, AsyncIterator[T]]) -> AsyncIterator[Tuple[K, T]]:
+    """
+    Параллельно читает несколько асинхронных генераторов.
+    Отдает пары (ключ источника, элемент) по мере готовности.
+    Ошибка источника логируется и завершает только этот источник.
+    При закрытии генератора незавершенные источники отменяются.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    finished = object()
+
+    async def pump(key: K, source: AsyncIterator[T]):
+        try:
+            async for item in source:
+                await queue.put((key, item))
+        except Exception as e:
+            logger.error(f"Source {key} failed: {e}", exc_info=True)
+        finally:
+            await queue.put((key, finished))
+
+    tasks = [asyncio.create_task(pump(key, source)) for key, source in sources.items()]
+    remaining = len(tasks)
+
+    try:
+        while remaining:
+            key, item = await queue.get()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield key, item
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Отмененные генераторы закрываются явно, чтобы их finally выполнились сразу
+        for source in sources.values():
+            await source.aclose()
@@ -0,0 +1,63 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+import aiohttp
+
+from config import config
+
+
+class Deadline:
+    """Момент, к которому операция должна завершиться"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        """Оставшееся время в секундах (не меньше нуля)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def allows(self, seconds: float) -> bool:
+        """Успеет ли операция длительностью seconds до дедлайна"""
+        return self.remaining() > seconds
+
+
+# Дедлайн текущего поиска. Задачи, созданные внутри, наследуют его вместе с контекстом
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Дедлайн текущего поиска (None - не ограничен)"""
+    return _current_deadline.get()
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    """Установка дедлайна для текущей задачи и создаваемых ею задач"""
+    return _current_deadline.set(deadline)
+
+
+def remaining_budget(default: Optional[float] = None) -> Optional[float]:
+    """Время на операцию с учетом дедлайна: не больше default и остатка бюджета"""
+    deadline = current_deadline()
+    if deadline is None:
+        return default
+    if default is None:
+        return deadline.remaining()
+    return min(default, deadline.remaining())
+
+
+def allows_wait(seconds: float) -> bool:
+    """Имеет ли смысл ждать seconds секунд перед повтором запроса"""
+    deadline = current_deadline()
+    return deadline is None or deadline.allows(seconds)
+
+
+def request_timeout() -> aiohttp.ClientTimeout:
+    """Таймаут одного HTTP запроса, не выходящий за дедлайн поиска"""
+    # Нулевой total в aiohttp означает отсутствие таймаута
+    return aiohttp.ClientTimeout(total=max(0.01, remaining_budget(config.HTTP_TIMEOUT)))
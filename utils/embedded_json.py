@@ -0,0 +1,148 @@
+import json
+import logging
+import re
+from typing import Any, Union
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+_ASSIGNMENT = re.compile(rb'\s*=?\s*')
+# Закрывающая скобка для открывающей скобки значения и признак конца скрипта
+_CLOSING = {ord('['): b']', ord('{'): b'}'}
+_SCRIPT_END = b'</script'
+
+# Размер куска при чтении тела ответа
+CHUNK_SIZE = 16 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class EmbeddedJsonScanner:
+    """
+    Потоковый поиск JSON, присвоенного переменной в скрипте страницы (например, `var _data = [...]`).
+    Присваивание и возможные концы значения (`];` или конец скрипта) ищутся поиском подстроки,
+    а конец подтверждается сканером json, учитывающим вложенность скобок и строки,
+    так что `];` внутри строк не обрывает значение.
+    Поиск идет по байтам: в UTF-8 (и однобайтовых кодировках) байты ASCII
+    не встречаются внутри многобайтовых символов.
+    """
+
+    def __init__(self, marker: str, encoding: str = 'utf-8'):
+        self.marker = marker.encode('ascii')
+        self.encoding = encoding
+        self.done = False
+        self.value: Any = None
+
+        self._buffer = bytearray()
+        self._found = False
+        self._terminator = b''
+        self._pos = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """Добавление очередного куска страницы. Возвращает True, когда значение прочитано целиком"""
+        if self.done:
+            return True
+        self._buffer += chunk
+
+        if not self._found and not self._find_start():
+            return False
+        return self._scan()
+
+    def _find_start(self) -> bool:
+        """Поиск `<marker> = [` или `<marker> = {` в буфере"""
+        buffer = self._buffer
+        while True:
+            index = buffer.find(self.marker, self._pos)
+            if index < 0:
+                # Хвост буфера может содержать начало маркера, остальное не нужно
+                keep = len(self.marker) - 1
+                if len(buffer) > keep:
+                    del buffer[:len(buffer) - keep]
+                self._pos = 0
+                return False
+
+            assignment = _ASSIGNMENT.match(buffer, index + len(self.marker))
+            value_start = assignment.end()
+            if value_start >= len(buffer):
+                # Присваивание обрывается на границе куска - ждем продолжения
+                del buffer[:index]
+                self._pos = 0
+                return False
+
+            if b'=' in assignment.group() and buffer[value_start] in _CLOSING:
+                # В буфере остается только значение
+                self._terminator = _CLOSING[buffer[value_start]] + b';'
+                del buffer[:value_start]
+                self._found = True
+                self._pos = 0
+                return True
+
+            # Совпадение с другим идентификатором (например, `_dataLayer`) - ищем дальше
+            self._pos = index + 1
+
+    def _scan(self) -> bool:
+        """Проверка новых возможных концов значения: `];` (`};`) или конца скрипта"""
+        buffer = self._buffer
+        while True:
+            end = buffer.find(self._terminator, self._pos)
+            if end >= 0:
+                end += 1
+            script_end = buffer.find(_SCRIPT_END, self._pos)
+            if script_end >= 0 and (end < 0 or script_end < end):
+                end = script_end
+            if end < 0:
+                # Терминатор может начинаться в конце буфера
+                self._pos = max(self._pos, len(buffer) - len(_SCRIPT_END))
+                return False
+            self._pos = end
+            if self._decode(end):
+                return True
+
+    def _decode(self, end: int) -> bool:
+        """Попытка разобрать значение, заканчивающееся перед end"""
+        try:
+            self.value, _ = _decoder.raw_decode(self._buffer[:end].decode(self.encoding))
+        except ValueError:
+            # Скобка оказалась внутри строки или вложенного значения
+            return False
+        self.done = True
+        self._buffer.clear()
+        return True
+
+    def finish(self) -> bool:
+        """Страница прочитана до конца: последняя попытка разобрать значение"""
+        if not self.done and self._found and self._buffer:
+            self._decode(len(self._buffer))
+        return self.done
+
+    def result(self) -> Any:
+        """Разобранное значение (None, если значение не найдено или не дочитано)"""
+        return self.value
+
+
+def extract_embedded_json(content: Union[str, bytes], marker: str) -> Any:
+    """Извлечение JSON, присвоенного переменной marker, из уже загруженной страницы"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    scanner = EmbeddedJsonScanner(marker)
+    if not scanner.feed(content):
+        scanner.finish()
+    return scanner.result()
+
+
+async def read_embedded_json(response: aiohttp.ClientResponse, marker: str,
+                             chunk_size: int = CHUNK_SIZE) -> Any:
+    """
+    Извлечение JSON из тела ответа по мере его загрузки.
+    Чтение прекращается, как только значение закрыто; остаток страницы не загружается
+    """
+    scanner = EmbeddedJsonScanner(marker, response.charset or 'utf-8')
+    received = 0
+    async for chunk in response.content.iter_chunked(chunk_size):
+        received += len(chunk)
+        if scanner.feed(chunk):
+            logger.debug(f"{marker} found after {received} bytes of {response.url}")
+            return scanner.result()
+    scanner.finish()
+    return scanner.result()
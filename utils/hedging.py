@@ -0,0 +1,90 @@
+import logging
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Скользящие перцентили времени ответа по группам эндпоинтов"""
+
+    def __init__(self, window: int = 200, min_samples: int = None):
+        self.window = window
+        self.min_samples = min_samples or config.HTTP_HEDGE_MIN_SAMPLES
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, family: str, seconds: float):
+        samples = self._samples.get(family)
+        if samples is None:
+            samples = deque(maxlen=self.window)
+            self._samples[family] = samples
+        samples.append(seconds)
+
+    def percentile(self, family: str, q: float = 0.9) -> Optional[float]:
+        """Перцентиль времени ответа (None, пока замеров меньше min_samples)"""
+        samples = self._samples.get(family)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class HedgeBudget:
+    """
+    Общее ограничение доли дублирующих запросов.
+    Каждый запрос, который можно дублировать, пополняет бюджет на max_ratio,
+    а каждый дубль расходует единицу, поэтому дублей не больше max_ratio от всех запросов
+    """
+
+    def __init__(self, max_ratio: float = None, burst: float = 10.0):
+        self.max_ratio = max_ratio if max_ratio is not None else config.HTTP_HEDGE_MAX_RATIO
+        self.burst = burst
+        self.tokens = 0.0
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.max_ratio)
+
+    def try_spend(self) -> bool:
+        """Можно ли отправить дубль (расходует единицу бюджета)"""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RequestHedger:
+    """
+    Решение о дублировании медленных GET запросов.
+    Если ответ не пришел за p90 времени ответа группы эндпоинтов, запрос
+    дублируется через другой прокси; число дублей ограничено общим бюджетом
+    """
+
+    def __init__(self, enabled: bool = None, min_delay: float = None,
+                 latency: Optional[LatencyTracker] = None, budget: Optional[HedgeBudget] = None):
+        self.enabled = enabled if enabled is not None else config.HTTP_HEDGE_ENABLED
+        self.min_delay = min_delay if min_delay is not None else config.HTTP_HEDGE_MIN_DELAY
+        self.latency = latency or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+
+    def record(self, family: str, seconds: float):
+        """Учет времени ответа группы эндпоинтов"""
+        self.latency.record(family, seconds)
+
+    def get_delay(self, family: str) -> Optional[float]:
+        """
+        Через сколько секунд дублировать запрос (None - не дублировать).
+        Вызывается один раз на запрос и пополняет бюджет дублей
+        """
+        if not self.enabled:
+            return None
+        self.budget.deposit()
+        p90 = self.latency.percentile(family)
+        if p90 is None:
+            return None
+        return max(self.min_delay, p90)
+
+    def try_hedge(self) -> bool:
+        return self.budget.try_spend()
+
@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp_proxy import ProxyConnector
+from yarl import URL
+
+from config import config
+from utils.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, circuit_breakers as default_circuit_breakers
+from utils.hedging import RequestHedger
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimiter, rate_limiter as default_rate_limiter
+from utils.proxy_manager import ProxyManager, proxy_manager as default_proxy_manager
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JsonResponse:
+    """Ответ JSON API: статус, разобранное тело (только для 200) и прокси, через который он получен"""
+    status: int
+    data: Any = None
+    proxy: Optional[str] = None
+
+
+class HttpClient:
+    """
+    Общий пул HTTP соединений для всех парсеров.
+    Для каждого хоста (и прокси) держится одна долгоживущая сессия со своим
+    коннектором: keep-alive, кэш DNS и собственный лимит соединений.
+    Каждый запрос через эти сессии проходит автомат своей группы эндпоинтов и общий
+    ограничитель частоты по хосту, а результаты запросов через прокси учитываются
+    в оценке здоровья прокси. Время ответов по группам эндпоинтов используется
+    для дублирования медленных GET запросов (см. fetch_json).
+    """
+
+    def __init__(self,
+                 limit: int = None,
+                 limit_per_host: int = None,
+                 host_limits: Dict[str, int] = None,
+                 keepalive_timeout: int = None,
+                 dns_cache_ttl: int = None,
+                 timeout: int = None,
+                 rate_limiter: Optional[RateLimiter] = None,
+                 proxy_manager: Optional[ProxyManager] = None,
+                 circuit_breakers: Optional[CircuitBreakerRegistry] = None,
+                 hedger: Optional[RequestHedger] = None):
+        self.limit = limit or config.HTTP_POOL_LIMIT
+        self.limit_per_host = limit_per_host or config.HTTP_POOL_LIMIT_PER_HOST
+        self.host_limits = host_limits if host_limits is not None else dict(config.HTTP_HOST_LIMITS)
+        self.keepalive_timeout = keepalive_timeout or config.HTTP_KEEPALIVE_TIMEOUT
+        self.dns_cache_ttl = dns_cache_ttl or config.HTTP_DNS_CACHE_TTL
+        self.timeout = aiohttp.ClientTimeout(total=timeout or config.HTTP_TIMEOUT)
+        self.rate_limiter = rate_limiter or default_rate_limiter
+        self.proxy_manager = proxy_manager or default_proxy_manager
+        self.circuit_breakers = circuit_breakers or default_circuit_breakers
+        self.hedger = hedger or RequestHedger()
+
+        self._sessions: Dict[Tuple[str, Optional[str]], aiohttp.ClientSession] = {}
+        self._isolated_sessions: List[aiohttp.ClientSession] = []
+
+    @staticmethod
+    def get_host(url: str) -> str:
+        """Получение хоста из URL (или сам хост, если передан он)"""
+        return urlsplit(url).hostname or url
+
+    def get_host_limit(self, host: str) -> int:
+        """Лимит одновременных соединений для хоста"""
+        return self.host_limits.get(host, self.limit_per_host)
+
+    def _create_trace_config(self, proxy: Optional[str] = None) -> aiohttp.TraceConfig:
+        """Хуки aiohttp, вызываемые для каждого запроса сессии (включая редиректы)"""
+        async def wait_for_limiter(trace_config_ctx, host: str):
+            # Ожидание токена ограничителя для хоста запроса. Оно идет внутри таймаута
+            # запроса, поэтому таймаут во время ожидания (например, backoff после 429)
+            # отмечается и не считается ошибкой площадки и прокси
+            trace_config_ctx.limiter_wait = True
+            await self.rate_limiter.acquire(host)
+            trace_config_ctx.limiter_wait = False
+
+        async def on_request_start(session, trace_config_ctx, params):
+            breaker = getattr(trace_config_ctx, 'breaker', None)
+            if breaker is not None:
+                # Хук вызывается и для каждого редиректа: разрешение автомата уже взято
+                # первым шагом и освобождается один раз по завершении запроса
+                await wait_for_limiter(trace_config_ctx, params.url.host)
+                trace_config_ctx.started_at = time.monotonic()
+                return
+            # Разомкнутый автомат отклоняет запрос сразу, не расходуя токены ограничителя
+            breaker = self.circuit_breakers.get_for_url(params.url)
+            if not breaker.allow_request():
+                raise CircuitOpenError(breaker.family)
+            try:
+                await wait_for_limiter(trace_config_ctx, params.url.host)
+            except BaseException:
+                breaker.release()
+                raise
+            # Автомат запоминается только после ожидания: если оно прервано, разрешение уже
+            # освобождено выше, и on_request_exception не должен освобождать его повторно
+            trace_config_ctx.breaker = breaker
+            trace_config_ctx.started_at = time.monotonic()
+
+        async def on_request_end(session, trace_config_ctx, params):
+            status = params.response.status
+            latency = time.monotonic() - trace_config_ctx.started_at
+            if status >= 500:
+                trace_config_ctx.breaker.record_failure()
+            else:
+                trace_config_ctx.breaker.record_success()
+                self.hedger.record(trace_config_ctx.breaker.family, latency)
+            if proxy:
+                self.proxy_manager.report(proxy, latency, status)
+
+        async def on_request_exception(session, trace_config_ctx, params):
+            breaker = getattr(trace_config_ctx, 'breaker', None)
+            if breaker is None:
+                # Запрос отклонен автоматом или прерван до отправки
+                return
+            # Отмена запроса вызывающим и таймаут в ожидании ограничителя
+            # не говорят о здоровье площадки и прокси
+            if isinstance(params.exception, asyncio.CancelledError) or getattr(trace_config_ctx, 'limiter_wait', False):
+                breaker.release()
+                return
+            breaker.record_failure()
+            if proxy:
+                started_at = getattr(trace_config_ctx, 'started_at', time.monotonic())
+                self.proxy_manager.report(proxy, time.monotonic() - started_at)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def choose_proxy(self, exclude=()) -> Optional[str]:
+        """Выбор наиболее здорового прокси (None - прямое соединение)"""
+        return self.proxy_manager.choose(exclude)
+
+    def backoff(self, url: str, delay: float):
+        """Приостановка всех запросов к хосту (например, после ответа 429)"""
+        self.rate_limiter.backoff(self.get_host(url), delay)
+
+    def _create_connector(self, host: str, proxy: Optional[str] = None) -> aiohttp.TCPConnector:
+        """Создание коннектора с пулом соединений для хоста"""
+        connector_kwargs = {
+            'limit': self.limit,
+            'limit_per_host': self.get_host_limit(host),
+            'ttl_dns_cache': self.dns_cache_ttl,
+            'keepalive_timeout': self.keepalive_timeout,
+            'enable_cleanup_closed': True,
+        }
+        if proxy:
+            return ProxyConnector.from_url(proxy, **connector_kwargs)
+        return aiohttp.TCPConnector(**connector_kwargs)
+
+    async def start(self):
+        """Открытие пулов для известных хостов"""
+        for host in self.host_limits:
+            await self.get_session(host)
+        logger.info(f"HTTP клиент запущен, открыто пулов: {len(self._sessions)}")
+
+    async def get_session(self, url: str, proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        """Получение общей сессии для хоста из URL (и прокси)"""
+        host = self.get_host(url)
+        key = (host, proxy)
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=self._create_connector(host, proxy),
+                timeout=self.timeout,
+                trace_configs=[self._create_trace_config(proxy)]
+            )
+            self._sessions[key] = session
+        return session
+
+    async def _fetch_json(self, method: str, url: str, proxy: Optional[str], **kwargs) -> JsonResponse:
+        """Один запрос через общую сессию хоста и прокси"""
+        session = await self.get_session(url, proxy)
+        async with session.request(method, url, **kwargs) as response:
+            data = await response.json() if response.status == 200 else None
+            return JsonResponse(response.status, data, proxy)
+
+    async def fetch_json(self, method: str, url: str, proxy: Optional[str] = None,
+                         hedge: bool = False, **kwargs) -> JsonResponse:
+        """
+        Запрос к JSON API через общую сессию.
+        С hedge=True GET, не получивший ответа за p90 своей группы эндпоинтов, дублируется
+        через другой прокси; возвращается первый полученный ответ, второй запрос отменяется
+        """
+        family = self.circuit_breakers.get_family(URL(url))
+        delay = self.hedger.get_delay(family) if hedge and method.upper() == 'GET' else None
+        if delay is None:
+            return await self._fetch_json(method, url, proxy, **kwargs)
+
+        primary = asyncio.create_task(self._fetch_json(method, url, proxy, **kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+
+            hedge_proxy = self.choose_proxy(exclude=[proxy] if proxy else ())
+            if hedge_proxy == proxy:
+                # Другого прокси нет - дубль пошел бы тем же путем
+                return await primary
+            if not self.hedger.try_hedge():
+                metrics.hedged_requests.labels(family=family, status='throttled').inc()
+                return await primary
+
+            metrics.hedged_requests.labels(family=family, status='fired').inc()
+            logger.debug(f"[HEDGE] {family}: no response after {delay:.2f}s, duplicating {url}")
+            secondary = asyncio.create_task(self._fetch_json(method, url, hedge_proxy, **kwargs))
+            try:
+                pending = {primary, secondary}
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is None:
+                            if task is secondary:
+                                metrics.hedged_requests.labels(family=family, status='won').inc()
+                            return task.result()
+                # Оба запроса завершились ошибкой - отдаем ошибку основного
+                return primary.result()
+            finally:
+                secondary.cancel()
+        finally:
+            primary.cancel()
+
+    async def create_isolated_session(self, url: str, proxy: Optional[str] = None) -> aiohttp.ClientSession:
+        """
+        Сессия со своими cookies поверх общего пула соединений хоста.
+        Закрывается вместе с клиентом, либо вызывающим раньше
+        """
+        pooled = await self.get_session(url, proxy)
+        session = aiohttp.ClientSession(
+            connector=pooled.connector,
+            connector_owner=False,
+            cookie_jar=aiohttp.CookieJar(),
+            timeout=self.timeout,
+            trace_configs=[self._create_trace_config(proxy)]
+        )
+        self._isolated_sessions = [s for s in self._isolated_sessions if not s.closed]
+        self._isolated_sessions.append(session)
+        return session
+
+    async def close(self):
+        """Закрытие всех сессий"""
+        for session in self._isolated_sessions:
+            if not session.closed:
+                await session.close()
+        self._isolated_sessions.clear()
+        
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        if sessions:
+            # Даем SSL соединениям корректно закрыться
+            await asyncio.sleep(0.25)
+        logger.info(f"HTTP клиент остановлен, закрыто пулов: {len(sessions)}")
+
+
+# Общий экземпляр клиента
+http_client = HttpClient()
@@ -50,6 +50,83 @@ class Metrics:
             buckets=(1.0, 5.0, 10.0, 30.0, 60.0)
         )
         self.parser_errors = Counter('bot_parser_errors_total', 'Number of parser errors', ['parser'])
+        self.parser_details = Counter(
+            'bot_parser_details_total',
+            'Number of part details fetched or skipped by parsers',
+            ['parser', 'status']
+        )
+        self.rate_limit_wait = Histogram(
+            'bot_rate_limit_wait_seconds',
+            'Time spent waiting for the per-host rate limiter',
+            ['host'],
+            buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 30.0)
+        )
+        self.singleflight_calls = Counter(
+            'bot_singleflight_calls_total',
+            'Calls executed or coalesced into an identical in-flight call',
+            ['group', 'key_type', 'status']
+        )
+        
+        # Метрики кэшей
+        self.cache_requests = Counter(
+            'bot_cache_requests_total',
+            'Cache lookups by result (hit - fresh, stale - served while refreshing, miss; disk_hit/disk_miss - second level)',
+            ['cache', 'result']
+        )
+        self.negative_cache_hits = Counter(
+            'bot_negative_cache_hits_total',
+            'Requests answered from the negative cache without touching the network',
+            ['kind']
+        )
+        self.negative_cache_stores = Counter(
+            'bot_negative_cache_stores_total',
+            'Negative upstream answers remembered in the negative cache',
+            ['kind']
+        )
+        self.cache_size = Gauge('bot_cache_entries', 'Number of entries in cache', ['cache'])
+        self.cache_refreshes = Counter(
+            'bot_cache_refreshes_total',
+            'Background refreshes of stale cache entries',
+            ['cache', 'status']
+        )
+        self.prefetch_requests = Counter(
+            'bot_prefetch_requests_total',
+            'Background prefetches by outcome (fetched, error, dropped - queue full, throttled - no spare capacity)',
+            ['kind', 'status']
+        )
+        self.prefetch_hits = Counter(
+            'bot_prefetch_hits_total',
+            'User requests for prefetchable data (hit - prefetched, pending - prefetch in flight, miss - not prefetched)',
+            ['kind', 'result']
+        )
+        self.object_store_puts = Counter(
+            'bot_object_store_puts_total',
+            'Objects saved to the FSM object store (new - stored, shared - already stored under the same source key)',
+            ['result']
+        )
+        
+        # Метрики прокси
+        self.proxy_requests = Counter('bot_proxy_requests_total', 'Requests through proxy by outcome', ['proxy', 'status'])
+        self.proxy_latency = Gauge('bot_proxy_latency_seconds', 'Smoothed proxy response latency', ['proxy'])
+        self.proxy_error_rate = Gauge('bot_proxy_error_rate', 'Smoothed proxy error rate', ['proxy'])
+        self.proxy_ejected = Gauge('bot_proxy_ejected', 'Whether the proxy is currently ejected', ['proxy'])
+
+        # Метрики автоматов внешних площадок
+        self.circuit_state = Gauge(
+            'bot_circuit_breaker_state',
+            'Circuit breaker state per endpoint family (0 - closed, 1 - half-open, 2 - open)',
+            ['family']
+        )
+        self.circuit_rejected = Counter(
+            'bot_circuit_breaker_rejected_total',
+            'Requests rejected by an open circuit breaker',
+            ['family']
+        )
+        self.hedged_requests = Counter(
+            'bot_http_hedged_requests_total',
+            'Slow GET requests duplicated through another proxy by outcome',
+            ['family', 'status']
+        )
 
     async def update_db_metrics(self, db_session):
         """Обновление метрик базы данных"""
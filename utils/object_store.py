@@ -0,0 +1,83 @@
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from config import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Значение get для вытесненного или неизвестного дескриптора (отличается от сохраненного None)
+EXPIRED = object()
+
+
+class ObjectStore:
+    """
+    Общее хранилище крупных данных состояний FSM (результаты подбора, модификации,
+    деревья запчастей). В состоянии пользователя лежит только короткий дескриптор,
+    поэтому чтение и запись состояния не зависят от размера данных. Дескриптор выдается
+    без сериализации данных; если известен ключ источника данных (например, ключ кэша
+    каталога), одинаковые данные разных пользователей хранятся один раз.
+    None в хранилище не попадает и хранится в состоянии как есть.
+    Сохраненные объекты не изменяются. При превышении max_size вытесняются объекты,
+    к которым дольше всего не обращались - get вернет значение по умолчанию
+    """
+
+    PREFIX = 'obj:'
+
+    def __init__(self, max_size: int = None, name: str = 'fsm_objects'):
+        self.max_size = max_size or config.FSM_OBJECT_STORE_SIZE
+        self.name = name
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        # ключ источника -> дескриптор и обратно (для очистки при вытеснении)
+        self._handles: Dict[Hashable, str] = {}
+        self._keys: Dict[str, Hashable] = {}
+
+    def put(self, value: Any, key: Optional[Hashable] = None) -> Any:
+        """
+        Сохранение объекта, возвращает дескриптор для состояния FSM (None сохраняется как есть).
+        key - ключ, однозначно определяющий содержимое: по нему данные не сохраняются повторно
+        """
+        if value is None:
+            return None
+        if key is not None:
+            handle = self._handles.get(key)
+            if handle is not None and handle in self._entries:
+                self._entries.move_to_end(handle)
+                metrics.object_store_puts.labels(result='shared').inc()
+                return handle
+
+        handle = self.PREFIX + uuid.uuid4().hex
+        self._entries[handle] = value
+        if key is not None:
+            self._handles[key] = handle
+            self._keys[handle] = key
+        metrics.object_store_puts.labels(result='new').inc()
+        while len(self._entries) > self.max_size:
+            evicted, _ = self._entries.popitem(last=False)
+            evicted_key = self._keys.pop(evicted, None)
+            if evicted_key is not None and self._handles.get(evicted_key) == evicted:
+                del self._handles[evicted_key]
+        metrics.cache_size.labels(cache=self.name).set(len(self._entries))
+        return handle
+
+    def get(self, ref: Any, default: Any = EXPIRED) -> Any:
+        """
+        Объект по значению из состояния FSM: по дескриптору - из хранилища (default, если
+        объект вытеснен), иначе само значение (None, сохраненный как есть)
+        """
+        if not (isinstance(ref, str) and ref.startswith(self.PREFIX)):
+            return ref
+        value = self._entries.get(ref, EXPIRED)
+        if value is EXPIRED:
+            metrics.cache_requests.labels(cache=self.name, result='miss').inc()
+            logger.info(f"[FSM] Object {ref} expired from store")
+            return default
+        self._entries.move_to_end(ref)
+        metrics.cache_requests.labels(cache=self.name, result='hit').inc()
+        return value
+
+
+# Общее хранилище крупных данных состояний FSM
+object_store = ObjectStore()
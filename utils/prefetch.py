@@ -0,0 +1,110 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from yarl import URL
+
+from config import config
+from utils.circuit_breaker import CircuitBreakerRegistry, circuit_breakers as default_circuit_breakers
+from utils.deadline import set_deadline
+from utils.metrics import metrics
+from utils.rate_limiter import RateLimiter, rate_limiter as default_rate_limiter
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """
+    Общая очередь фоновой предзагрузки.
+    Одновременно выполняется не больше concurrency загрузок, в очереди - не больше max_pending
+    (лишние отбрасываются), загрузка одного ключа не ставится повторно, пока не завершилась.
+    Запрос выполняется, только если у хоста свободно больше rate_reserve токенов rate limiter
+    и автомат группы эндпоинтов не разомкнут - предзагрузка не отнимает пропускную
+    способность у запросов пользователей
+    """
+
+    def __init__(self, enabled: bool = None, concurrency: int = None, max_pending: int = None,
+                 rate_reserve: float = None, limiter: Optional[RateLimiter] = None,
+                 breakers: Optional[CircuitBreakerRegistry] = None, history_size: int = 5000):
+        self.enabled = enabled if enabled is not None else config.PREFETCH_ENABLED
+        self.max_pending = max_pending or config.PREFETCH_MAX_PENDING
+        self.rate_reserve = rate_reserve if rate_reserve is not None else config.PREFETCH_RATE_RESERVE
+        self.limiter = limiter or default_rate_limiter
+        self.breakers = breakers or default_circuit_breakers
+        self._semaphore = asyncio.Semaphore(concurrency or config.PREFETCH_CONCURRENCY)
+        self._pending: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        # Загруженные заранее ключи, к которым пользователи еще не обращались
+        self.history_size = history_size
+        self._fetched: 'OrderedDict[Tuple[str, Hashable], None]' = OrderedDict()
+
+    def submit(self, kind: str, key: Hashable, loader: Callable[[], Awaitable[Any]], url: str = None) -> bool:
+        """
+        Постановка загрузки в очередь. url - адрес запроса, по которому проверяется
+        запас rate limiter и состояние автомата. Возвращает, поставлена ли загрузка
+        """
+        if not self.enabled:
+            return False
+        pending_key = (kind, key)
+        if pending_key in self._pending:
+            return False
+        if len(self._pending) >= self.max_pending:
+            metrics.prefetch_requests.labels(kind=kind, status='dropped').inc()
+            return False
+
+        task = asyncio.create_task(self._run(kind, key, loader, url))
+        self._pending[pending_key] = task
+        task.add_done_callback(lambda _: self._pending.pop(pending_key, None))
+        return True
+
+    def _has_capacity(self, url: Optional[str]) -> bool:
+        if url is None:
+            return True
+        parsed = URL(url)
+        if self.breakers.is_open(self.breakers.get_family(parsed)):
+            return False
+        return self.limiter.available(parsed.host) > self.rate_reserve
+
+    async def _run(self, kind: str, key: Hashable, loader: Callable[[], Awaitable[Any]], url: Optional[str]):
+        # Предзагрузка не ограничена дедлайном запроса пользователя, который ее запустил
+        set_deadline(None)
+        async with self._semaphore:
+            if not self._has_capacity(url):
+                metrics.prefetch_requests.labels(kind=kind, status='throttled').inc()
+                return
+            try:
+                await loader()
+                metrics.prefetch_requests.labels(kind=kind, status='fetched').inc()
+                self._fetched[(kind, key)] = None
+                self._fetched.move_to_end((kind, key))
+                while len(self._fetched) > self.history_size:
+                    self._fetched.popitem(last=False)
+            except Exception as e:
+                metrics.prefetch_requests.labels(kind=kind, status='error').inc()
+                logger.debug(f"[PREFETCH] {kind} {key} failed: {e}")
+
+    def record_use(self, kind: str, key: Hashable, cached: bool):
+        """
+        Учет обращения пользователя к данным, которые могли быть загружены заранее.
+        cached - есть ли данные в кэше в момент обращения
+        """
+        pending_key = (kind, key)
+        if pending_key in self._pending:
+            result = 'pending'
+        elif pending_key in self._fetched and cached:
+            result = 'hit'
+        else:
+            result = 'miss'
+        self._fetched.pop(pending_key, None)
+        metrics.prefetch_hits.labels(kind=kind, result=result).inc()
+
+    async def close(self):
+        """Отмена незавершенных загрузок"""
+        tasks = list(self._pending.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Общая очередь предзагрузки
+prefetcher = Prefetcher()
@@ -0,0 +1,176 @@
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from config import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ProxyStats:
+    """Состояние здоровья прокси"""
+    url: str
+    label: str
+    latency: float = 1.0  # скользящее среднее времени ответа, сек
+    error_rate: float = 0.0  # скользящая доля ошибок
+    requests: int = 0
+    errors: int = 0
+    rate_limited: int = 0
+    consecutive_failures: int = 0
+    ejections: int = 0
+    ejected_until: float = 0.0
+    probing: bool = False
+    probe_started: float = 0.0
+
+    @property
+    def weight(self) -> float:
+        """Вес при выборе: быстрые и стабильные прокси выбираются чаще"""
+        return (1 - self.error_rate) ** 2 / (self.latency + 0.1) + 0.001
+
+
+class ProxyManager:
+    """
+    Общий пул прокси с оценкой здоровья.
+    Список загружается один раз. Прокси выбирается взвешенно по задержке и доле ошибок;
+    после серии неудач прокси исключается на время, затем получает одну пробную попытку.
+    """
+
+    # Коэффициент сглаживания скользящих средних
+    ALPHA = 0.2
+
+    def __init__(self,
+                 proxy_file: str = None,
+                 failure_threshold: int = None,
+                 error_rate_threshold: float = None,
+                 eject_seconds: int = None,
+                 max_eject_seconds: int = None):
+        self.proxy_file = proxy_file or config.PROXY_FILE
+        self.failure_threshold = failure_threshold or config.PROXY_FAILURE_THRESHOLD
+        self.error_rate_threshold = error_rate_threshold or config.PROXY_ERROR_RATE_THRESHOLD
+        self.eject_seconds = eject_seconds or config.PROXY_EJECT_SECONDS
+        self.max_eject_seconds = max_eject_seconds or config.PROXY_MAX_EJECT_SECONDS
+        # Пробная попытка, не получившая ответа за это время, считается потерянной
+        self.probe_timeout = config.HTTP_TIMEOUT
+        self.proxies: Dict[str, ProxyStats] = {
+            url: ProxyStats(url=url, label=self._make_label(url))
+            for url in self._load_proxies()
+        }
+
+    def _load_proxies(self) -> List[str]:
+        """Загрузка списка прокси из файла"""
+        proxies = []
+        try:
+            if os.path.exists(self.proxy_file):
+                with open(self.proxy_file, 'r') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#'):
+                            proxies.append(line)
+            logger.info(f"Загружено {len(proxies)} прокси серверов")
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке прокси: {e}")
+        return proxies
+
+    @staticmethod
+    def _make_label(url: str) -> str:
+        """Метка прокси для метрик и логов (без логина и пароля)"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.hostname}:{parts.port}" if parts.hostname else url
+
+    def choose(self, exclude: Iterable[str] = ()) -> Optional[str]:
+        """Выбор прокси для запроса (None - прямое соединение, если прокси нет)"""
+        if not self.proxies:
+            return None
+
+        now = time.monotonic()
+        excluded = set(exclude)
+        candidates = [
+            stats for url, stats in self.proxies.items()
+            if url not in excluded
+            and stats.ejected_until <= now
+            and not (stats.probing and now - stats.probe_started < self.probe_timeout)
+        ]
+        if not candidates:
+            # Все прокси исключены - берем тот, что освободится раньше всех
+            candidates = [min(self.proxies.values(), key=lambda stats: stats.ejected_until)]
+
+        stats = random.choices(candidates, weights=[stats.weight for stats in candidates])[0]
+        if stats.ejections and stats.ejected_until <= now:
+            # Исключенный ранее прокси получает одну пробную попытку
+            stats.probing = True
+            stats.probe_started = now
+        return stats.url
+
+    def report(self, proxy: Optional[str], latency: float, status: Optional[int] = None):
+        """Учет результата запроса через прокси (status=None - сетевая ошибка)"""
+        stats = self.proxies.get(proxy)
+        if stats is None:
+            return
+
+        failed = status is None or status == 403 or status >= 500
+        rate_limited = status == 429
+
+        stats.requests += 1
+        stats.latency += self.ALPHA * (latency - stats.latency)
+        stats.error_rate += self.ALPHA * ((1.0 if failed or rate_limited else 0.0) - stats.error_rate)
+        if rate_limited:
+            stats.rate_limited += 1
+        if failed:
+            stats.errors += 1
+            stats.consecutive_failures += 1
+        else:
+            stats.consecutive_failures = 0
+
+        outcome = 'error' if failed else 'rate_limited' if rate_limited else 'ok'
+        metrics.proxy_requests.labels(proxy=stats.label, status=outcome).inc()
+        metrics.proxy_latency.labels(proxy=stats.label).set(stats.latency)
+        metrics.proxy_error_rate.labels(proxy=stats.label).set(stats.error_rate)
+
+        if stats.probing:
+            stats.probing = False
+            if failed:
+                self._eject(stats)
+            else:
+                logger.info(f"[PROXY] {stats.label} recovered after probe")
+                stats.ejections = 0
+                stats.error_rate = 0.0
+                metrics.proxy_ejected.labels(proxy=stats.label).set(0)
+        elif (stats.consecutive_failures >= self.failure_threshold
+              or (stats.requests >= self.failure_threshold and stats.error_rate >= self.error_rate_threshold)):
+            self._eject(stats)
+
+    def _eject(self, stats: ProxyStats):
+        """Исключение прокси с растущим временем паузы"""
+        duration = min(self.eject_seconds * 2 ** stats.ejections, self.max_eject_seconds)
+        stats.ejections += 1
+        stats.consecutive_failures = 0
+        stats.ejected_until = time.monotonic() + duration
+        metrics.proxy_ejected.labels(proxy=stats.label).set(1)
+        logger.warning(f"[PROXY] {stats.label} ejected for {duration} seconds "
+                       f"(error rate {stats.error_rate:.2f}, latency {stats.latency:.2f}s)")
+
+    def get_stats(self) -> List[Dict]:
+        """Текущее состояние прокси"""
+        now = time.monotonic()
+        return [
+            {
+                'proxy': stats.label,
+                'latency': round(stats.latency, 3),
+                'error_rate': round(stats.error_rate, 3),
+                'requests': stats.requests,
+                'errors': stats.errors,
+                'rate_limited': stats.rate_limited,
+                'ejected': stats.ejected_until > now,
+            }
+            for stats in self.proxies.values()
+        ]
+
+
+# Общий экземпляр менеджера прокси
+proxy_manager = ProxyManager()
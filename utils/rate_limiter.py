@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Tuple
+
+from config import config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket: не более rate запросов в секунду с допустимым всплеском burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        # Во время паузы после backoff токены не накапливаются
+        elapsed = now - max(self.updated_at, self.blocked_until)
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """Ожидание свободного токена. Возвращает время ожидания в секундах"""
+        waited = 0.0
+        # Блокировка сохраняет порядок ожидающих (FIFO)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def available(self) -> float:
+        """Доля свободных токенов (0 - запросы сейчас будут ждать)"""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return 0.0
+        return self.tokens / self.burst
+
+    def backoff(self, delay: float):
+        """Приостановка выдачи токенов (например, после ответа 429)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        self.tokens = 0
+
+
+class RateLimiter:
+    """Общий ограничитель частоты запросов по хостам"""
+
+    def __init__(self,
+                 default_rate: float = None,
+                 default_burst: int = None,
+                 host_limits: Dict[str, Tuple[float, int]] = None):
+        self.default_rate = default_rate or config.RATE_LIMIT_DEFAULT_RATE
+        self.default_burst = default_burst or config.RATE_LIMIT_DEFAULT_BURST
+        self.host_limits = host_limits if host_limits is not None else dict(config.RATE_LIMIT_HOSTS)
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def get_bucket(self, host: str) -> TokenBucket:
+        """Получение bucket для хоста"""
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            rate, burst = self.host_limits.get(host, (self.default_rate, self.default_burst))
+            bucket = TokenBucket(rate, burst)
+            self._buckets[host] = bucket
+        return bucket
+
+    async def acquire(self, host: str):
+        """Ожидание разрешения на запрос к хосту"""
+        waited = await self.get_bucket(host).acquire()
+        metrics.rate_limit_wait.labels(host=host).observe(waited)
+        if waited > 1:
+            logger.info(f"[RATE LIMIT] Waited {waited:.2f}s for {host}")
+
+    def available(self, host: str) -> float:
+        """Доля свободных токенов хоста"""
+        return self.get_bucket(host).available()
+
+    def backoff(self, host: str, delay: float):
+        """Приостановка запросов к хосту для всех парсеров"""
+        logger.warning(f"[RATE LIMIT] Backing off {host} for {delay} seconds")
+        self.get_bucket(host).backoff(delay)
+
+
+# Общий экземпляр ограничителя
+rate_limiter = RateLimiter()
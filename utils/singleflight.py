@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar('R')
+
+
+class SharedStream(Generic[R]):
+    """
+    Асинхронный генератор, который читают несколько потребителей.
+    Генератор выполняется в отдельной задаче; каждый потребитель получает все элементы
+    с начала, включая выданные до его подключения
+    """
+
+    def __init__(self, source: AsyncIterator[R]):
+        self.items: List[R] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[R]):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        # Ожидающие держат ссылку на старое событие, новые ждут следующего
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def __aiter__(self) -> AsyncIterator[R]:
+        index = 0
+        while True:
+            if index < len(self.items):
+                item = self.items[index]
+                index += 1
+                yield item
+                continue
+            if self.done:
+                break
+            await self._changed.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """
+    Объединение одинаковых одновременных вызовов.
+    Пока вызов по ключу выполняется, остальные вызовы с тем же ключом ждут его результат,
+    а не запускают свой. Отмена одного из ожидающих не отменяет общий вызов.
+    """
+
+    def __init__(self, name: str, stats_size: int = 1000):
+        self.name = name
+        self.stats_size = stats_size
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._streams: Dict[Hashable, SharedStream] = {}
+        # Число сэкономленных вызовов по ключам (последние stats_size ключей)
+        self._saved: 'OrderedDict[Hashable, int]' = OrderedDict()
+
+    def _record(self, key: Hashable, label: str, coalesced: bool):
+        status = 'coalesced' if coalesced else 'executed'
+        metrics.singleflight_calls.labels(group=self.name, key_type=label, status=status).inc()
+        if not coalesced:
+            return
+        saved = self._saved.pop(key, 0) + 1
+        self._saved[key] = saved
+        if len(self._saved) > self.stats_size:
+            self._saved.popitem(last=False)
+        logger.info(f"[SINGLEFLIGHT] {self.name} {key}: joined in-flight call ({saved} saved)")
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[R]], label: str = '') -> R:
+        """Выполнить func или присоединиться к уже выполняющемуся вызову с тем же ключом"""
+        task = self._calls.get(key)
+        self._record(key, label, coalesced=task is not None)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def stream(self, key: Hashable, func: Callable[[], AsyncIterator[R]], label: str = '') -> AsyncIterator[R]:
+        """Читать генератор func или присоединиться к уже читаемому генератору с тем же ключом"""
+        shared = self._streams.get(key)
+        self._record(key, label, coalesced=shared is not None)
+        if shared is None:
+            shared = SharedStream(func())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._streams.pop(key, None))
+        async for item in shared:
+            yield item
+
+    def in_flight(self) -> int:
+        """Число выполняющихся вызовов"""
+        return len(self._calls) + len(self._streams)
+
+    def get_stats(self, limit: int = 20) -> List[Tuple[Hashable, int]]:
+        """Ключи с наибольшим числом сэкономленных вызовов"""
+        return sorted(self._saved.items(), key=lambda item: item[1], reverse=True)[:limit]